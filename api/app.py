@@ -1,27 +1,135 @@
 import os
-import base64
 import json
+import time
+import asyncio
+import hashlib
+import tempfile
 import http.cookiejar
 import subprocess
 import shlex
+import numpy as np
+from contextlib import asynccontextmanager
 from pathlib import Path
-from fastapi import FastAPI, HTTPException, UploadFile, File
-from fastapi.staticfiles import StaticFiles
+from typing import Optional, Union
+from fastapi import FastAPI, HTTPException, UploadFile, File, BackgroundTasks, Request
 from pydantic import BaseModel
-from fastapi.responses import FileResponse
-from scripts.download import baixar_reel
-from scripts.edit import adicionar_musica
+from fastapi.responses import JSONResponse, Response
+from starlette.concurrency import run_in_threadpool
+from api.streaming import STREAM_POLL_INTERVAL, resposta_arquivo, resposta_base64, resposta_eventos_job, resposta_progressiva
+from scripts.armazenamento import GerenciadorArmazenamento
+from scripts.catalog import MusicCatalog
+from scripts.download import DownloadCache, pool_ytdlp
+from scripts.fluxo import SaidaProgressiva
+from scripts.forma_onda import CacheFormaDeOnda
+from scripts.jobs import JobManager, JOB_LOCAL_WORKERS
+from scripts.metricas import REGISTRO, CONTENT_TYPE, coletar_tempos, registrar_subprocesso
+from scripts.pcm_cache import PcmCache
+from scripts.perfil_adaptativo import SeletorPerfil
+from scripts.probe import sondar
+from scripts.processos import (
+    Cancelado, Cancelamento, TempoEsgotado, cancelavel, encerrar_grupo, executar_async, iniciar_async, timeout_etapa
+)
+from scripts.pipeline import executar_pipeline, executar_lote
+from scripts.render_cache import RenderCache
+from scripts.ritmo import IndiceRitmo, SemBatidas, interpretar_impacto
 
-app = FastAPI(title="FALA Editor API")
+
+
+@asynccontextmanager
+async def _ciclo_de_vida(app: FastAPI):
+    """
+    Startup e shutdown da API. Os serviços usados aqui (armazenamento, jobs,
+    pool_ytdlp) são criados mais abaixo neste módulo; nada roda na importação.
+    """
+    armazenamento.iniciar()
+    if JOB_LOCAL_WORKERS:
+        jobs.iniciar()
+    try:
+        yield
+    finally:
+        # Como o api/worker.py: espera os jobs em execução (o lease segue renovado
+        # até o fim); os enfileirados ficam para o próximo worker
+        await run_in_threadpool(jobs.encerrar, True)
+        armazenamento.parar()
+        pool_ytdlp.fechar()
+
+
+app = FastAPI(title="FALA Editor API", lifespan=_ciclo_de_vida)
 
 SESSION_FILE_PATH = "cookies/session.netscape"
 
+# Upload de músicas: limite de tamanho e tamanho dos blocos lidos
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(100 * 1024 * 1024)))
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+class LimiteUploadMiddleware:
+    """
+    Aborta cedo corpos acima do limite em uma rota de upload, antes de o
+    multipart ser todo recebido:
+    - com Content-Length, rejeita (413) sem ler o corpo;
+    - sem Content-Length (chunked), conta os bytes conforme chegam e
+      responde 413 assim que o limite é ultrapassado.
+    """
+
+    def __init__(self, app, caminho: str, max_bytes: int):
+        self.app = app
+        self.caminho = caminho
+        self.max_bytes = max_bytes
+
+    async def _rejeitar(self, send):
+        resposta = JSONResponse(
+            status_code=413,
+            content={"detail": f"Arquivo muito grande. Máximo: {self.max_bytes // (1024 * 1024)}MB"}
+        )
+        await resposta({"type": "http"}, None, send)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] != self.caminho:
+            await self.app(scope, receive, send)
+            return
+
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length and content_length.isdigit() and int(content_length) > self.max_bytes:
+            await self._rejeitar(send)
+            return
+
+        recebido = 0
+        excedeu = False
+
+        async def receive_limitado():
+            nonlocal recebido, excedeu
+            if excedeu:
+                return {"type": "http.disconnect"}
+            mensagem = await receive()
+            if mensagem["type"] == "http.request":
+                recebido += len(mensagem.get("body", b""))
+                if recebido > self.max_bytes:
+                    excedeu = True
+                    await self._rejeitar(send)
+                    return {"type": "http.disconnect"}
+            return mensagem
+
+        async def send_protegido(mensagem):
+            # Depois do 413, descarta a resposta que a aplicação tentar enviar
+            if not excedeu:
+                await send(mensagem)
+
+        try:
+            await self.app(scope, receive_limitado, send_protegido)
+        except Exception:
+            if not excedeu:
+                raise
+
+
+# Margem para cabeçalhos do multipart e demais campos do formulário
+app.add_middleware(LimiteUploadMiddleware, caminho="/upload-music", max_bytes=MAX_UPLOAD_BYTES + UPLOAD_CHUNK_SIZE)
+
 os.makedirs("processed", exist_ok=True)
 os.makedirs("videos", exist_ok=True)
 os.makedirs("cookies", exist_ok=True)
 os.makedirs("music", exist_ok=True)
 
-app.mount("/videos", StaticFiles(directory="processed"), name="videos")
 
 
 class UpdateSessionRequest(BaseModel):
@@ -31,57 +139,157 @@ class UpdateSessionRequest(BaseModel):
 class EditRequest(BaseModel):
     url: str
     music: str
-    impact_music: float
+    # Segundos na música, "auto" (impacto detectado) ou "beat:X" (batida mais próxima de X)
+    impact_music: Union[float, str]
     impact_video: float
+    # url, base64, path, file ou stream (MP4 fragmentado entregue durante o render)
     return_format: str = "url"
+    # Perfil de encode (preview, standard, archival); omitido ou "auto" = escolha do servidor
+    encoder_profile: Optional[str] = None
 
 
-def _validar_audio_com_ffprobe(arquivo_path: str) -> dict:
+class BatchVariant(BaseModel):
+    music: str
+    impact_music: Union[float, str]
+    impact_video: float
+
+
+class BatchEditRequest(BaseModel):
+    url: str
+    variants: list[BatchVariant]
+    encoder_profile: Optional[str] = None
+
+
+# Limite de variantes por lote
+MAX_BATCH_VARIANTS = int(os.getenv("MAX_BATCH_VARIANTS", "20"))
+
+# Cache HTTP dos picos da forma de onda (s); o ETag muda quando a música muda
+WAVEFORM_MAX_AGE = int(os.getenv("WAVEFORM_MAX_AGE", "3600"))
+# Máximo de picos por pedido de forma de onda
+WAVEFORM_MAX_WIDTH = 20000
+
+
+def _cmd_converter_mp3(entrada: str, saida: str) -> list:
+    """Conversão para o MP3 padrão do sistema (entrada pode ser um arquivo ou pipe:0)."""
+    return [
+        "ffmpeg", "-y", "-v", "error", "-i", entrada,
+        "-map", "0:a:0",
+        "-acodec", "libmp3lame", "-b:a", "192k",
+        "-ar", "48000", "-ac", "2",
+        "-f", "mp3", saida
+    ]
+
+
+def _validar_audio_com_ffprobe(arquivo_path: str, memorizar: bool = True) -> dict:
     """
-    Valida um arquivo de áudio usando ffprobe (seguindo padrão do sistema).
+    Valida um arquivo de áudio usando ffprobe (via scripts.probe, com cache).
     Retorna informações do arquivo ou levanta exceção se inválido.
     """
-    cmd = [
-        "ffprobe", "-v", "error",
-        "-show_entries", "format=duration,format_name",
-        "-show_entries", "stream=codec_name,codec_type",
-        "-of", "json",
-        arquivo_path
-    ]
-    
     try:
-        proc = subprocess.run(cmd, capture_output=True, text=True, timeout=10)
-        if proc.returncode != 0:
-            raise RuntimeError(f"ffprobe falhou: {proc.stderr}")
-        
-        data = json.loads(proc.stdout)
-        
-        # Verifica se tem stream de áudio
-        streams = data.get("streams", [])
-        audio_streams = [s for s in streams if s.get("codec_type") == "audio"]
-        
-        if not audio_streams:
-            raise ValueError("Arquivo não contém stream de áudio válido")
-        
-        format_info = data.get("format", {})
-        duration = float(format_info.get("duration", 0))
-        
-        if duration <= 0:
-            raise ValueError("Arquivo de áudio tem duração inválida ou zero")
-        
-        return {
-            "duration": duration,
-            "format": format_info.get("format_name", "unknown"),
-            "codec": audio_streams[0].get("codec_name", "unknown"),
-            "valid": True
-        }
-    except json.JSONDecodeError as e:
-        raise ValueError(f"Erro ao processar resposta do ffprobe: {e}")
-    except subprocess.TimeoutExpired:
-        raise ValueError("Timeout ao validar arquivo de áudio")
+        info = sondar(arquivo_path, memorizar=memorizar, timeout=10)
     except Exception as e:
         raise ValueError(f"Erro ao validar áudio: {str(e)}")
 
+    if info["audio"] is None:
+        raise ValueError("Arquivo não contém stream de áudio válido")
+    if not info["duration"] or info["duration"] <= 0:
+        raise ValueError("Arquivo de áudio tem duração inválida ou zero")
+
+    return {
+        "duration": info["duration"],
+        "format": info["format_name"] or "unknown",
+        "codec": info["audio"]["codec_name"] or "unknown",
+        "sample_rate": info["audio"]["sample_rate"],
+        "valid": True
+    }
+
+
+catalogo = MusicCatalog("music", probe=_validar_audio_com_ffprobe)
+pcm_cache = PcmCache()
+download_cache = DownloadCache()
+render_cache = RenderCache("processed", hash_musica=catalogo.hash_atual)
+# Com o cache PCM desativado, as análises decodificam para arrays transitórios
+indice_ritmo = IndiceRitmo(catalogo.db_path, carregar_pcm=pcm_cache.carregar, hash_musica=catalogo.hash_atual)
+forma_onda = CacheFormaDeOnda(carregar_pcm=pcm_cache.carregar)
+armazenamento = GerenciadorArmazenamento()
+
+REGISTRO.medidor(
+    "clip_storage_bytes", "Bytes em disco de cada diretório de mídia", ("directory",),
+    funcao=lambda: {(d,): u["bytes"] for d, u in armazenamento.uso()["directories"].items()}
+)
+# A fila de jobs é criada mais abaixo; a profundidade é lida a cada escolha
+seletor_perfil = SeletorPerfil(profundidade=lambda: jobs.profundidade())
+
+
+def _escolher_perfil(pedido: Optional[str]) -> dict:
+    """Perfil de encode do pedido (ver SeletorPerfil); perfil desconhecido vira 400."""
+    try:
+        return seletor_perfil.escolher(pedido)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+# Frequência com que um pedido síncrono verifica se o cliente desconectou
+DISCONNECT_POLL_INTERVAL = float(os.getenv("DISCONNECT_POLL_INTERVAL", "0.5"))
+
+
+async def _executar_ate_desconectar(request: Request, funcao, cancelamento: Optional[Cancelamento] = None, **kwargs):
+    """
+    Roda 'funcao' (pipeline bloqueante) no threadpool enquanto vigia a conexão:
+    se o cliente desconectar, o pedido é cancelado e os subprocessos em
+    andamento são encerrados (ver scripts/processos.py).
+    """
+    cancelamento = cancelamento or Cancelamento()
+
+    async def vigiar():
+        while not await request.is_disconnected():
+            await asyncio.sleep(DISCONNECT_POLL_INTERVAL)
+        print("🔌 Cliente desconectou; cancelando o processamento")
+        cancelamento.cancelar("cliente desconectou")
+
+    vigia = asyncio.create_task(vigiar())
+    try:
+        with cancelavel(cancelamento):
+            return await run_in_threadpool(funcao, **kwargs)
+    finally:
+        vigia.cancel()
+
+
+def _validar_impacto(valor: Union[float, str]) -> None:
+    """Formato de 'impact_music' (ver interpretar_impacto); inválido vira 400."""
+    try:
+        interpretar_impacto(valor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def _erro_de_execucao(e: Exception, contexto: str) -> HTTPException:
+    """Converte falhas do pipeline em HTTPException (cancelamento → 499, timeout → 504)."""
+    if isinstance(e, FileNotFoundError):
+        return HTTPException(status_code=404, detail=str(e))
+    if isinstance(e, SemBatidas):
+        return HTTPException(status_code=422, detail=str(e))
+    if isinstance(e, Cancelado):
+        return HTTPException(status_code=499, detail=str(e))
+    if isinstance(e, TempoEsgotado):
+        return HTTPException(status_code=504, detail=str(e))
+    print(f"Erro inesperado no {contexto}: {str(e)}")
+    return HTTPException(status_code=500, detail=f"Erro inesperado no {contexto}: {str(e)}")
+
+
+def _preparar_musica(arquivo: str) -> None:
+    """
+    Indexa batidas/impactos e gera os picos da forma de onda, fora do
+    caminho da requisição. Com o cache PCM ativo, a decodificação fica nele
+    para os renders; desativado, nada é gravado em cache/pcm.
+    """
+    try:
+        indice_ritmo.analisar(arquivo)
+        forma_onda.obter(arquivo)
+    except Exception as e:
+        # O render decodifica (e o impacto automático analisa) sob demanda
+        print(f"⚠️ Aviso: Não foi possível preparar {arquivo}: {e}")
+
 
 @app.get("/health")
 def health():
@@ -90,6 +298,7 @@ def health():
 
 @app.post("/upload-music")
 async def upload_music(
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     music_name: str = None
 ):
@@ -97,7 +306,10 @@ async def upload_music(
     Faz upload de uma música para o sistema.
     
     A música será salva na pasta music/ seguindo o padrão {nome}.mp3.
-    O arquivo é validado usando ffprobe para garantir que é um áudio válido.
+    O upload é lido em blocos (memória constante): cada bloco é gravado em
+    disco, entra no hash SHA-256 e alimenta o ffmpeg que converte para MP3,
+    e o limite de tamanho é checado a cada bloco (413 ao passar dele).
+    O arquivo convertido é validado usando ffprobe para garantir que é um áudio válido.
     
     Parâmetros:
     - file: Arquivo de áudio (MP3, WAV, etc.)
@@ -134,49 +346,92 @@ async def upload_music(
                 detail=f"Música '{nome_final}' já existe. Use outro nome ou delete a música existente primeiro."
             )
         
-        # Salva arquivo temporário primeiro
+        # Arquivos temporários: cópia do upload (fallback) e saída do ffmpeg.
+        # A extensão .part mantém a saída parcial fora do catálogo.
         temp_path = os.path.join(music_dir, f"temp_{nome_final}_{os.urandom(4).hex()}")
+        temp_saida = f"{temp_path}.mp3.part"
+        transcoder = None
+        transcoder_stderr = tempfile.TemporaryFile()
+        transcoder_inicio = transcoder_desfecho = None
+        transcoder_enviados = 0
         
         try:
-            # Lê e salva o arquivo
-            conteudo = await file.read()
-            if len(conteudo) == 0:
-                raise HTTPException(status_code=400, detail="Arquivo vazio")
-            
-            # Limite de tamanho: 100MB
-            MAX_SIZE = 100 * 1024 * 1024
-            if len(conteudo) > MAX_SIZE:
-                raise HTTPException(status_code=400, detail=f"Arquivo muito grande. Máximo: 100MB")
+            pipe_ok = True
             
+            # Lê o upload em blocos (memória constante): grava em disco, calcula o hash
+            # e alimenta o ffmpeg; o limite de tamanho é checado a cada bloco
+            hash_upload = hashlib.sha256()
+            total = 0
             with open(temp_path, "wb") as f:
-                f.write(conteudo)
+                while True:
+                    bloco = await file.read(UPLOAD_CHUNK_SIZE)
+                    if not bloco:
+                        break
+                    total += len(bloco)
+                    if total > MAX_UPLOAD_BYTES:
+                        # Mesmo status do LimiteUploadMiddleware (que responde quando há Content-Length)
+                        raise HTTPException(status_code=413, detail=f"Arquivo muito grande. Máximo: {MAX_UPLOAD_BYTES // (1024 * 1024)}MB")
+                    hash_upload.update(bloco)
+                    f.write(bloco)
+                    if transcoder is None:
+                        # Transcodificação para MP3 começa já com o primeiro bloco, pelo stdin
+                        transcoder_inicio, transcoder_desfecho = time.perf_counter(), "spawn_error"
+                        transcoder = await iniciar_async(
+                            _cmd_converter_mp3("pipe:0", temp_saida),
+                            stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=transcoder_stderr
+                        )
+                        transcoder_desfecho = "cancelled"
+                    if pipe_ok:
+                        try:
+                            transcoder.stdin.write(bloco)
+                            await transcoder.stdin.drain()
+                            transcoder_enviados += len(bloco)
+                        except (BrokenPipeError, ConnectionResetError, OSError):
+                            # ffmpeg desistiu do pipe (formato não suportado em stream); usa o fallback
+                            pipe_ok = False
+            
+            if total == 0:
+                raise HTTPException(status_code=400, detail="Arquivo vazio")
             
-            # Valida o arquivo com ffprobe
-            info_audio = _validar_audio_com_ffprobe(temp_path)
+            try:
+                transcoder.stdin.close()
+            except (BrokenPipeError, ConnectionResetError, OSError):
+                pipe_ok = False
+            try:
+                returncode = transcoder_desfecho = await asyncio.wait_for(transcoder.wait(), timeout_etapa("upload_convert"))
+            except asyncio.TimeoutError:
+                returncode, transcoder_desfecho = None, "timeout"  # encerrado no finally; tenta o fallback
             
-            # Se o arquivo não for MP3, converte para MP3 usando ffmpeg
-            if not temp_path.lower().endswith('.mp3'):
-                # Converte para MP3
-                cmd_convert = [
-                    "ffmpeg", "-y", "-i", temp_path,
-                    "-acodec", "libmp3lame", "-b:a", "192k",
-                    "-ar", "48000", "-ac", "2",
-                    arquivo_final
-                ]
-                proc = subprocess.run(cmd_convert, capture_output=True, text=True, timeout=60)
+            if not pipe_ok or returncode != 0:
+                # Formatos que exigem seek (ex.: MP4/M4A com moov no fim) não decodificam
+                # por pipe: converte a partir da cópia completa em disco
+                print(f"⚠️ Conversão via pipe falhou para '{nome_final}', usando arquivo temporário")
+                if transcoder.returncode is None:
+                    await encerrar_grupo(transcoder)
+                try:
+                    proc = await executar_async(
+                        _cmd_converter_mp3(temp_path, temp_saida), timeout=timeout_etapa("upload_convert")
+                    )
+                except TempoEsgotado as e:
+                    raise HTTPException(status_code=400, detail=f"Arquivo de áudio inválido: {e}")
                 if proc.returncode != 0:
                     raise HTTPException(
-                        status_code=500,
-                        detail=f"Erro ao converter para MP3: {proc.stderr}"
+                        status_code=400,
+                        detail=f"Arquivo de áudio inválido: {proc.stderr.strip()[-500:]}"
                     )
-                # Remove temporário
-                os.remove(temp_path)
-            else:
-                # Se já é MP3, apenas move
-                os.rename(temp_path, arquivo_final)
             
-            # Valida o arquivo final
-            info_final = _validar_audio_com_ffprobe(arquivo_final)
+            # Valida o arquivo convertido antes de publicá-lo
+            try:
+                info_final = await run_in_threadpool(_validar_audio_com_ffprobe, temp_saida, memorizar=False)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=f"Arquivo de áudio inválido: {e}")
+            os.replace(temp_saida, arquivo_final)
+            
+            # Indexa no catálogo
+            entrada = catalogo.registrar(arquivo_final, info=info_final)
+            pcm_cache.invalidar(nome_final)
+            forma_onda.invalidar(nome_final)
+            background_tasks.add_task(_preparar_musica, arquivo_final)
             
             return {
                 "ok": True,
@@ -186,19 +441,30 @@ async def upload_music(
                 "duration": info_final["duration"],
                 "format": info_final["format"],
                 "codec": info_final["codec"],
-                "size_bytes": os.path.getsize(arquivo_final)
+                "size_bytes": entrada["size_bytes"],
+                "sha256": entrada["sha256"],
+                "upload_sha256": hash_upload.hexdigest(),
+                "upload_size_bytes": total
             }
             
         except HTTPException:
-            # Remove temp se houver erro
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
             raise
         except Exception as e:
-            # Remove temp se houver erro
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
             raise HTTPException(status_code=500, detail=f"Erro ao processar upload: {str(e)}")
+        finally:
+            # Encerra o ffmpeg (se abortado) e remove temporários
+            if transcoder is not None and transcoder.returncode is None:
+                await encerrar_grupo(transcoder)
+            if transcoder_inicio is not None:
+                # Iniciado à mão (não passa por executar_async): registra aqui, com o desfecho
+                registrar_subprocesso(
+                    "ffmpeg", time.perf_counter() - transcoder_inicio, transcoder_desfecho,
+                    bytes_stdin=transcoder_enviados
+                )
+            transcoder_stderr.close()
+            for temp in (temp_path, temp_saida):
+                if os.path.exists(temp):
+                    os.remove(temp)
     
     except HTTPException:
         raise
@@ -207,42 +473,144 @@ async def upload_music(
 
 
 @app.get("/list-music")
-def list_music():
+def list_music(
+    offset: int = 0,
+    limit: Optional[int] = None,
+    sort: str = "name",
+    order: str = "asc",
+    prefix: Optional[str] = None
+):
     """
-    Lista todas as músicas disponíveis no sistema.
+    Lista as músicas disponíveis no sistema a partir do catálogo persistente.
+
+    Parâmetros (query):
+    - offset / limit: paginação (limit omitido = todas)
+    - sort: name, duration, size_bytes ou mtime
+    - order: asc ou desc
+    - prefix: filtra pelo início do nome (sem diferenciar maiúsculas)
     """
+    if offset < 0 or (limit is not None and limit < 0):
+        raise HTTPException(status_code=400, detail="offset e limit devem ser positivos")
+
     try:
-        music_dir = "music"
-        if not os.path.exists(music_dir):
-            return {"ok": True, "musics": []}
-        
-        musicas = []
-        for arquivo in os.listdir(music_dir):
-            if arquivo.lower().endswith(('.mp3', '.wav', '.m4a', '.flac', '.ogg')):
-                caminho_completo = os.path.join(music_dir, arquivo)
-                if os.path.isfile(caminho_completo):
-                    nome_sem_ext = Path(arquivo).stem
-                    tamanho = os.path.getsize(caminho_completo)
-                    
-                    # Tenta obter duração
-                    try:
-                        info = _validar_audio_com_ffprobe(caminho_completo)
-                        duracao = info["duration"]
-                    except:
-                        duracao = None
-                    
-                    musicas.append({
-                        "name": nome_sem_ext,
-                        "filename": arquivo,
-                        "size_bytes": tamanho,
-                        "duration": duracao
-                    })
-        
-        return {"ok": True, "musics": musicas, "count": len(musicas)}
-    
+        catalogo.sincronizar()
+        entradas, total = catalogo.listar(offset=offset, limit=limit, sort=sort, order=order, prefix=prefix)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao listar músicas: {str(e)}")
 
+    musicas = [
+        {
+            "name": m["name"],
+            "filename": m["filename"],
+            "size_bytes": m["size_bytes"],
+            "duration": m["duration"],
+            "codec": m["codec"],
+            "format": m["format"],
+            "sha256": m["sha256"],
+            "mtime": m["mtime_ns"] / 1e9
+        }
+        for m in entradas
+    ]
+    return {"ok": True, "musics": musicas, "count": len(musicas), "total": total, "offset": offset, "limit": limit}
+
+
+@app.get("/music/{music_name}/rhythm")
+def ritmo_musica(music_name: str):
+    """
+    Índice de ritmo de uma música: andamento (BPM), batidas e candidatos a
+    impacto (segundos, do melhor para o pior), que 'impact_music: "auto"' e
+    '"beat:X"' usam. Calculado no upload; músicas adicionadas por fora da
+    API são analisadas na primeira consulta.
+    """
+    arquivo = os.path.join("music", f"{os.path.basename(music_name)}.mp3")
+    if not os.path.exists(arquivo):
+        raise HTTPException(status_code=404, detail=f"Música '{music_name}' não encontrada")
+    try:
+        entrada = indice_ritmo.obter(arquivo)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao analisar música: {str(e)}")
+    return {
+        "ok": True,
+        "music_name": music_name,
+        "duration": round(entrada["duration"], 3),
+        "tempo": entrada["tempo"],
+        "impacts": [round(float(t), 3) for t in entrada["impacts"]],
+        "beat_count": len(entrada["beats"]),
+        "beats": [round(float(t), 3) for t in entrada["beats"]]
+    }
+
+
+@app.get("/music/{music_name}/waveform")
+def forma_onda_musica(
+    music_name: str,
+    request: Request,
+    start: float = 0.0,
+    end: Optional[float] = None,
+    width: int = 1000,
+    format: str = "binary"
+):
+    """
+    Picos (mínimo, máximo) da forma de onda de um trecho da música, para
+    desenhar no editor sem baixar o áudio.
+
+    Parâmetros (query):
+    - start / end: trecho em segundos (end omitido = até o fim)
+    - width: quantos picos o cliente quer desenhar; vem o nível de zoom mais
+      grosso que ainda dê ao menos isso
+    - format: binary (int8 mínimo/máximo intercalados, metadados nos
+      cabeçalhos X-Waveform-*) ou json
+
+    Os picos são gerados no upload; a resposta tem ETag (If-None-Match → 304)
+    e Cache-Control.
+    """
+    if format not in ("binary", "json"):
+        raise HTTPException(status_code=400, detail="Formato inválido. Use: binary ou json.")
+    if start < 0 or (end is not None and end <= start):
+        raise HTTPException(status_code=400, detail="Intervalo inválido: use 0 <= start < end")
+    if not 1 <= width <= WAVEFORM_MAX_WIDTH:
+        raise HTTPException(status_code=400, detail=f"width deve estar entre 1 e {WAVEFORM_MAX_WIDTH}")
+    arquivo = os.path.join("music", f"{os.path.basename(music_name)}.mp3")
+    if not os.path.exists(arquivo):
+        raise HTTPException(status_code=404, detail=f"Música '{music_name}' não encontrada")
+
+    try:
+        trecho = forma_onda.trecho(arquivo, start, end, width)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao gerar forma de onda: {str(e)}")
+
+    etag = f'"{trecho["version"]}-{trecho["samples_per_peak"]}-{trecho["start"]:g}-{trecho["peaks"]}-{format[0]}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={WAVEFORM_MAX_AGE}",
+        "X-Waveform-Sample-Rate": str(trecho["sample_rate"]),
+        "X-Waveform-Samples-Per-Peak": str(trecho["samples_per_peak"]),
+        "X-Waveform-Start": f"{trecho['start']:.6f}",
+        "X-Waveform-End": f"{trecho['end']:.6f}",
+        "X-Waveform-Peaks": str(trecho["peaks"]),
+    }
+    if etag in [e.strip() for e in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers=headers)
+
+    if format == "binary":
+        return Response(content=trecho["data"], media_type="application/octet-stream", headers=headers)
+    return JSONResponse(
+        content={
+            "ok": True,
+            "music_name": music_name,
+            "sample_rate": trecho["sample_rate"],
+            "samples_per_peak": trecho["samples_per_peak"],
+            "start": trecho["start"],
+            "end": trecho["end"],
+            "duration": trecho["duration"],
+            "peaks": trecho["peaks"],
+            # [mín, máx, mín, máx, ...] em int8 (-128..127)
+            "data": np.frombuffer(trecho["data"], dtype=np.int8).tolist()
+        },
+        headers=headers
+    )
+
 
 @app.delete("/delete-music/{music_name}")
 def delete_music(music_name: str):
@@ -263,6 +631,10 @@ def delete_music(music_name: str):
             raise HTTPException(status_code=404, detail=f"Música '{music_name}' não encontrada")
         
         os.remove(arquivo)
+        catalogo.remover(os.path.basename(arquivo))
+        pcm_cache.invalidar(music_name)
+        indice_ritmo.remover(os.path.basename(arquivo))
+        forma_onda.invalidar(music_name)
         
         return {"ok": True, "message": f"Música '{music_name}' deletada com sucesso"}
     
@@ -300,7 +672,15 @@ def update_session(data: UpdateSessionRequest):
             )
             cj.set_cookie(c)
         
-        cj.save(ignore_discard=True, ignore_expires=True)
+        # Troca atômica: os downloads recarregam os cookies quando o arquivo muda
+        # (ver PoolYtdlp) e nunca leem um arquivo pela metade
+        temp = f"{SESSION_FILE_PATH}.{os.urandom(4).hex()}.tmp"
+        try:
+            cj.save(temp, ignore_discard=True, ignore_expires=True)
+            os.replace(temp, SESSION_FILE_PATH)
+        finally:
+            if os.path.exists(temp):
+                os.remove(temp)
         
         return {"status": "ok", "message": "Sessão de cookies atualizada com sucesso e salva em formato Netscape!"}
     
@@ -310,55 +690,110 @@ def update_session(data: UpdateSessionRequest):
         raise HTTPException(status_code=500, detail=f"Erro ao salvar a sessão: {str(e)}")
 
 
+async def _processar_progressivo(request: Request, **kwargs) -> Response:
+    """
+    return_format "stream": o pipeline roda em segundo plano e a resposta
+    começa no primeiro fragmento do MP4, enquanto o render continua (ver
+    resposta_progressiva). Erros antes do primeiro byte viram o status HTTP
+    de sempre; depois dele, a conexão é interrompida. Num acerto do cache de
+    renders (nada a renderizar), o arquivo pronto é entregue como em "file".
+    """
+    saida = SaidaProgressiva()
+    cancelamento = Cancelamento()
+    pipeline = asyncio.ensure_future(
+        _executar_ate_desconectar(request, executar_pipeline, cancelamento=cancelamento, saida=saida, **kwargs)
+    )
+
+    def _encerrar(tarefa: asyncio.Future) -> None:
+        saida.encerrar(Cancelado("Processamento cancelado") if tarefa.cancelled() else tarefa.exception())
+
+    pipeline.add_done_callback(_encerrar)
+    headers = {"X-Encoder-Profile": kwargs["encoder_profile"]}
+
+    while not pipeline.done() and not saida.escritos:
+        await asyncio.sleep(STREAM_POLL_INTERVAL)
+    if not pipeline.done():
+        return resposta_progressiva(
+            saida, "video/mp4",
+            ao_interromper=lambda: cancelamento.cancelar("cliente desconectou"),
+            headers={**headers, "X-Render-Cache": "miss"}
+        )
+
+    try:
+        resultado = pipeline.result()
+    except (FileNotFoundError, SemBatidas, Cancelado, TempoEsgotado) as e:
+        raise _erro_de_execucao(e, "processamento")
+    headers.update({
+        "X-Video-Mode": resultado["video_mode"] or "",
+        "X-Encoder-Profile": resultado["encoder_profile"],
+        "X-Render-Cache": resultado["cache"] or ""
+    })
+    return resposta_arquivo(request, resultado["video_path"], "video/mp4", filename=resultado["filename"], headers=headers)
+
+
 @app.post("/processar")
-def processar_video(data: EditRequest):
+async def processar_video(data: EditRequest, request: Request):
+    """
+    Processa o pedido e responde no formato de 'return_format'. Se o cliente
+    desconectar antes do fim, o render é cancelado (ffmpeg encerrado, sem
+    saída parcial). Com "stream", o vídeo começa a chegar durante o render
+    (ver _processar_progressivo).
+    """
     try:
         if not os.path.exists(SESSION_FILE_PATH):
             raise HTTPException(status_code=400, detail="Arquivo de sessão de cookies não encontrado. Por favor, use o endpoint /update-session primeiro.")
 
-        video_path = baixar_reel(data.url, cookie_file_path=SESSION_FILE_PATH)
-        if not video_path or not os.path.exists(video_path):
-            raise HTTPException(status_code=500, detail="Falha ao baixar o vídeo. Verifique se a sessão de cookies ainda é válida.")
-
-        musica_path = os.path.join("music", f"{data.music}.mp3")
-        if not os.path.exists(musica_path):
-            raise HTTPException(status_code=404, detail=f"Música não encontrada: {musica_path}")
-
-        filename = f"{os.path.basename(video_path).split('.')[0]}_{data.music}.mp4"
-        out = os.path.join("processed", filename)
-        
-        adicionar_musica(
-            video_path=video_path,
-            musica_path=musica_path,
-            segundo_video=data.impact_video,
-            output_path=out,
-            music_impact=data.impact_music
+        perfil = _escolher_perfil(data.encoder_profile)
+        _validar_impacto(data.impact_music)
+        pedido = dict(
+            url=data.url,
+            music=data.music,
+            impact_music=data.impact_music,
+            impact_video=data.impact_video,
+            cookie_file_path=SESSION_FILE_PATH,
+            pcm_cache=pcm_cache,
+            download_cache=download_cache,
+            render_cache=render_cache,
+            encoder_profile=perfil["encoder_profile"],
+            indice_ritmo=indice_ritmo
         )
-
-        # Remove vídeo original após processamento bem-sucedido
-        # Seguindo padrão do sistema: não persistir vídeos baixados
+        if data.return_format == "stream":
+            return await _processar_progressivo(request, **pedido)
         try:
-            if os.path.exists(video_path):
-                os.remove(video_path)
-                print(f"✅ Vídeo original removido: {video_path}")
-        except Exception as e:
-            # Não falha o processamento se não conseguir remover
-            print(f"⚠️ Aviso: Não foi possível remover vídeo original {video_path}: {e}")
+            with coletar_tempos() as tempos:
+                resultado = await _executar_ate_desconectar(request, executar_pipeline, **pedido)
+        except (FileNotFoundError, SemBatidas, Cancelado, TempoEsgotado) as e:
+            raise _erro_de_execucao(e, "processamento")
+
+        filename = resultado["filename"]
+        out = resultado["video_path"]
+        campos = {
+            "impact_music": resultado["impact_music"],
+            "video_mode": resultado["video_mode"],
+            "encoder_profile": resultado["encoder_profile"],
+            "encoder_profile_degraded": perfil["degraded"],
+            "cache": resultado["cache"],
+            "download": resultado["download"],
+            "timings": tempos
+        }
 
         if data.return_format == "url":
-            return {"ok": True, "filename": filename, "video_url": f"/videos/{filename}"}
+            return {"ok": True, "filename": filename, "video_url": f"/videos/{filename}", **campos}
         elif data.return_format == "base64":
-            with open(out, "rb") as f:
-                encoded = base64.b64encode(f.read()).decode("utf-8")
-            return {"ok": True, "filename": filename, "video_base64": encoded}
+            return resposta_base64(out, {"ok": True, "filename": filename, **campos})
         elif data.return_format == "path":
-            return {"ok": True, "filename": filename, "video_path": out}
+            return {"ok": True, "filename": filename, "video_path": out, **campos}
         elif data.return_format == "file":
-            return FileResponse(out, media_type="video/mp4", filename=filename)
+            headers = {
+                "X-Video-Mode": campos["video_mode"] or "",
+                "X-Encoder-Profile": campos["encoder_profile"],
+                "X-Render-Cache": campos["cache"] or ""
+            }
+            return resposta_arquivo(request, out, "video/mp4", filename=filename, headers=headers)
         else:
             raise HTTPException(
                 status_code=400,
-                detail="Formato inválido. Use: url, base64, path ou file."
+                detail="Formato inválido. Use: url, base64, path, file ou stream."
             )
 
     except HTTPException as e:
@@ -368,21 +803,237 @@ def processar_video(data: EditRequest):
         raise HTTPException(status_code=500, detail=f"Erro inesperado no processamento: {str(e)}")
 
 
-@app.delete("/cleanup")
-def cleanup_videos():
-    pastas = ["videos", "processed"]
-    removidos = []
+@app.post("/processar-lote")
+async def processar_lote(data: BatchEditRequest, request: Request):
+    """
+    Renderiza um vídeo com várias variantes de música/pontos de impacto.
+
+    O vídeo é baixado e analisado uma única vez, encodado no máximo uma vez
+    (ou copiado, se já compatível) e as variantes de áudio rodam em paralelo.
+    Retorna um manifesto com o resultado de cada variante, na ordem enviada.
+    Se o cliente desconectar, o lote é cancelado.
+    """
+    if not data.variants:
+        raise HTTPException(status_code=400, detail="Informe ao menos uma variante.")
+    if len(data.variants) > MAX_BATCH_VARIANTS:
+        raise HTTPException(status_code=400, detail=f"Máximo de {MAX_BATCH_VARIANTS} variantes por lote.")
+    if not os.path.exists(SESSION_FILE_PATH):
+        raise HTTPException(status_code=400, detail="Arquivo de sessão de cookies não encontrado. Por favor, use o endpoint /update-session primeiro.")
 
+    perfil = _escolher_perfil(data.encoder_profile)
+    for v in data.variants:
+        _validar_impacto(v.impact_music)
     try:
-        for pasta in pastas:
-            if os.path.exists(pasta):
-                for arquivo in os.listdir(pasta):
-                    caminho = os.path.join(pasta, arquivo)
-                    if os.path.isfile(caminho):
-                        os.remove(caminho)
-                        removidos.append(caminho)
+        with coletar_tempos() as tempos:
+            lote = await _executar_ate_desconectar(
+                request,
+                executar_lote,
+                url=data.url,
+                variantes=[v.model_dump() for v in data.variants],
+                cookie_file_path=SESSION_FILE_PATH,
+                pcm_cache=pcm_cache,
+                download_cache=download_cache,
+                render_cache=render_cache,
+                encoder_profile=perfil["encoder_profile"],
+                indice_ritmo=indice_ritmo
+            )
+    except Exception as e:
+        raise _erro_de_execucao(e, "processamento do lote")
+
+    results = []
+    for r in lote["results"]:
+        if r["ok"]:
+            r["video_url"] = f"/videos/{r['filename']}"
+        results.append(r)
+
+    return {
+        "ok": all(r["ok"] for r in results),
+        "video_mode": lote["video_mode"],
+        "encoder_profile": lote["encoder_profile"],
+        "encoder_profile_degraded": perfil["degraded"],
+        "download": lote["download"],
+        "timings": tempos,
+        "count": len(results),
+        "results": results
+    }
+
+
+def _executar_job(params: dict, progresso=None) -> dict:
+    """
+    Executa o pipeline de um job e monta o resultado no mesmo formato de /processar.
+    O perfil de encode é decidido quando o job começa, com a carga do momento.
+    'progresso' recebe o andamento do download e do ffmpeg (ver JobManager).
+    """
+    params = dict(params)
+    perfil = seletor_perfil.escolher(params.pop("encoder_profile", None))
+    with coletar_tempos() as tempos:
+        resultado = executar_pipeline(
+            cookie_file_path=SESSION_FILE_PATH,
+            pcm_cache=pcm_cache,
+            download_cache=download_cache,
+            render_cache=render_cache,
+            encoder_profile=perfil["encoder_profile"],
+            progresso=progresso,
+            indice_ritmo=indice_ritmo,
+            **params
+        )
+    filename = resultado["filename"]
+    return {
+        "filename": filename,
+        "impact_music": resultado["impact_music"],
+        "video_url": f"/videos/{filename}",
+        "video_path": resultado["video_path"],
+        "video_mode": resultado["video_mode"],
+        "encoder_profile": resultado["encoder_profile"],
+        "encoder_profile_degraded": perfil["degraded"],
+        "cache": resultado["cache"],
+        "download": resultado["download"],
+        "timings": tempos
+    }
 
-        return {"ok": True, "removidos": removidos}
+
+# Os workers sobem no lifespan (importar o módulo não inicia threads). Com
+# JOB_LOCAL_WORKERS=0 a API só enfileira; os renders ficam com `python -m api.worker`
+jobs = JobManager(_executar_job, iniciar=False)
+
+REGISTRO.medidor(
+    "clip_ytdlp_instances", "Instâncias do YoutubeDL aquecidas por sessão de cookies neste worker", ("session",),
+    funcao=lambda: {(os.path.basename(s["cookie_file"] or "-"),): s["instances"] for s in pool_ytdlp.estatisticas()}
+)
+REGISTRO.medidor(
+    "clip_jobs_in_flight", "Jobs aguardando na fila ou em execução neste worker", funcao=jobs.profundidade
+)
+REGISTRO.medidor(
+    "clip_encoder_under_load", "1 se o perfil de encode está degradado pela carga",
+    funcao=lambda: int(seletor_perfil.sob_carga)
+)
+
+
+@app.post("/jobs", status_code=202)
+def criar_job(data: EditRequest):
+    """
+    Enfileira um pedido de edição e retorna o ID do job imediatamente.
+
+    O render roda nos workers que consomem a fila (nesta API e/ou em
+    `python -m api.worker`); acompanhe o estado
+    por GET /jobs/{job_id} ou ao vivo por GET /jobs/{job_id}/events (SSE). O resultado traz 'video_url' e 'video_path'
+    ('return_format' é ignorado aqui).
+    """
+    if not os.path.exists(SESSION_FILE_PATH):
+        raise HTTPException(status_code=400, detail="Arquivo de sessão de cookies não encontrado. Por favor, use o endpoint /update-session primeiro.")
+
+    musica_path = os.path.join("music", f"{data.music}.mp3")
+    if not os.path.exists(musica_path):
+        raise HTTPException(status_code=404, detail=f"Música não encontrada: {musica_path}")
+    _escolher_perfil(data.encoder_profile)  # só valida; a escolha vale quando o job começar
+    _validar_impacto(data.impact_music)  # "auto"/"beat:X" são resolvidos quando o job começar
+
+    try:
+        job = jobs.submeter({
+            "url": data.url,
+            "music": data.music,
+            "impact_music": data.impact_music,
+            "impact_video": data.impact_video,
+            "encoder_profile": data.encoder_profile
+        })
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao criar job: {str(e)}")
+
+    return {
+        "ok": True,
+        "job_id": job["id"],
+        "status": job["status"],
+        "status_url": f"/jobs/{job['id']}",
+        "events_url": f"/jobs/{job['id']}/events"
+    }
+
+
+@app.get("/jobs/{job_id}")
+def status_job(job_id: str):
+    """
+    Retorna o estado de um job: queued, running, done, error ou cancelled.
+    """
+    job = jobs.obter(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' não encontrado")
+    return {"ok": True, "job": job}
+
+
+@app.delete("/jobs/{job_id}", status_code=202)
+def cancelar_job(job_id: str):
+    """
+    Cancela um job: na fila, ele não chega a rodar; em execução, o worker
+    (em qualquer processo) encerra os subprocessos e descarta as saídas parciais.
+    """
+    job = jobs.obter(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' não encontrado")
+    if job["status"] in ("done", "error", "cancelled"):
+        raise HTTPException(status_code=409, detail=f"Job '{job_id}' já finalizado ({job['status']})")
+    job = jobs.cancelar(job_id)
+    return {"ok": True, "job_id": job_id, "status": "cancelled" if job["status"] == "cancelled" else "cancelling"}
+
+
+@app.get("/jobs/{job_id}/events")
+def eventos_job(job_id: str, request: Request):
+    """
+    Progresso do job ao vivo (Server-Sent Events): eventos 'status',
+    'progress' (etapa, out_time, speed, percent), 'stalled' se o render ficar
+    sem progresso por JOB_STALL_SECONDS, e por fim 'done', 'error' ou 'cancelled'.
+    """
+    if jobs.obter(job_id) is None:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' não encontrado")
+    return resposta_eventos_job(request, lambda: jobs.obter(job_id))
+
+
+@app.api_route("/videos/{filename}", methods=["GET", "HEAD"])
+def baixar_video(filename: str, request: Request):
+    """
+    Entrega um vídeo processado com suporte a Range (seek/retomada) e ETag.
+    """
+    caminho = os.path.join("processed", os.path.basename(filename))
+    if filename != os.path.basename(filename) or filename.startswith(".") or not os.path.isfile(caminho):
+        raise HTTPException(status_code=404, detail="Not Found")
+    return resposta_arquivo(request, caminho, "video/mp4")
+
+
+@app.get("/metrics")
+def metricas():
+    """
+    Métricas no formato texto do Prometheus: duração/bytes/status de cada
+    etapa do pipeline e de cada subprocesso, consultas aos caches (e taxa de
+    acerto) e pedidos/jobs em andamento. Valores deste worker do uvicorn.
+    """
+    return Response(content=REGISTRO.exportar(), media_type=CONTENT_TYPE)
+
+
+@app.get("/render-cache")
+def estatisticas_render_cache():
+    """
+    Acertos/falhas do cache de renders (neste worker) e uso de disco em processed/.
+    """
+    return {"ok": True, **render_cache.estatisticas()}
+
+
+@app.get("/storage")
+def uso_armazenamento():
+    """
+    Uso de disco de videos/ e processed/ frente ao orçamento (bytes, arquivos,
+    temporários, TTL) e espaço livre no volume.
+    """
+    return {"ok": True, **armazenamento.uso()}
+
+
+@app.delete("/cleanup")
+def cleanup_videos():
+    """
+    Remove os vídeos de videos/ e processed/, exceto os que estão sendo
+    entregues a um cliente ou usados por um render em andamento
+    (listados em 'em_uso').
+    """
+    try:
+        resultado = armazenamento.esvaziar()
+        return {"ok": True, "removidos": resultado["removed"], "em_uso": resultado["in_use"]}
 
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,316 @@
+import os
+import json
+import time
+import fcntl
+import base64
+import asyncio
+from typing import AsyncIterator, Callable, Iterator, Optional
+from urllib.parse import quote
+from fastapi import Request
+from fastapi.responses import Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from scripts.fluxo import SaidaProgressiva
+from scripts.metricas import registrar_etapa
+
+
+# Blocos lidos do disco; múltiplo de 3 para o base64 de cada bloco não gerar padding no meio
+CHUNK_SIZE = 3 * 64 * 1024
+
+# Eventos de job (SSE): frequência de leitura do estado, keep-alive e
+# tempo sem progresso até avisar que o job parece travado
+SSE_POLL_INTERVAL = float(os.getenv("SSE_POLL_INTERVAL", "0.5"))
+SSE_HEARTBEAT_SECONDS = float(os.getenv("SSE_HEARTBEAT_SECONDS", "15"))
+JOB_STALL_SECONDS = float(os.getenv("JOB_STALL_SECONDS", "60"))
+# Resposta progressiva (return_format "stream"): frequência com que procura bytes novos
+STREAM_POLL_INTERVAL = float(os.getenv("STREAM_POLL_INTERVAL", "0.05"))
+
+
+def _ler_arquivo(path: str, inicio: int = 0, tamanho: Optional[int] = None) -> Iterator[bytes]:
+    """Lê [inicio, inicio + tamanho) do arquivo em blocos (memória constante)."""
+    restante = os.path.getsize(path) - inicio if tamanho is None else tamanho
+    with open(path, "rb") as f:
+        # Marca o arquivo como em uso: a limpeza de disco não o remove no meio da entrega
+        fcntl.flock(f, fcntl.LOCK_SH)
+        f.seek(inicio)
+        while restante > 0:
+            bloco = f.read(min(CHUNK_SIZE, restante))
+            if not bloco:
+                break
+            restante -= len(bloco)
+            yield bloco
+
+
+def _medir_envio(blocos: Iterator[bytes], etapa: str, bytes_entrada: int) -> Iterator[bytes]:
+    """
+    Repassa os blocos registrando a etapa de resposta (do primeiro ao último
+    bloco, incluindo a espera pelo cliente). Desconexão conta como erro.
+    """
+    inicio = time.perf_counter()
+    enviados = 0
+    ok = False
+    try:
+        for bloco in blocos:
+            enviados += len(bloco)
+            yield bloco
+        ok = True
+    finally:
+        registrar_etapa(etapa, time.perf_counter() - inicio, ok, bytes_entrada, enviados)
+
+
+def resposta_base64(path: str, campos: dict) -> StreamingResponse:
+    """
+    Resposta JSON com o vídeo em base64 no campo 'video_base64', gerada bloco a
+    bloco a partir do arquivo: nem o vídeo nem o base64 ficam inteiros em memória.
+    'campos' são as demais chaves do envelope (ok, filename, ...).
+    """
+    prefixo = (json.dumps(campos, ensure_ascii=False)[:-1] + ', "video_base64": "').encode("utf-8")
+    sufixo = b'"}'
+    tamanho = os.path.getsize(path)
+    tamanho_b64 = 4 * ((tamanho + 2) // 3)
+
+    def gerar():
+        yield prefixo
+        for bloco in _ler_arquivo(path):
+            yield base64.b64encode(bloco)
+        yield sufixo
+
+    return StreamingResponse(
+        _medir_envio(gerar(), "response_encoding", tamanho),
+        media_type="application/json",
+        headers={"Content-Length": str(len(prefixo) + tamanho_b64 + len(sufixo))}
+    )
+
+
+def _etag(path: str) -> str:
+    st = os.stat(path)
+    return f'"{st.st_size:x}-{st.st_mtime_ns:x}"'
+
+
+def _intervalo(cabecalho: str, tamanho: int) -> Optional[tuple[int, int]]:
+    """
+    Interpreta um Range 'bytes=' de intervalo único. Retorna (inicio, fim) inclusivo,
+    None se o cabeçalho não for aplicável (responde o arquivo todo) ou levanta
+    ValueError se o intervalo não puder ser atendido (416).
+    """
+    unidade, _, especificacao = cabecalho.partition("=")
+    if unidade.strip().lower() != "bytes" or "," in especificacao:
+        return None
+    inicio_txt, _, fim_txt = especificacao.strip().partition("-")
+    try:
+        if inicio_txt == "":
+            # Sufixo: os últimos N bytes
+            n = int(fim_txt)
+            if n <= 0:
+                raise ValueError("intervalo vazio")
+            return max(0, tamanho - n), tamanho - 1
+        inicio = int(inicio_txt)
+        fim = int(fim_txt) if fim_txt else tamanho - 1
+    except ValueError:
+        if inicio_txt.isdigit() or fim_txt.isdigit():
+            raise
+        return None
+    if inicio >= tamanho or fim < inicio:
+        raise ValueError("intervalo fora do arquivo")
+    return inicio, min(fim, tamanho - 1)
+
+
+def resposta_arquivo(
+    request: Request,
+    path: str,
+    media_type: str,
+    filename: Optional[str] = None,
+    headers: Optional[dict] = None
+) -> Response:
+    """
+    Entrega um arquivo com suporte a ETag (If-None-Match → 304) e a Range de
+    intervalo único (206 / 416, respeitando If-Range), para que o cliente retome
+    ou avance no vídeo sem baixar tudo de novo.
+    """
+    tamanho = os.path.getsize(path)
+    etag = _etag(path)
+    base = {
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+        **(headers or {})
+    }
+    if filename:
+        base["Content-Disposition"] = f"attachment; filename*=utf-8''{quote(filename)}"
+
+    if etag in [e.strip() for e in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers=base)
+
+    intervalo = None
+    cabecalho_range = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if cabecalho_range and (not if_range or if_range == etag):
+        try:
+            intervalo = _intervalo(cabecalho_range, tamanho)
+        except ValueError:
+            return Response(status_code=416, headers={**base, "Content-Range": f"bytes */{tamanho}"})
+
+    if intervalo is None:
+        inicio, comprimento, status = 0, tamanho, 200
+    else:
+        inicio, fim = intervalo
+        comprimento, status = fim - inicio + 1, 206
+        base["Content-Range"] = f"bytes {inicio}-{fim}/{tamanho}"
+    base["Content-Length"] = str(comprimento)
+
+    if request.method == "HEAD":
+        return Response(status_code=status, headers=base, media_type=media_type)
+    return StreamingResponse(
+        _medir_envio(_ler_arquivo(path, inicio, comprimento), "response_stream", comprimento),
+        status_code=status,
+        media_type=media_type,
+        headers=base
+    )
+
+
+async def _ler_progressiva(
+    saida: SaidaProgressiva,
+    intervalo: float,
+    ao_interromper: Callable[[], None]
+) -> AsyncIterator[bytes]:
+    """
+    Lê o arquivo da saída conforme o render o escreve, até a saída ser
+    encerrada. Se o render falhou, levanta depois do último byte: a conexão
+    é interrompida e o cliente não confunde o vídeo truncado com um completo.
+    Se a entrega parar antes do fim (cliente desconectou), 'ao_interromper'
+    cancela o render.
+    """
+    inicio = time.perf_counter()
+    enviados = 0
+    ok = False
+    try:
+        with open(saida.caminho, "rb") as f:
+            # Em uso: a limpeza de disco não remove o arquivo no meio da entrega
+            fcntl.flock(f, fcntl.LOCK_SH)
+            while True:
+                # Lido antes do bloco: encerrada + bloco vazio = não há mais nada
+                encerrada = saida.concluida
+                bloco = await run_in_threadpool(f.read, CHUNK_SIZE)
+                if bloco:
+                    enviados += len(bloco)
+                    yield bloco
+                elif encerrada:
+                    break
+                else:
+                    await asyncio.sleep(intervalo)
+        if saida.erro is not None:
+            print(f"❌ Render interrompido durante a entrega: {saida.erro}")
+            raise RuntimeError(f"Render interrompido após {enviados} bytes: {saida.erro}")
+        ok = True
+    finally:
+        if not saida.concluida:
+            ao_interromper()
+        registrar_etapa("response_stream", time.perf_counter() - inicio, ok, saida.escritos, enviados)
+
+
+def resposta_progressiva(
+    saida: SaidaProgressiva,
+    media_type: str,
+    ao_interromper: Callable[[], None],
+    headers: Optional[dict] = None,
+    intervalo: Optional[float] = None
+) -> StreamingResponse:
+    """
+    Entrega uma saída que ainda está sendo renderizada (MP4 fragmentado), em
+    chunked transfer: sem Content-Length, Range nem ETag, que só existem com
+    o arquivo pronto. Ver _ler_progressiva.
+    """
+    return StreamingResponse(
+        _ler_progressiva(saida, STREAM_POLL_INTERVAL if intervalo is None else intervalo, ao_interromper),
+        media_type=media_type,
+        headers={"Cache-Control": "no-store", "X-Accel-Buffering": "no", **(headers or {})}
+    )
+
+
+def _evento_sse(nome: str, dados: dict) -> bytes:
+    return f"event: {nome}\ndata: {json.dumps(dados, ensure_ascii=False)}\n\n".encode("utf-8")
+
+
+async def _eventos_job(
+    request: Request,
+    obter: Callable[[], Optional[dict]],
+    intervalo: float,
+    heartbeat: float,
+    parado_apos: float
+) -> AsyncIterator[bytes]:
+    """
+    Acompanha o estado do job (lido de disco, então funciona entre workers do
+    uvicorn) e emite 'status' a cada mudança de estado, 'progress' a cada novo
+    evento de progresso, 'stalled' (uma vez) se o job em execução ficar
+    'parado_apos' segundos sem progresso, e termina com 'done', 'error' ou 'cancelled'.
+    Comentários ': ping' mantêm a conexão viva; para quando o cliente desconecta.
+    """
+    yield f"retry: {int(intervalo * 4000)}\n\n".encode("utf-8")
+    ultimo_status = ultimo_progresso = None
+    ultimo_envio = time.monotonic()
+    avisou_parado = False
+
+    while not await request.is_disconnected():
+        job = await run_in_threadpool(obter)
+        if job is None:
+            yield _evento_sse("error", {"error": "Job não encontrado"})
+            return
+
+        saida = []
+        if job["status"] != ultimo_status:
+            ultimo_status = job["status"]
+            saida.append(_evento_sse("status", {"id": job["id"], "status": job["status"]}))
+        progresso = job.get("progress")
+        if progresso and progresso != ultimo_progresso:
+            ultimo_progresso = progresso
+            avisou_parado = False
+            saida.append(_evento_sse("progress", progresso))
+
+        if job["status"] == "done":
+            saida.append(_evento_sse("done", {"id": job["id"], "result": job["result"]}))
+        elif job["status"] == "error":
+            saida.append(_evento_sse("error", {"id": job["id"], "error": job["error"]}))
+        elif job["status"] == "cancelled":
+            saida.append(_evento_sse("cancelled", {"id": job["id"], "error": job["error"]}))
+        elif job["status"] == "running" and not avisou_parado:
+            referencia = (progresso or {}).get("updated_at") or job.get("started_at")
+            if referencia and time.time() - referencia >= parado_apos:
+                avisou_parado = True
+                saida.append(_evento_sse("stalled", {
+                    "id": job["id"],
+                    "stage": (progresso or {}).get("stage"),
+                    "seconds_without_progress": round(time.time() - referencia, 1)
+                }))
+
+        if saida:
+            ultimo_envio = time.monotonic()
+            yield b"".join(saida)
+        elif time.monotonic() - ultimo_envio >= heartbeat:
+            ultimo_envio = time.monotonic()
+            yield b": ping\n\n"
+
+        if job["status"] in ("done", "error", "cancelled"):
+            return
+        await asyncio.sleep(intervalo)
+
+
+def resposta_eventos_job(
+    request: Request,
+    obter: Callable[[], Optional[dict]],
+    intervalo: Optional[float] = None,
+    heartbeat: Optional[float] = None,
+    parado_apos: Optional[float] = None
+) -> StreamingResponse:
+    """
+    Stream Server-Sent Events (text/event-stream) com o andamento de um job;
+    'obter' retorna o estado atual do job (ou None). Ver _eventos_job.
+    Tempos omitidos usam SSE_POLL_INTERVAL, SSE_HEARTBEAT_SECONDS e JOB_STALL_SECONDS.
+    """
+    return StreamingResponse(
+        _eventos_job(
+            request, obter,
+            SSE_POLL_INTERVAL if intervalo is None else intervalo,
+            SSE_HEARTBEAT_SECONDS if heartbeat is None else heartbeat,
+            JOB_STALL_SECONDS if parado_apos is None else parado_apos
+        ),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
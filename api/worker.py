@@ -0,0 +1,56 @@
+# api/worker.py
+# -*- coding: utf-8 -*-
+"""
+Worker de render avulso: consome a fila de jobs (JOB_BACKEND) sem servir HTTP.
+
+A API enfileira (POST /jobs; com JOB_LOCAL_WORKERS=0 ela não renderiza) e
+cada worker pega jobs da fila, roda o pipeline (download → alinhamento → mux)
+e grava o resultado em processed/. Uso:
+
+    python -m api.worker                 # RENDER_WORKERS jobs em paralelo
+    python -m api.worker --workers 2
+
+Os workers usam a mesma configuração da API e precisam enxergar os mesmos
+music/, cookies/, processed/ e o banco da fila (JOB_DB). SIGTERM/SIGINT param
+de pegar jobs novos e esperam os que estão em execução; os enfileirados
+ficam para o próximo worker.
+"""
+
+import os
+import sys
+import signal
+import argparse
+import threading
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Worker de render da fila de jobs")
+    parser.add_argument("--workers", type=int, default=0, help="Jobs em paralelo (padrão: RENDER_WORKERS)")
+    args = parser.parse_args(argv)
+    if args.workers > 0:
+        os.environ["RENDER_WORKERS"] = str(args.workers)
+
+    # A API define o pipeline, os caches e a fila; importar não sobe servidor
+    # nem inicia workers (isso fica no lifespan do app, que aqui não roda)
+    from api import app as app_mod
+
+    parar = threading.Event()
+    for sinal in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sinal, lambda *_: parar.set())
+
+    jobs = app_mod.jobs
+    app_mod.armazenamento.iniciar()
+    jobs.iniciar()
+    print(f"👷 Worker {jobs.worker} consumindo a fila com {jobs.max_workers} job(s) em paralelo")
+    try:
+        parar.wait()
+    finally:
+        print("🛑 Encerrando: esperando os jobs em execução…")
+        jobs.encerrar(wait=True)
+        app_mod.armazenamento.parar()
+        app_mod.pool_ytdlp.fechar()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
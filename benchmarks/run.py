@@ -0,0 +1,347 @@
+# benchmarks/run.py
+# -*- coding: utf-8 -*-
+"""
+Benchmark offline do render, etapa por etapa, com mídia sintética.
+
+Gera vídeos (testsrc2 + sine) e músicas (sine) determinísticos com as fontes
+lavfi do ffmpeg, em várias durações e resoluções, e mede:
+- probe:            ffprobe do vídeo (sem cache)
+- audio_cut:        corte/ganho da música para WAV (passo 1 do two_pass)
+- mux:              mux do WAV com o vídeo, reencodando (passo 2 do two_pass)
+- render_single:    adicionar_musica no modo single
+- render_two_pass:  adicionar_musica no modo two_pass
+- endpoint:         POST /processar completo (download stubado, sem cache de render)
+- endpoint_cached:  POST /processar com o render já em cache
+- response_base64:  POST /processar em cache com return_format "base64"
+- render_concurrent: CONCORRENCIA renders com transcode ao mesmo tempo (vazão sob
+                    carga), com o agendador de CPU; "_unscheduled" repete sem ele
+
+Não acessa a rede (baixar_reel é substituído por uma cópia do vídeo sintético)
+e roda só em CPU. Uso:
+
+    python -m benchmarks.run                      # mede e compara com a baseline
+    python -m benchmarks.run --rapido             # só o menor caso
+    python -m benchmarks.run --salvar-baseline    # grava a medição como baseline
+    python -m benchmarks.run --ci --baseline b.json   # gate: a baseline é obrigatória
+
+A baseline depende da máquina e não é versionada: grave-a com --salvar-baseline
+no mesmo runner em que a comparação vai rodar. Sem --ci, a falta dela só é
+avisada; com --ci, é erro.
+
+Sai com código 1 se alguma etapa ficar mais lenta que a baseline além da
+tolerância, 2 se ffmpeg/ffprobe não estiverem instalados e 3 se --ci for usado
+sem baseline.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import argparse
+import platform
+import statistics
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+
+# =========================
+# Configuração
+# =========================
+
+DIR_BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+BASELINE_PADRAO = os.path.join(DIR_BENCHMARKS, "baseline.json")
+SAIDA_PADRAO = os.path.join(DIR_BENCHMARKS, "results.json")
+
+# (duração em segundos, largura, altura) — vídeos verticais, como Reels
+CASOS = [
+    (5, 360, 640),
+    (15, 360, 640),
+    (15, 720, 1280),
+]
+CASOS_RAPIDOS = CASOS[:1]
+
+# Regressão = mais lento que baseline * (1 + tolerância) E com diferença acima do mínimo
+TOLERANCIA_PADRAO = 0.5
+DIFERENCA_MINIMA = 0.05
+
+IMPACTO_MUSICA = 12.0
+IMPACTO_VIDEO = 2.0
+
+# Renders simultâneos na medição de vazão sob carga (o dobro dos núcleos, no mínimo 4)
+CONCORRENCIA = max(4, 2 * (os.cpu_count() or 1))
+
+
+# =========================
+# Mídia sintética
+# =========================
+
+def _ffmpeg(*args: str) -> None:
+    subprocess.run(["ffmpeg", "-v", "error", "-y", *args], check=True)
+
+
+def gerar_video(path: str, duracao: int, largura: int, altura: int) -> None:
+    """Vídeo H.264 yuv420p (compatível com Reels) com trilha de áudio própria."""
+    _ffmpeg(
+        "-f", "lavfi", "-i", f"testsrc2=size={largura}x{altura}:rate=30:duration={duracao}",
+        "-f", "lavfi", "-i", f"sine=frequency=220:sample_rate=48000:duration={duracao}",
+        "-c:v", "libx264", "-pix_fmt", "yuv420p", "-preset", "veryfast", "-g", "60",
+        "-c:a", "aac", "-shortest", path
+    )
+
+
+def gerar_musica(path: str, duracao: int) -> None:
+    """Música MP3 no padrão do sistema (48 kHz estéreo)."""
+    _ffmpeg(
+        "-f", "lavfi", "-i", f"sine=frequency=440:sample_rate=48000:duration={duracao}",
+        "-ac", "2", "-c:a", "libmp3lame", "-b:a", "192k", path
+    )
+
+
+# =========================
+# Medição
+# =========================
+
+def medir(fn: Callable[[], object], repeticoes: int, preparar: Callable[[], None] = None) -> dict:
+    """Executa fn 'repeticoes' vezes e retorna mediana/mínimo/máximo em segundos."""
+    tempos = []
+    for _ in range(repeticoes):
+        if preparar:
+            preparar()
+        inicio = time.perf_counter()
+        fn()
+        tempos.append(time.perf_counter() - inicio)
+    return {
+        "median": round(statistics.median(tempos), 4),
+        "min": round(min(tempos), 4),
+        "max": round(max(tempos), 4),
+    }
+
+
+def comparar(
+    atual: dict,
+    baseline: dict,
+    tolerancia: float = TOLERANCIA_PADRAO,
+    minimo: float = DIFERENCA_MINIMA
+) -> list[str]:
+    """
+    Compara as medianas de cada etapa com a baseline. Retorna uma descrição
+    por regressão (lista vazia = sem regressões). Casos/etapas ausentes em
+    qualquer um dos lados são ignorados.
+    """
+    regressoes = []
+    for caso, etapas in atual.get("cases", {}).items():
+        referencia = baseline.get("cases", {}).get(caso, {})
+        for etapa, medida in etapas.items():
+            if etapa not in referencia:
+                continue
+            antes, agora = referencia[etapa]["median"], medida["median"]
+            if agora > antes * (1 + tolerancia) and agora - antes > minimo:
+                regressoes.append(f"{caso}/{etapa}: {antes:.3f}s → {agora:.3f}s (+{(agora / antes - 1) * 100:.0f}%)")
+    return regressoes
+
+
+def renders_simultaneos(video: str, musica: str, saida_base: str, agendado: bool) -> None:
+    """CONCORRENCIA renders com transcode em paralelo, com ou sem o agendador de CPU."""
+    from scripts import edit
+
+    ativo = edit.agendador.ativo
+    edit.agendador.ativo = agendado
+    try:
+        with ThreadPoolExecutor(max_workers=CONCORRENCIA) as pool:
+            list(pool.map(
+                lambda i: edit.adicionar_musica(
+                    video, musica, IMPACTO_VIDEO, f"{saida_base}_{i}.mp4", IMPACTO_MUSICA,
+                    debug=False, modo="single", video_modo="transcode"
+                ),
+                range(CONCORRENCIA)
+            ))
+    finally:
+        edit.agendador.ativo = ativo
+
+
+def _ffmpeg_versao() -> str:
+    proc = subprocess.run(["ffmpeg", "-version"], capture_output=True, text=True)
+    return proc.stdout.splitlines()[0] if proc.stdout else "desconhecida"
+
+
+def _limpar_processados() -> None:
+    """Remove as saídas (e o cache de renders) para medir o caminho sem cache."""
+    for arquivo in os.listdir("processed"):
+        caminho = os.path.join("processed", arquivo)
+        if os.path.isfile(caminho) and not arquivo.endswith(".lock"):
+            os.remove(caminho)
+
+
+def _executar_casos(casos: list[tuple[int, int, int]], repeticoes: int) -> dict:
+    """Roda todos os casos no diretório de trabalho atual (temporário)."""
+    from scripts import edit
+    from scripts.probe import sondar
+    from fastapi.testclient import TestClient
+    import api.app as app_mod
+
+    client = TestClient(app_mod.app)
+    os.makedirs("cookies", exist_ok=True)
+    with open(app_mod.SESSION_FILE_PATH, "w") as f:
+        f.write("# Netscape HTTP Cookie File\n")
+
+    fontes = {}
+
+    def baixar_falso(url, cookie_file_path=None, destino="videos/", nome_arquivo=None, perfil=None, ao_receber=None):
+        """Substitui o yt-dlp: copia o vídeo sintético do caso."""
+        caminho = os.path.join(destino, f"{nome_arquivo}.mp4")
+        shutil.copyfile(fontes[url], caminho)
+        return caminho
+
+    app_mod.download_cache.baixar = baixar_falso
+
+    resultados = {}
+    try:
+        for duracao, largura, altura in casos:
+            caso = f"{duracao}s_{largura}x{altura}"
+            print(f"⏱️ Caso {caso}…")
+
+            video = os.path.abspath(os.path.join("fontes", f"{caso}.mp4"))
+            musica = os.path.abspath(os.path.join("music", f"bench_{duracao}.mp3"))
+            gerar_video(video, duracao, largura, altura)
+            gerar_musica(musica, duracao + 20)
+            url = f"https://www.instagram.com/reel/BENCH{duracao}x{altura}/"
+            fontes[url] = video
+
+            start = IMPACTO_MUSICA - IMPACTO_VIDEO
+            wav = os.path.abspath(os.path.join("processed", f"bench_{caso}.wav"))
+            saida = os.path.abspath(os.path.join("processed", f"bench_{caso}.mp4"))
+            pedido = {
+                "url": url,
+                "music": f"bench_{duracao}",
+                "impact_music": IMPACTO_MUSICA,
+                "impact_video": IMPACTO_VIDEO,
+            }
+
+            def endpoint(formato: str = "url"):
+                response = client.post("/processar", json={**pedido, "return_format": formato})
+                if response.status_code != 200:
+                    raise RuntimeError(f"/processar retornou {response.status_code}: {response.text[:500]}")
+                return response.content
+
+            etapas = {
+                "probe": medir(lambda: sondar(video, memorizar=False), repeticoes),
+                "audio_cut": medir(
+                    lambda: edit._run(edit._cmd_audio_alinhado(musica, start, duracao, 6.0, wav), quiet=True),
+                    repeticoes
+                ),
+                "mux": medir(
+                    lambda: edit._run(edit._cmd_mux(video, wav, saida), quiet=True),
+                    repeticoes
+                ),
+                "render_single": medir(
+                    lambda: edit.adicionar_musica(video, musica, IMPACTO_VIDEO, saida, IMPACTO_MUSICA, debug=False, modo="single"),
+                    repeticoes
+                ),
+                "render_two_pass": medir(
+                    lambda: edit.adicionar_musica(video, musica, IMPACTO_VIDEO, saida, IMPACTO_MUSICA, debug=False, modo="two_pass"),
+                    repeticoes
+                ),
+                "endpoint": medir(endpoint, repeticoes, preparar=_limpar_processados),
+            }
+            etapas["endpoint_cached"] = medir(endpoint, repeticoes)
+            etapas["response_base64"] = medir(lambda: endpoint("base64"), repeticoes)
+            base_concorrente = os.path.abspath(os.path.join("processed", f"bench_{caso}_concorrente"))
+            etapas["render_concurrent"] = medir(
+                lambda: renders_simultaneos(video, musica, base_concorrente, agendado=True), repeticoes
+            )
+            etapas["render_concurrent_unscheduled"] = medir(
+                lambda: renders_simultaneos(video, musica, base_concorrente, agendado=False), repeticoes
+            )
+            resultados[caso] = etapas
+
+            for etapa, medida in etapas.items():
+                print(f"   {etapa:<30} {medida['median']:.3f}s")
+    finally:
+        app_mod.jobs.encerrar()
+
+    return resultados
+
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark offline do render com mídia sintética")
+    parser.add_argument("--rapido", action="store_true", help="só o menor caso")
+    parser.add_argument("--repeticoes", type=int, default=3)
+    parser.add_argument("--saida", default=SAIDA_PADRAO, help="JSON com os resultados")
+    parser.add_argument("--baseline", default=BASELINE_PADRAO)
+    parser.add_argument("--salvar-baseline", action="store_true", help="grava os resultados como baseline")
+    parser.add_argument("--tolerancia", type=float, default=TOLERANCIA_PADRAO,
+                        help="fração acima da baseline considerada regressão (padrão 0.5 = +50%%)")
+    parser.add_argument("--ci", action="store_true",
+                        help="modo CI: falha (código 3) se a baseline não existir, em vez de só medir")
+    args = parser.parse_args(argv)
+
+    # Confere antes de medir: um gate sem baseline passaria sempre
+    if args.ci and not args.salvar_baseline and not os.path.exists(args.baseline):
+        print(f"❌ Baseline não encontrada: {args.baseline} (obrigatória com --ci)")
+        return 3
+
+    if not (shutil.which("ffmpeg") and shutil.which("ffprobe")):
+        print("❌ ffmpeg/ffprobe não encontrados no PATH")
+        return 2
+
+    raiz = os.path.dirname(DIR_BENCHMARKS)
+    if raiz not in sys.path:
+        sys.path.insert(0, raiz)
+    from scripts.agendador import agendador
+
+    trabalho = tempfile.mkdtemp(prefix="clip-editor-bench-")
+    cwd = os.getcwd()
+    os.chdir(trabalho)
+    try:
+        # Diretório de trabalho isolado: a API cria music/, processed/ etc. aqui
+        os.makedirs("fontes", exist_ok=True)
+        os.makedirs("music", exist_ok=True)
+        casos = _executar_casos(CASOS_RAPIDOS if args.rapido else CASOS, args.repeticoes)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(trabalho, ignore_errors=True)
+
+    resultado = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "ffmpeg": _ffmpeg_versao(),
+            "repeticoes": args.repeticoes,
+            "concorrencia": CONCORRENCIA,
+            "agendador": agendador.estatisticas(),
+        },
+        "cases": casos,
+    }
+    with open(args.saida, "w", encoding="utf-8") as f:
+        json.dump(resultado, f, indent=2, ensure_ascii=False)
+    print(f"📄 Resultados: {args.saida}")
+
+    if args.salvar_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(resultado, f, indent=2, ensure_ascii=False)
+        print(f"📌 Baseline atualizada: {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("ℹ️ Sem baseline para comparar (use --salvar-baseline)")
+        return 0
+
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    regressoes = comparar(resultado, baseline, args.tolerancia)
+    if regressoes:
+        print("❌ Regressões em relação à baseline:")
+        for r in regressoes:
+            print(f"   {r}")
+        return 1
+    print("✅ Nenhuma etapa acima da baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,121 @@
+# scripts/agendador.py
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import fcntl
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+from scripts.metricas import REGISTRO
+
+
+# =========================
+# Configuração
+# =========================
+
+# 0 desliga o agendador (cada encode usa as threads padrão do ffmpeg, sem limite)
+CPU_SCHEDULER = os.getenv("CPU_SCHEDULER", "1") == "1"
+# Encodes simultâneos na máquina inteira (todos os workers); 0 = núcleos / 2
+CPU_SLOTS = int(os.getenv("CPU_SLOTS", "0") or 0)
+# Arquivos de vaga (um por slot), compartilhados pelos processos do uvicorn
+CPU_SLOTS_DIR = os.getenv("CPU_SLOTS_DIR", "cache/cpu-slots")
+
+# Espera entre tentativas quando todas as vagas estão ocupadas (cresce até o máximo)
+_ESPERA_INICIAL = 0.02
+_ESPERA_MAXIMA = 0.5
+
+
+def nucleos_disponiveis() -> int:
+    """Núcleos que este processo pode usar (respeita affinity/cpuset de contêiner)."""
+    try:
+        return len(os.sched_getaffinity(0)) or 1
+    except (AttributeError, OSError):
+        return os.cpu_count() or 1
+
+
+ESPERA_SEGUNDOS = REGISTRO.histograma(
+    "clip_cpu_slot_wait_seconds", "Espera por uma vaga de encode no agendador de CPU"
+)
+VAGAS_OCUPADAS = REGISTRO.medidor(
+    "clip_cpu_slots_held", "Vagas de encode ocupadas por este worker"
+)
+
+
+# =========================
+# Agendador
+# =========================
+
+class AgendadorCpu:
+    """
+    Limita os encodes simultâneos na máquina a 'slots' e divide os núcleos
+    entre eles.
+
+    Cada vaga é um arquivo em 'diretorio' travado com flock enquanto o encode
+    roda, então o limite vale entre threads e entre os workers do uvicorn, e
+    uma vaga é liberada sozinha se o processo morrer. Cada encode recebe
+    'threads' = núcleos // slots, para que o total não passe do hardware.
+    """
+
+    def __init__(
+        self,
+        slots: int = CPU_SLOTS,
+        nucleos: Optional[int] = None,
+        diretorio: str = CPU_SLOTS_DIR,
+        ativo: bool = CPU_SCHEDULER
+    ):
+        self.nucleos = nucleos or nucleos_disponiveis()
+        self.slots = slots if slots > 0 else max(1, self.nucleos // 2)
+        self.threads = max(1, self.nucleos // self.slots)
+        self.diretorio = diretorio
+        self.ativo = ativo
+
+    def _tentar(self) -> Optional[object]:
+        """Trava a primeira vaga livre e retorna o arquivo aberto (ou None)."""
+        for i in range(self.slots):
+            f = open(os.path.join(self.diretorio, f"slot-{i}.lock"), "a")
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return f
+            except BlockingIOError:
+                f.close()
+        return None
+
+    @contextmanager
+    def reservar(self) -> Iterator[Optional[int]]:
+        """
+        Espera uma vaga e entrega quantas threads o encode deve usar.
+        Com o agendador desligado, entrega None na hora (sem limite).
+        """
+        if not self.ativo:
+            yield None
+            return
+
+        os.makedirs(self.diretorio, exist_ok=True)
+        inicio = time.perf_counter()
+        espera = _ESPERA_INICIAL
+        vaga = self._tentar()
+        while vaga is None:
+            time.sleep(espera)
+            espera = min(espera * 2, _ESPERA_MAXIMA)
+            vaga = self._tentar()
+        ESPERA_SEGUNDOS.observe(time.perf_counter() - inicio)
+
+        try:
+            with VAGAS_OCUPADAS.rastrear():
+                yield self.threads
+        finally:
+            fcntl.flock(vaga, fcntl.LOCK_UN)
+            vaga.close()
+
+    def estatisticas(self) -> dict:
+        return {
+            "enabled": self.ativo,
+            "cores": self.nucleos,
+            "slots": self.slots,
+            "threads_per_encode": self.threads,
+        }
+
+
+# Instância usada pelo render (edit._run)
+agendador = AgendadorCpu()
@@ -0,0 +1,216 @@
+# scripts/armazenamento.py
+# -*- coding: utf-8 -*-
+
+import os
+import re
+import time
+import shutil
+import threading
+from typing import Optional
+
+from scripts.download import DOWNLOAD_CACHE_TTL, DOWNLOAD_CACHE_MAX_BYTES
+from scripts.render_cache import RENDER_CACHE_MAX_BYTES, RENDER_CACHE_TTL
+from scripts.utils import lock_arquivo, remover_se_livre
+
+
+# =========================
+# Configuração
+# =========================
+
+# Intervalo entre varreduras do gerenciador em segundo plano (0 = desligado)
+STORAGE_SWEEP_INTERVAL = int(os.getenv("STORAGE_SWEEP_INTERVAL", "300"))
+# Temporários (WAV/vídeo intermediário, .part do yt-dlp, .tmp) mais velhos que isso são órfãos
+STORAGE_TEMP_TTL = int(os.getenv("STORAGE_TEMP_TTL", "3600"))
+# Arquivos mais novos que isso nunca são despejados (acabaram de ser gerados/entregues)
+STORAGE_MIN_AGE = int(os.getenv("STORAGE_MIN_AGE", "60"))
+# Lock que evita dois workers varrendo ao mesmo tempo
+STORAGE_LOCK = os.getenv("STORAGE_LOCK", "cache/storage.lock")
+
+# Intermediários do render (edit.py) e parciais do yt-dlp
+_TEMPORARIO = re.compile(r"^(audio|video)_[0-9a-f]{32}\.(wav|mp4)$|\.(part|ytdl)$|\.temp\.|\.tmp(\.mp4)?$")
+
+
+def politicas_padrao() -> list[dict]:
+    """Orçamentos de videos/ (cache de downloads) e processed/ (cache de renders)."""
+    return [
+        {"diretorio": "videos", "max_bytes": DOWNLOAD_CACHE_MAX_BYTES, "ttl": DOWNLOAD_CACHE_TTL},
+        {"diretorio": "processed", "max_bytes": RENDER_CACHE_MAX_BYTES, "ttl": RENDER_CACHE_TTL},
+    ]
+
+
+def _sidecar(caminho: str) -> str:
+    """Metadados do cache de renders (ver RenderCache._meta_path)."""
+    return os.path.join(os.path.dirname(caminho), f".{os.path.basename(caminho)}.json")
+
+
+# =========================
+# Gerenciador
+# =========================
+
+class GerenciadorArmazenamento:
+    """
+    Mantém cada diretório de mídia dentro do seu orçamento de disco.
+
+    Cada política é um dict com 'diretorio', 'max_bytes' e 'ttl' (segundos
+    desde o último uso; 0 = sem TTL). A varredura:
+    - remove temporários órfãos (mais velhos que 'temporarios_ttl');
+    - remove arquivos expirados e, se o total ainda passar de 'max_bytes',
+      os usados há mais tempo (LRU por mtime);
+    - nunca remove arquivos mais novos que 'idade_minima' nem arquivos em uso
+      (sendo entregues a um cliente ou lidos por um render, ver utils.em_uso).
+
+    Roda em uma thread de fundo a cada 'intervalo' segundos; entre os workers
+    do uvicorn, só um varre por vez.
+    """
+
+    def __init__(
+        self,
+        politicas: Optional[list[dict]] = None,
+        intervalo: int = STORAGE_SWEEP_INTERVAL,
+        temporarios_ttl: int = STORAGE_TEMP_TTL,
+        idade_minima: int = STORAGE_MIN_AGE,
+        lock_path: str = STORAGE_LOCK
+    ):
+        self.politicas = politicas if politicas is not None else politicas_padrao()
+        self.intervalo = intervalo
+        self.temporarios_ttl = temporarios_ttl
+        self.idade_minima = idade_minima
+        self.lock_path = lock_path
+        self.ultima_varredura = None
+        self._parar = threading.Event()
+        self._thread = None
+
+    # ---------- inventário ----------
+
+    def _arquivos(self, diretorio: str) -> list[tuple[float, int, str, bool]]:
+        """(mtime, tamanho, caminho, temporario) dos arquivos de mídia do diretório."""
+        if not os.path.isdir(diretorio):
+            return []
+        entradas = []
+        for arquivo in os.listdir(diretorio):
+            caminho = os.path.join(diretorio, arquivo)
+            if arquivo.endswith((".lock", ".json")) or not os.path.isfile(caminho):
+                continue
+            temporario = bool(_TEMPORARIO.search(arquivo))
+            # Ocultos só os temporários (render em andamento); o resto é controle
+            if arquivo.startswith(".") and not temporario:
+                continue
+            try:
+                st = os.stat(caminho)
+            except FileNotFoundError:
+                continue
+            entradas.append((st.st_mtime, st.st_size, caminho, temporario))
+        return entradas
+
+    def _remover(self, caminho: str) -> bool:
+        if not remover_se_livre(caminho):
+            return False
+        try:
+            os.remove(_sidecar(caminho))
+        except FileNotFoundError:
+            pass
+        return True
+
+    # ---------- varredura ----------
+
+    def varrer_diretorio(self, politica: dict, agora: Optional[float] = None) -> dict:
+        """Aplica a política a um diretório; retorna o que foi removido/preservado."""
+        agora = agora or time.time()
+        ttl, max_bytes = politica.get("ttl") or 0, politica["max_bytes"]
+        entradas = self._arquivos(politica["diretorio"])
+        total = sum(tamanho for _, tamanho, _, _ in entradas)
+        removidos, em_uso = [], []
+
+        for mtime, tamanho, caminho, temporario in sorted(entradas):
+            idade = agora - mtime
+            if temporario:
+                remover = idade > self.temporarios_ttl
+            else:
+                remover = idade >= self.idade_minima and ((ttl and idade > ttl) or total > max_bytes)
+            if not remover:
+                continue
+            if self._remover(caminho):
+                total -= tamanho
+                removidos.append(caminho)
+                print(f"🧹 Removido ({'temporário' if temporario else 'orçamento/TTL'}): {caminho}")
+            else:
+                em_uso.append(caminho)
+
+        return {"removed": removidos, "in_use": em_uso, "bytes": total}
+
+    def varrer(self) -> Optional[dict]:
+        """
+        Varre todos os diretórios. Retorna {diretorio: resultado} ou None se
+        outro worker já estiver varrendo.
+        """
+        with lock_arquivo(self.lock_path, bloquear=False) as livre:
+            if not livre:
+                return None
+            agora = time.time()
+            resultado = {p["diretorio"]: self.varrer_diretorio(p, agora) for p in self.politicas}
+            self.ultima_varredura = agora
+            return resultado
+
+    def esvaziar(self) -> dict:
+        """
+        Remove toda a mídia dos diretórios geridos, exceto arquivos em uso e
+        temporários ainda ativos (renders em andamento). Usado por DELETE /cleanup.
+        """
+        agora = time.time()
+        removidos, em_uso = [], []
+        for politica in self.politicas:
+            for mtime, _, caminho, temporario in self._arquivos(politica["diretorio"]):
+                if temporario and agora - mtime <= self.temporarios_ttl:
+                    em_uso.append(caminho)
+                elif self._remover(caminho):
+                    removidos.append(caminho)
+                else:
+                    em_uso.append(caminho)
+        return {"removed": removidos, "in_use": em_uso}
+
+    # ---------- relatório ----------
+
+    def uso(self) -> dict:
+        """Uso de disco de cada diretório frente ao orçamento, e espaço livre no volume."""
+        diretorios = {}
+        for politica in self.politicas:
+            entradas = self._arquivos(politica["diretorio"])
+            total = sum(tamanho for _, tamanho, _, _ in entradas)
+            diretorios[politica["diretorio"]] = {
+                "bytes": total,
+                "files": sum(1 for *_, temporario in entradas if not temporario),
+                "temporary_files": sum(1 for *_, temporario in entradas if temporario),
+                "max_bytes": politica["max_bytes"],
+                "ttl": politica.get("ttl") or None,
+                "usage_ratio": round(total / politica["max_bytes"], 4) if politica["max_bytes"] else None,
+            }
+        disco = shutil.disk_usage(".")
+        return {
+            "directories": diretorios,
+            "disk": {"total": disco.total, "used": disco.used, "free": disco.free},
+            "last_sweep": self.ultima_varredura,
+            "sweep_interval": self.intervalo,
+        }
+
+    # ---------- segundo plano ----------
+
+    def _loop(self) -> None:
+        while not self._parar.wait(self.intervalo):
+            try:
+                self.varrer()
+            except Exception as e:
+                print(f"⚠️ Falha na varredura de armazenamento: {e}")
+
+    def iniciar(self) -> None:
+        """Inicia a varredura periódica (no-op se intervalo <= 0 ou já iniciada)."""
+        if self.intervalo <= 0 or self._thread is not None:
+            return
+        self._parar.clear()
+        self._thread = threading.Thread(target=self._loop, name="armazenamento", daemon=True)
+        self._thread.start()
+
+    def parar(self) -> None:
+        self._parar.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
@@ -0,0 +1,194 @@
+# scripts/catalog.py
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import sqlite3
+import hashlib
+from pathlib import Path
+from typing import Callable, Optional
+
+
+# =========================
+# Configuração
+# =========================
+
+EXTENSOES_AUDIO = ('.mp3', '.wav', '.m4a', '.flac', '.ogg')
+ORDENACOES = ("name", "duration", "size_bytes", "mtime")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS musics (
+    filename   TEXT PRIMARY KEY,
+    name       TEXT NOT NULL,
+    size_bytes INTEGER NOT NULL,
+    mtime_ns   INTEGER NOT NULL,
+    duration   REAL,
+    codec      TEXT,
+    format     TEXT,
+    sha256     TEXT,
+    indexed_at REAL NOT NULL
+)
+"""
+
+
+def hash_arquivo(caminho: str, chunk_size: int = 1024 * 1024) -> str:
+    """SHA-256 do conteúdo do arquivo, lido em blocos (memória constante)."""
+    h = hashlib.sha256()
+    with open(caminho, "rb") as f:
+        for bloco in iter(lambda: f.read(chunk_size), b""):
+            h.update(bloco)
+    return h.hexdigest()
+
+
+# =========================
+# Catálogo persistente
+# =========================
+
+class MusicCatalog:
+    """
+    Índice persistente (SQLite) da pasta de músicas.
+
+    Guarda duração, codec, formato, tamanho, mtime e hash do conteúdo de cada
+    faixa, para que a listagem não precise rodar ffprobe por arquivo.
+    Entradas cujo tamanho/mtime mudaram no disco são reindexadas sob demanda
+    em sincronizar(); arquivos removidos por fora da API saem do índice.
+
+    'probe' recebe o caminho do arquivo e retorna dict com 'duration',
+    'codec' e 'format' (levanta exceção se o áudio for inválido).
+    """
+
+    def __init__(self, music_dir: str, probe: Callable[[str], dict], db_path: Optional[str] = None):
+        self.music_dir = music_dir
+        self.probe = probe
+        self.db_path = db_path or os.path.join(music_dir, ".catalog.sqlite3")
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        with self._conectar() as conn:
+            conn.execute(_SCHEMA)
+
+    def _conectar(self) -> sqlite3.Connection:
+        # Uma conexão por operação: o catálogo é usado de várias threads/processos
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    # ---------- escrita ----------
+
+    def registrar(self, caminho: str, info: Optional[dict] = None) -> dict:
+        """
+        Indexa (ou reindexa) um arquivo. Se 'info' já vier de uma validação
+        anterior, o probe não é repetido.
+        """
+        st = os.stat(caminho)
+        if info is None:
+            try:
+                info = self.probe(caminho)
+            except Exception as e:
+                print(f"⚠️ Não foi possível indexar {caminho}: {e}")
+                info = {}
+
+        registro = {
+            "filename": os.path.basename(caminho),
+            "name": Path(caminho).stem,
+            "size_bytes": st.st_size,
+            "mtime_ns": st.st_mtime_ns,
+            "duration": info.get("duration"),
+            "codec": info.get("codec"),
+            "format": info.get("format"),
+            "sha256": hash_arquivo(caminho),
+            "indexed_at": time.time(),
+        }
+        with self._conectar() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO musics "
+                "(filename, name, size_bytes, mtime_ns, duration, codec, format, sha256, indexed_at) "
+                "VALUES (:filename, :name, :size_bytes, :mtime_ns, :duration, :codec, :format, :sha256, :indexed_at)",
+                registro
+            )
+        return registro
+
+    def remover(self, filename: str) -> None:
+        """Remove a entrada de um arquivo do índice."""
+        with self._conectar() as conn:
+            conn.execute("DELETE FROM musics WHERE filename = ?", (filename,))
+
+    def sincronizar(self) -> None:
+        """
+        Confere o índice contra o disco (listdir + stat, sem ffprobe):
+        - arquivos novos ou com tamanho/mtime diferentes são reindexados
+        - entradas de arquivos que sumiram são removidas
+        """
+        if not os.path.isdir(self.music_dir):
+            return
+
+        with self._conectar() as conn:
+            indexados = {
+                row["filename"]: (row["size_bytes"], row["mtime_ns"])
+                for row in conn.execute("SELECT filename, size_bytes, mtime_ns FROM musics")
+            }
+
+        presentes = set()
+        for arquivo in os.listdir(self.music_dir):
+            if not arquivo.lower().endswith(EXTENSOES_AUDIO):
+                continue
+            caminho = os.path.join(self.music_dir, arquivo)
+            if not os.path.isfile(caminho):
+                continue
+            presentes.add(arquivo)
+            st = os.stat(caminho)
+            if indexados.get(arquivo) != (st.st_size, st.st_mtime_ns):
+                self.registrar(caminho)
+
+        for arquivo in set(indexados) - presentes:
+            self.remover(arquivo)
+
+    # ---------- leitura ----------
+
+    def obter(self, filename: str) -> Optional[dict]:
+        """Retorna a entrada de um arquivo ou None se não estiver indexado."""
+        with self._conectar() as conn:
+            row = conn.execute("SELECT * FROM musics WHERE filename = ?", (filename,)).fetchone()
+        return dict(row) if row else None
+
+    def hash_atual(self, caminho: str) -> str:
+        """
+        SHA-256 da música em 'caminho': o do índice se tamanho e mtime ainda
+        batem, senão reindexa o arquivo (e relê o conteúdo).
+        """
+        entrada = self.obter(os.path.basename(caminho))
+        st = os.stat(caminho)
+        if entrada and (entrada["size_bytes"], entrada["mtime_ns"]) == (st.st_size, st.st_mtime_ns):
+            return entrada["sha256"]
+        return self.registrar(caminho)["sha256"]
+
+    def listar(
+        self,
+        offset: int = 0,
+        limit: Optional[int] = None,
+        sort: str = "name",
+        order: str = "asc",
+        prefix: Optional[str] = None
+    ) -> tuple[list[dict], int]:
+        """
+        Lista as músicas indexadas com paginação, ordenação e filtro por prefixo
+        do nome (sem diferenciar maiúsculas). Retorna (página, total filtrado).
+        """
+        if sort not in ORDENACOES:
+            raise ValueError(f"Ordenação inválida: {sort}. Use: {', '.join(ORDENACOES)}")
+        if order not in ("asc", "desc"):
+            raise ValueError("Ordem inválida. Use: asc ou desc")
+
+        coluna = "mtime_ns" if sort == "mtime" else sort
+        where, params = "", []
+        if prefix:
+            where = "WHERE lower(substr(name, 1, ?)) = lower(?)"
+            params = [len(prefix), prefix]
+
+        with self._conectar() as conn:
+            total = conn.execute(f"SELECT COUNT(*) FROM musics {where}", params).fetchone()[0]
+            rows = conn.execute(
+                f"SELECT * FROM musics {where} ORDER BY {coluna} {order.upper()}, filename ASC "
+                "LIMIT ? OFFSET ?",
+                [*params, -1 if limit is None else limit, offset]
+            ).fetchall()
+        return [dict(r) for r in rows], total
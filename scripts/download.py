@@ -1,50 +1,347 @@
-import yt_dlp
 import os
-from glob import glob
+import time
+import json
+import hashlib
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+from glob import glob, escape as glob_escape
+from yt_dlp.extractor import gen_extractor_classes
+from scripts.metricas import registrar_cache, registrar_etapa
+from scripts.processos import Cancelado, TempoEsgotado, cancelamento_atual, timeout_etapa
+from scripts.sessoes_ytdlp import PoolYtdlp
+from scripts.utils import lock_arquivo, remover_se_livre
 
-def baixar_reel(url, cookie_file_path=None, destino="videos/"):
-    os.makedirs(destino, exist_ok=True)
-    
-    # Configurações básicas do yt-dlp
-    ydl_opts = {
-        'format': 'bestvideo+bestaudio/best',
-        'merge_output_format': 'mp4',
-        'outtmpl': os.path.join(destino, '%(title)s.%(ext)s'),
-        'http_headers': {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/100.0.4896.75 Safari/537.36',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
-            'Accept-Language': 'en-US,en;q=0.5',
-            'Sec-Fetch-Mode': 'navigate',
-        },
-        'compat_opts': ['no-abort-on-error', 'no-check-certificates'],
-        'no_warnings': True,
+# Cache de downloads: tempo de vida desde o último uso e orçamento de disco
+DOWNLOAD_CACHE_TTL = int(os.getenv("DOWNLOAD_CACHE_TTL", "3600"))
+DOWNLOAD_CACHE_MAX_BYTES = int(os.getenv("DOWNLOAD_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))
+# Conexão sem resposta por mais que isso (s) falha, em vez de prender o download
+DOWNLOAD_SOCKET_TIMEOUT = float(os.getenv("DOWNLOAD_SOCKET_TIMEOUT", "30"))
+
+# Perfis de download, pelo nome do perfil de encode (ver PERFIS_ENCODER em edit.py):
+# - max_res: menor dimensão do vídeo (720 = 720p, horizontal ou vertical); None = sem limite
+# - max_kbps: bitrate do vídeo; None = sem limite
+# - audio: baixa também o áudio original (e faz o merge); o render troca o áudio, então o padrão é não
+# Os limites são preferências: sem formato dentro deles, vem o menor acima.
+# DOWNLOAD_PROFILES (JSON) ajusta ou acrescenta perfis, ex.: {"standard": {"max_res": 720}}
+PERFIS_DOWNLOAD = {
+    "preview": {"max_res": 720, "max_kbps": 2500, "audio": False},
+    "standard": {"max_res": 1080, "max_kbps": 8000, "audio": False},
+    "archival": {"max_res": None, "max_kbps": None, "audio": False},
+}
+for _nome, _ajustes in json.loads(os.getenv("DOWNLOAD_PROFILES", "{}")).items():
+    PERFIS_DOWNLOAD[_nome] = {**PERFIS_DOWNLOAD.get(_nome, PERFIS_DOWNLOAD["standard"]), **_ajustes}
+
+# Opções base do yt-dlp (cookies e hooks entram por sessão/download, ver PoolYtdlp)
+OPCOES_YTDLP = {
+    'format': 'bestvideo+bestaudio/best',
+    'merge_output_format': 'mp4',
+    'http_headers': {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/100.0.4896.75 Safari/537.36',
+        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+        'Accept-Language': 'en-US,en;q=0.5',
+        'Sec-Fetch-Mode': 'navigate',
+    },
+    'compat_opts': ['no-abort-on-error', 'no-check-certificates'],
+    'no_warnings': True,
+    'socket_timeout': DOWNLOAD_SOCKET_TIMEOUT,
+}
+
+# YoutubeDLs aquecidos deste worker (criados sob demanda)
+pool_ytdlp = PoolYtdlp(OPCOES_YTDLP)
+
+
+def _perfil_download(nome):
+    """Perfil de download do perfil de encode 'nome' (perfis sem entrada usam o 'standard')."""
+    return PERFIS_DOWNLOAD.get(nome or "standard", PERFIS_DOWNLOAD["standard"])
+
+
+def opcoes_formato(perfil=None):
+    """
+    Opções de formato do yt-dlp para o perfil: só o stream de vídeo (sem
+    merge), a maior resolução/bitrate dentro dos limites e, entre esses,
+    H.264 em MP4 (que o render copia sem reencode).
+    """
+    p = _perfil_download(perfil)
+    ordem = []
+    if p.get("max_res"):
+        ordem.append(f"res:{int(p['max_res'])}")
+    ordem.append("vcodec:h264")
+    if p.get("max_kbps"):
+        ordem.append(f"tbr:{int(p['max_kbps'])}")
+    ordem.append("ext:mp4:m4a")
+    return {
+        # 'bv' é vídeo sem áudio; sites que só têm formatos combinados caem no 'b'
+        'format': 'bv+ba/b' if p.get("audio") else 'bv/b',
+        'format_sort': ordem,
     }
-    
-    if cookie_file_path:
-        ydl_opts['cookiefile'] = cookie_file_path
-    
-    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-        try:
-            print("Configurações de download:", ydl_opts)
-            info = ydl.extract_info(url, download=True)
-            
-            # Tenta pegar o caminho do arquivo final do info, que é o mais confiável
-            filepath = info.get('filepath')
-            
-            # Se o filepath não for retornado (ex: arquivo já existe), constrói o caminho manualmente
-            if not filepath and 'title' in info:
-                # Usa o 'glob' para encontrar o arquivo que foi baixado (ou já existia)
-                # O yt-dlp pode adicionar o ID do vídeo ao nome, então o glob é mais seguro
-                files = glob(os.path.join(destino, f"{info['title']}*.mp4"))
-                if files:
-                    filepath = files[0]
-            
-            if filepath and os.path.exists(filepath):
-                return filepath
-            
-            # Se ainda assim não encontramos o arquivo, algo falhou.
-            raise Exception("O yt-dlp não conseguiu retornar o caminho do vídeo baixado ou existente.")
-
-        except Exception as e:
-            print(f"Erro ao baixar o vídeo: {e}")
-            return None
\ No newline at end of file
+
+
+def sufixo_formato(perfil=None):
+    """Identifica o formato pedido no nome do arquivo em cache (ex.: 'v1080', 'vmax-a')."""
+    p = _perfil_download(perfil)
+    sufixo = f"v{int(p['max_res'])}" if p.get("max_res") else "vmax"
+    if p.get("max_kbps"):
+        sufixo += f"-{int(p['max_kbps'])}k"
+    return sufixo + ("-a" if p.get("audio") else "")
+
+
+# =========================
+# Relatório do download
+# =========================
+
+# Relatório do download do pedido atual (ver relatar_download)
+_relatorio: ContextVar = ContextVar("relatorio_download", default=None)
+
+
+@contextmanager
+def relatar_download():
+    """
+    Coleta em um dict o que os downloads deste contexto trouxeram:
+    'bytes' recebidos da rede, 'merge_seconds' (merge de vídeo + áudio pelo
+    yt-dlp), 'format' e 'vcodec' escolhidos, 'cached' (veio do cache de
+    downloads) e 'streamed' (o render leu o vídeo durante o download).
+    """
+    relatorio = {
+        "bytes": 0, "merge_seconds": 0.0, "format": None, "vcodec": None, "cached": False, "streamed": False
+    }
+    token = _relatorio.set(relatorio)
+    try:
+        yield relatorio
+    finally:
+        _relatorio.reset(token)
+
+
+class _Medicao:
+    """Acompanha os eventos do yt-dlp de um download: bytes por arquivo e tempo do merge."""
+
+    def __init__(self):
+        self.bytes = {}
+        self.merge_seconds = 0.0
+        self._inicio_merge = None
+
+    def evento(self, status):
+        if "postprocessor" in status:
+            if status.get("postprocessor") != "Merger":
+                return
+            if status.get("status") == "started":
+                self._inicio_merge = time.perf_counter()
+            elif status.get("status") == "finished" and self._inicio_merge is not None:
+                self.merge_seconds += time.perf_counter() - self._inicio_merge
+                self._inicio_merge = None
+        elif status.get("downloaded_bytes") is not None:
+            # Um arquivo já existente não tem 'downloaded_bytes' (nada veio da rede)
+            self.bytes[status.get("filename")] = status["downloaded_bytes"]
+
+
+def _caminho_baixado(info, destino, nome_arquivo):
+    """Arquivo final do download a partir do info do yt-dlp (ou do disco, se já existia)."""
+    for baixado in info.get('requested_downloads') or []:
+        if baixado.get('filepath'):
+            return baixado['filepath']
+    if info.get('filepath'):
+        return info['filepath']
+    if nome_arquivo or 'title' in info:
+        # O yt-dlp pode adicionar o ID do vídeo ao nome, então o glob é mais seguro
+        files = glob(os.path.join(destino, f"{glob_escape(nome_arquivo or info['title'])}*.mp4"))
+        if files:
+            return files[0]
+    return None
+
+
+def baixar_reel(url, cookie_file_path=None, destino="videos/", nome_arquivo=None, pool=None, perfil=None,
+                ao_receber=None):
+    """
+    Baixa o vídeo no formato do perfil 'perfil' (ver opcoes_formato) e
+    retorna o caminho do arquivo, ou None se falhar. Bytes recebidos e tempo
+    do merge vão para as métricas e para relatar_download.
+    'ao_receber', se informado, recebe os eventos de progresso do yt-dlp
+    (com 'tmpfilename', o arquivo parcial, e 'info_dict').
+    """
+    os.makedirs(destino, exist_ok=True)
+    pool = pool or pool_ytdlp
+
+    # O download roda dentro do yt-dlp (sem subprocesso para encerrar): o hook de
+    # progresso interrompe no timeout da etapa ou se o pedido for cancelado
+    timeout = timeout_etapa("download")
+    cancelamento = cancelamento_atual()
+    inicio = time.monotonic()
+
+    medicao = _Medicao()
+
+    def _interromper_se_preciso():
+        if cancelamento is not None:
+            cancelamento.verificar_ou_levantar()
+        if timeout and time.monotonic() - inicio > timeout:
+            raise TempoEsgotado(f"Tempo esgotado ({timeout:.0f}s): download de {url}")
+
+    def _acompanhar(status):
+        medicao.evento(status)
+        if ao_receber is not None and status.get("status") == "downloading":
+            ao_receber(status)
+        _interromper_se_preciso()
+
+    # 'nome_arquivo' fixa o nome de saída (sem extensão); o padrão é o título do vídeo
+    outtmpl = os.path.join(destino, f"{nome_arquivo or '%(title)s'}.%(ext)s")
+
+    try:
+        print(f"⬇️ Baixando {url}")
+        info = pool.baixar(
+            url, outtmpl, cookie_file=cookie_file_path, hook=_acompanhar, opcoes=opcoes_formato(perfil)
+        )
+        _registrar_download(info, medicao)
+
+        filepath = _caminho_baixado(info, destino, nome_arquivo)
+        if filepath and os.path.exists(filepath):
+            return filepath
+
+        # Se ainda assim não encontramos o arquivo, algo falhou.
+        raise Exception("O yt-dlp não conseguiu retornar o caminho do vídeo baixado ou existente.")
+
+    except Exception as e:
+        # O yt-dlp pode embrulhar a exceção do hook; o estado decide
+        _interromper_se_preciso()
+        if isinstance(e, (Cancelado, TempoEsgotado)):
+            raise
+        print(f"Erro ao baixar o vídeo: {e}")
+        return None
+
+
+def _registrar_download(info, medicao):
+    """Leva bytes, merge e formato escolhido às métricas e ao relatório do pedido."""
+    recebidos = sum(medicao.bytes.values())
+    if medicao.merge_seconds:
+        registrar_etapa("download_merge", medicao.merge_seconds)
+    print(
+        f"📦 Formato {info.get('format_id')} ({info.get('vcodec') or '?'}, {info.get('resolution') or '?'}): "
+        f"{recebidos / 1024 ** 2:.1f} MB, merge {medicao.merge_seconds:.2f}s"
+    )
+    relatorio = _relatorio.get()
+    if relatorio is not None:
+        relatorio["bytes"] += recebidos
+        relatorio["merge_seconds"] = round(relatorio["merge_seconds"] + medicao.merge_seconds, 4)
+        relatorio.update(format=info.get("format_id"), vcodec=info.get("vcodec"))
+
+
+@lru_cache(maxsize=1024)
+def chave_video(url):
+    """
+    Chave estável do vídeo a partir da URL, sem acessar a rede:
+    '<Extractor>-<id>' (ex.: 'Instagram-DKciWlhRFRE') quando algum extractor
+    do yt-dlp reconhece a URL; senão, um hash da própria URL.
+    """
+    for ie in gen_extractor_classes():
+        if ie.ie_key() == 'Generic' or not ie.suitable(url):
+            continue
+        video_id = ie.get_temp_id(url)
+        if video_id:
+            seguro = "".join(c for c in str(video_id) if c.isalnum() or c in ('-', '_'))
+            if seguro:
+                return f"{ie.ie_key()}-{seguro}"
+        break
+    return "url-" + hashlib.sha256(url.strip().encode("utf-8")).hexdigest()[:24]
+
+
+class DownloadCache:
+    """
+    Cache dos vídeos baixados, indexado pela chave do vídeo (ID do extractor)
+    e pelo formato pedido (ver sufixo_formato).
+
+    - "Mesmo reel, várias músicas" reaproveita o arquivo já baixado.
+    - Downloads simultâneos da mesma URL são coalescidos: um lock por chave
+      (flock, vale entre threads e entre workers do uvicorn) faz os demais
+      esperarem o primeiro terminar e então lerem do cache.
+    - Arquivos expiram por TTL desde o último uso e o total em disco é
+      limitado por 'max_bytes' (despejo LRU), em vez de serem apagados a cada pedido.
+    """
+
+    def __init__(
+        self,
+        destino="videos/",
+        ttl=DOWNLOAD_CACHE_TTL,
+        max_bytes=DOWNLOAD_CACHE_MAX_BYTES,
+        baixar=baixar_reel,
+    ):
+        self.destino = destino
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.baixar = baixar
+        os.makedirs(self.destino, exist_ok=True)
+
+    def _lock_path(self, chave):
+        return os.path.join(self.destino, f".{chave}.lock")
+
+    def _procurar(self, chave):
+        """
+        Retorna o arquivo em cache da chave, se existir e não tiver expirado.
+        Deve ser chamado com o lock da chave; cópias expiradas são removidas
+        (senão o yt-dlp as reaproveitaria como "já baixadas"), exceto as que
+        um render ou stream ainda está lendo (em_uso): essas contam como acerto.
+        """
+        for caminho in glob(os.path.join(self.destino, f"{glob_escape(chave)}.*")):
+            if caminho.endswith((".part", ".ytdl")) or ".temp." in caminho:
+                continue
+            if time.time() - os.path.getmtime(caminho) > self.ttl:
+                if remover_se_livre(caminho) or not os.path.exists(caminho):
+                    continue
+            return caminho
+        return None
+
+    def obter(self, url, cookie_file_path=None, perfil=None, ao_receber=None):
+        """
+        Caminho do vídeo da URL no formato do perfil 'perfil' (ver
+        opcoes_formato), baixando apenas se não estiver em cache. Cada formato
+        tem a sua entrada: um vídeo baixado em 720p não atende um pedido em 1080p.
+        'ao_receber' acompanha o download, se houver (ver baixar_reel).
+        """
+        chave = f"{chave_video(url)}__{sufixo_formato(perfil)}"
+
+        with lock_arquivo(self._lock_path(chave)):
+            caminho = self._procurar(chave)
+            registrar_cache("download", hit=bool(caminho))
+            if caminho:
+                print(f"♻️ Vídeo em cache: {caminho}")
+                os.utime(caminho)  # marca uso recente p/ TTL/LRU
+                relatorio = _relatorio.get()
+                if relatorio is not None:
+                    relatorio["cached"] = True
+                return caminho
+
+            caminho = self.baixar(
+                url, cookie_file_path=cookie_file_path, destino=self.destino, nome_arquivo=chave, perfil=perfil,
+                ao_receber=ao_receber
+            )
+
+        if caminho:
+            self.despejar(manter=caminho)
+        return caminho
+
+    def despejar(self, manter=None):
+        """Remove vídeos expirados e, se preciso, os menos usados até caber no orçamento."""
+        agora = time.time()
+        entradas = []
+        for arquivo in os.listdir(self.destino):
+            caminho = os.path.join(self.destino, arquivo)
+            if arquivo.startswith(".") or not os.path.isfile(caminho):
+                continue
+            try:
+                st = os.stat(caminho)
+            except FileNotFoundError:
+                continue
+            entradas.append((st.st_mtime, st.st_size, caminho))
+
+        total = sum(tamanho for _, tamanho, _ in entradas)
+        for mtime, tamanho, caminho in sorted(entradas):
+            if caminho == manter:
+                continue
+            if agora - mtime <= self.ttl and total <= self.max_bytes:
+                continue
+            chave = os.path.basename(caminho).split(".")[0]
+            # Não remove o que está sendo baixado neste momento
+            with lock_arquivo(self._lock_path(chave), bloquear=False) as livre:
+                if not livre:
+                    continue
+                # Nem o que um render está lendo (ver utils.em_uso)
+                if remover_se_livre(caminho):
+                    total -= tamanho
+                    print(f"🧹 Vídeo removido do cache: {caminho}")
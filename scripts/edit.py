@@ -5,8 +5,20 @@ import os
 import uuid
 import json
 import shlex
+import threading
+import contextvars
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 from pathlib import Path
+from typing import Callable, Iterable, Optional
+
+from scripts.agendador import agendador
+from scripts.fluxo import SaidaProgressiva, entrada_crescente, saida_fragmentada
+from scripts.pcm_cache import PcmCache, FFMPEG_INPUT_PCM, TAXA, fatiar, blocos
+from scripts.metricas import etapa, tamanho
+from scripts.probe import sondar, duracao
+from scripts.processos import Cancelado, executar, timeout_etapa
 
 
 # =========================
@@ -16,11 +28,108 @@ from pathlib import Path
 def _abspath(p: str) -> str:
     return str(Path(p).expanduser().resolve())
 
-def _run(cmd: list[str], *, quiet: bool = False) -> subprocess.CompletedProcess:
-    """Executa um comando e retorna o CompletedProcess. Levanta exceção com stderr se falhar."""
-    if not quiet:
-        print("CMD:", " ".join(shlex.quote(c) for c in cmd))
-    proc = subprocess.run(cmd, capture_output=True, text=True)
+class _LeitorProgresso:
+    """
+    Interpreta a saída de '-progress pipe:1' do ffmpeg (blocos 'chave=valor'
+    terminados por 'progress=continue|end') e chama 'callback' a cada bloco com
+    {'stage', 'out_time', 'speed', 'percent', 'done'}. 'percent' é relativo a
+    'duracao_total' (None se a duração não for conhecida).
+    """
+
+    def __init__(self, callback: Callable[[dict], None], duracao_total: Optional[float] = None, etapa: str = "render"):
+        self.callback = callback
+        self.duracao_total = duracao_total
+        self.etapa = etapa
+        self._bloco: dict[str, str] = {}
+
+    def linha(self, texto: str) -> None:
+        chave, sep, valor = texto.strip().partition("=")
+        if not sep:
+            return
+        self._bloco[chave] = valor
+        if chave == "progress":
+            bloco, self._bloco = self._bloco, {}
+            self._emitir(bloco)
+
+    def _emitir(self, bloco: dict) -> None:
+        # out_time_ms também vem em microssegundos (nome histórico do ffmpeg)
+        bruto = bloco.get("out_time_us") or bloco.get("out_time_ms")
+        try:
+            out_time = max(0.0, int(bruto) / 1_000_000)
+        except (TypeError, ValueError):
+            out_time = None
+        try:
+            speed = float(bloco.get("speed", "").rstrip("x"))
+        except ValueError:
+            speed = None
+
+        concluido = bloco.get("progress") == "end"
+        percent = None
+        if concluido:
+            percent = 100.0
+        elif out_time is not None and self.duracao_total:
+            percent = round(min(99.9, out_time / self.duracao_total * 100), 1)
+
+        try:
+            self.callback({
+                "stage": self.etapa,
+                "out_time": round(out_time, 3) if out_time is not None else None,
+                "speed": speed,
+                "percent": percent,
+                "done": concluido
+            })
+        except Exception as e:
+            # Progresso é informativo: não derruba o render
+            print(f"⚠️ Falha ao reportar progresso: {e}")
+
+
+def _run(
+    cmd: list[str],
+    *,
+    quiet: bool = False,
+    entrada: Optional[Iterable[bytes]] = None,
+    progresso: Optional[Callable[[dict], None]] = None,
+    duracao_total: Optional[float] = None,
+    nome_etapa: str = "render",
+    timeout: Optional[float] = None,
+    ao_ler_bloco: Optional[Callable[[bytes], None]] = None
+) -> subprocess.CompletedProcess:
+    """
+    Executa um comando e retorna o CompletedProcess. Levanta exceção com stderr se falhar.
+    Se 'entrada' for informada, seus blocos de bytes são enviados ao stdin do processo
+    conforme são gerados (sem montar tudo em memória).
+    Com 'progresso' (só ffmpeg), o comando roda com '-progress pipe:1' e o callback
+    recebe o andamento durante o encode (ver _LeitorProgresso), com o percentual
+    calculado sobre 'duracao_total'.
+    Com 'ao_ler_bloco', o stdout é binário (ex.: vídeo em 'pipe:1') e vai
+    bloco a bloco para o callback; não há progresso nesse caso.
+    O processo roda no executor assíncrono (scripts/processos.py): passa de
+    'timeout' (padrão: o da etapa 'nome_etapa') → TempoEsgotado; pedido
+    cancelado → Cancelado; nos dois casos o grupo de processos é encerrado.
+    Encodes libx264 passam pelo agendador de CPU (ver scripts/agendador.py).
+    Duração, desfecho e bytes de stdin/stdout vão para as métricas (registrados
+    pelo executor, inclusive em timeout ou cancelamento).
+    """
+    ao_ler_linha = None
+    if progresso is not None and ao_ler_bloco is None and os.path.basename(cmd[0]) == "ffmpeg":
+        cmd = [cmd[0], "-progress", "pipe:1", "-nostats", *cmd[1:]]
+        ao_ler_linha = _LeitorProgresso(progresso, duracao_total, nome_etapa).linha
+
+    # Encodes de vídeo esperam uma vaga no agendador de CPU (entre todos os
+    # workers) e recebem '-threads' com a sua parte dos núcleos
+    encode = os.path.basename(cmd[0]) == "ffmpeg" and "libx264" in cmd
+    with agendador.reservar() if encode else nullcontext() as threads:
+        if threads:
+            cmd = [*cmd[:-1], "-threads", str(threads), cmd[-1]]
+        if not quiet:
+            print("CMD:", " ".join(shlex.quote(c) for c in cmd))
+        proc = executar(
+            cmd,
+            timeout=timeout if timeout is not None else timeout_etapa(nome_etapa),
+            entrada=entrada,
+            ao_ler_linha=ao_ler_linha,
+            **({"ao_ler_bloco": ao_ler_bloco} if ao_ler_bloco is not None else {})
+        )
     if proc.returncode != 0:
         raise RuntimeError(
             "Comando falhou:\n"
@@ -29,27 +138,220 @@ def _run(cmd: list[str], *, quiet: bool = False) -> subprocess.CompletedProcess:
         )
     # Loga avisos do ffmpeg/ffprobe quando houver
     if proc.stderr and not quiet:
-        # ffmpeg escreve tudo em stderr, inclusive progresso;
-        # mantemos só as primeiras linhas para não poluir
+        # ffmpeg escreve tudo em stderr;
+        # mantemos só a última linha para não poluir
         lines = [l for l in proc.stderr.splitlines() if l.strip()]
         if lines:
             print("FFmpeg/ffprobe:", lines[-1])
     return proc
 
-def _ffprobe_duration(path: str) -> float:
-    """Obtém a duração (segundos) via ffprobe, como float."""
-    cmd = [
-        "ffprobe", "-v", "error",
-        "-show_entries", "format=duration",
-        "-of", "json",
-        path
+
+# =========================
+# Montagem dos comandos
+# =========================
+
+# Modos de render:
+# - "single":   corte/ganho/resample da música dentro do -filter_complex, no mesmo
+#               ffmpeg do encode do vídeo (sem WAV intermediário nem ffprobe extra)
+# - "two_pass": fluxo original — gera um WAV alinhado em processed/ e depois faz o mux
+RENDER_MODES = ("single", "two_pass")
+RENDER_MODE = os.getenv("RENDER_MODE", "single")
+
+# Modos de vídeo:
+# - "auto":      copia o stream de vídeo (-c:v copy) quando a fonte já é compatível
+#                com Reels; caso contrário, transcodifica
+# - "transcode": sempre reencoda com libx264
+VIDEO_MODES = ("auto", "transcode")
+VIDEO_MODE = os.getenv("VIDEO_MODE", "auto")
+
+# Perfis de encode (preset/CRF do libx264 e bitrate do AAC):
+# - "preview":  o mais rápido, para conferir o alinhamento
+# - "standard": padrão de publicação
+# - "archival": qualidade alta para guardar
+# ENCODER_PROFILES (JSON) ajusta ou acrescenta perfis, ex.: {"standard": {"crf": 22}}
+PERFIS_ENCODER = {
+    "preview": {"preset": "ultrafast", "crf": 28, "audio_bitrate": "128k"},
+    "standard": {"preset": "veryfast", "crf": 20, "audio_bitrate": "192k"},
+    "archival": {"preset": "slow", "crf": 17, "audio_bitrate": "256k"},
+}
+for _nome, _ajustes in json.loads(os.getenv("ENCODER_PROFILES", "{}")).items():
+    PERFIS_ENCODER[_nome] = {**PERFIS_ENCODER.get(_nome, PERFIS_ENCODER["standard"]), **_ajustes}
+ENCODER_PROFILE = os.getenv("ENCODER_PROFILE", "standard")
+
+# Encode final (força compatibilidade ampla p/ Reels: H.264 + yuv420p + AAC)
+_VIDEO_COPY = ["-c:v", "copy"]
+# Saídas gravadas em disco: 'moov' no início do arquivo, para o player (/videos)
+# começar a tocar sem buscar o índice no fim
+_MP4_FASTSTART = ["-movflags", "+faststart"]
+
+
+def _perfil(nome: Optional[str]) -> dict:
+    """Configuração do perfil de encode; levanta ValueError se não existir."""
+    nome = nome or ENCODER_PROFILE
+    if nome not in PERFIS_ENCODER:
+        raise ValueError(f"Perfil de encode inválido: {nome}. Use: {', '.join(PERFIS_ENCODER)}")
+    return PERFIS_ENCODER[nome]
+
+
+def _video_encode(perfil: Optional[str] = None) -> list[str]:
+    p = _perfil(perfil)
+    return ["-c:v", "libx264", "-pix_fmt", "yuv420p", "-preset", p["preset"], "-crf", str(p["crf"])]
+
+
+def _audio_encode(perfil: Optional[str] = None) -> list[str]:
+    return ["-c:a", "aac", "-b:a", _perfil(perfil)["audio_bitrate"], "-ar", "48000"]
+
+# Fonte aceita para cópia direta: H.264 8-bit 4:2:0 em profiles que os players de Reels decodificam
+_PROFILES_COMPATIVEIS = ("Baseline", "Constrained Baseline", "Main", "High")
+
+
+def parametros_encoder(
+    modo: Optional[str] = None,
+    video_modo: Optional[str] = None,
+    perfil: Optional[str] = None
+) -> dict:
+    """Parâmetros de render que afetam a saída (entram na chave do cache de renders)."""
+    return {
+        "render_mode": modo or RENDER_MODE,
+        "video_mode": video_modo or VIDEO_MODE,
+        "video": _video_encode(perfil),
+        "audio": _audio_encode(perfil)
+    }
+
+
+def _video_compativel(info: dict) -> bool:
+    """Indica se o vídeo pode ir para a saída sem reencode (apenas o áudio é trocado)."""
+    return (
+        info.get("codec_name") == "h264"
+        and info.get("pix_fmt") == "yuv420p"
+        and info.get("profile") in _PROFILES_COMPATIVEIS
+    )
+
+
+def _calcular_inicio_musica(
+    music_impact: float,
+    segundo_video: float,
+    duracao_musica: float,
+    duracao_video: float
+) -> float:
+    """
+    Calcula o início do trecho da música para que 'music_impact' caia em 'segundo_video'.
+    Clampeia para nunca sair dos limites da música.
+    """
+    # Queremos: music_impact no t=segundo_video do vídeo
+    # Logo, o início do trecho da música que usaremos é:
+    start_music = float(music_impact) - float(segundo_video)
+
+    # Clampeia para os limites da música (sem sair do range)
+    # 1) Não pode começar antes do 0
+    if start_music < 0:
+        print(f"⚠️ Impacto da música cairia antes do início. Ajustando início de {start_music:.3f}s → 0.000s")
+        start_music = 0.0
+
+    # 2) Não pode ultrapassar o final (precisamos de 'duracao_video' de música)
+    max_start = max(0.0, duracao_musica - duracao_video)
+    if start_music > max_start:
+        print(f"⚠️ Ajuste no início para caber o vídeo: {start_music:.3f}s → {max_start:.3f}s")
+        start_music = max_start
+
+    return start_music
+
+
+def _cmd_audio_alinhado(musica_path: str, start_music: float, duracao: float, gain_db: float, temp_audio: str) -> list[str]:
+    """Passo 1 do modo two_pass: gera o WAV alinhado (sem silêncio, só corte)."""
+    # Observação: usamos -ss APÓS o -i para busca precisa (ainda que um pouco mais lenta).
+    return [
+        "ffmpeg", "-y",
+        "-i", musica_path,
+        "-ss", f"{start_music:.3f}",
+        "-t", f"{duracao:.3f}",
+        "-ac", "2", "-ar", "48000",
+        "-af", f"volume={gain_db}dB",
+        "-c:a", "pcm_s16le",
+        temp_audio
+    ]
+
+
+def _cmd_mux(
+    video_path: str,
+    temp_audio: str,
+    output_path: str,
+    copiar_video: bool = False,
+    perfil: Optional[str] = None
+) -> list[str]:
+    """Passo 2 do modo two_pass: mux do vídeo com o WAV alinhado."""
+    return [
+        "ffmpeg", "-y",
+        "-i", video_path, "-i", temp_audio,
+        "-map", "0:v:0", "-map", "1:a:0",
+        *(_VIDEO_COPY if copiar_video else _video_encode(perfil)),
+        *_audio_encode(perfil),
+        "-shortest",  # Garante término no menor fluxo (evita arrasto se algo sair fora)
+        *_MP4_FASTSTART,
+        output_path
+    ]
+
+
+def _filtro_audio(start_music: float, duracao: float, gain_db: float, cortar: bool = True) -> str:
+    """
+    Grafo de áudio do modo single: o mesmo corte preciso do two_pass
+    (atrim = -ss/-t após o -i), seguido de ganho e resample para 48 kHz estéreo.
+    Com cortar=False (PCM já fatiado pelo cache) fica só o ganho/formato.
+    """
+    corte = (
+        f"atrim=start={start_music:.3f}:duration={duracao:.3f},asetpts=PTS-STARTPTS,"
+        if cortar else ""
+    )
+    return (
+        f"[1:a:0]{corte}"
+        f"volume={gain_db}dB,"
+        f"aresample=48000,aformat=channel_layouts=stereo[a]"
+    )
+
+
+def _cmd_single_pass(
+    video_path: str,
+    musica_path: str,
+    start_music: float,
+    duracao: float,
+    gain_db: float,
+    output_path: str,
+    copiar_video: bool = False,
+    pcm_stdin: bool = False,
+    perfil: Optional[str] = None,
+    video_parcial: bool = False,
+    fragmentado: bool = False
+) -> list[str]:
+    """
+    Modo single: corte + ganho + resample + encode em uma única invocação do ffmpeg.
+    Com pcm_stdin=True a música chega já fatiada, em PCM canônico, pelo stdin.
+    Com video_parcial=True o vídeo é lido enquanto ainda está sendo baixado.
+    Com fragmentado=True a saída é MP4 fragmentado no stdout (output_path é ignorado).
+    """
+    entrada_musica = [*FFMPEG_INPUT_PCM, "-i", "pipe:0"] if pcm_stdin else ["-i", musica_path]
+    entrada_video = [*entrada_crescente(), "-i", video_path] if video_parcial else ["-i", video_path]
+    return [
+        "ffmpeg", "-y",
+        *entrada_video, *entrada_musica,
+        "-filter_complex", _filtro_audio(start_music, duracao, gain_db, cortar=not pcm_stdin),
+        "-map", "0:v:0", "-map", "[a]",
+        *(_VIDEO_COPY if copiar_video else _video_encode(perfil)),
+        *_audio_encode(perfil),
+        "-shortest",
+        *(saida_fragmentada() if fragmentado else _MP4_FASTSTART),
+        "pipe:1" if fragmentado else output_path
+    ]
+
+
+def _cmd_video_intermediario(video_path: str, output_path: str, perfil: Optional[str] = None) -> list[str]:
+    """Lote com fonte incompatível: encoda só o vídeo (sem áudio), uma única vez."""
+    return [
+        "ffmpeg", "-y",
+        "-i", video_path,
+        "-map", "0:v:0", "-an",
+        *_video_encode(perfil),
+        output_path
     ]
-    proc = _run(cmd, quiet=True)
-    try:
-        data = json.loads(proc.stdout)
-        return float(data["format"]["duration"])
-    except Exception as e:
-        raise RuntimeError(f"Não foi possível ler duração de {path}: {e}\nSaída: {proc.stdout}")
 
 
 # =========================
@@ -62,9 +364,51 @@ def adicionar_musica(
     segundo_video: float,             # mantido p/ compat original (impacto no vídeo)
     output_path: str,
     music_impact: float = 51.0,       # mantido p/ compat original (impacto na música)
-    debug: bool = True,
-    gain_db: float = 6.0
+    debug: bool = False,
+    gain_db: float = 6.0,
+    modo: str = None,
+    video_modo: str = None,
+    pcm_cache: Optional[PcmCache] = None,
+    perfil: str = None,
+    progresso: Optional[Callable[[dict], None]] = None
 ) -> str:
+    """
+    Versão compatível com a API original: executa renderizar_musica e
+    retorna apenas o caminho do vídeo final.
+    """
+    resultado = renderizar_musica(
+        video_path=video_path,
+        musica_path=musica_path,
+        segundo_video=segundo_video,
+        output_path=output_path,
+        music_impact=music_impact,
+        debug=debug,
+        gain_db=gain_db,
+        modo=modo,
+        video_modo=video_modo,
+        pcm_cache=pcm_cache,
+        perfil=perfil,
+        progresso=progresso
+    )
+    return resultado["output_path"]
+
+
+def renderizar_musica(
+    video_path: str,
+    musica_path: str,
+    segundo_video: float,
+    output_path: str,
+    music_impact: float = 51.0,
+    debug: bool = False,
+    gain_db: float = 6.0,
+    modo: str = None,
+    video_modo: str = None,
+    pcm_cache: Optional[PcmCache] = None,
+    perfil: str = None,
+    progresso: Optional[Callable[[dict], None]] = None,
+    video_parcial: bool = False,
+    saida: Optional[SaidaProgressiva] = None
+) -> dict:
     """
     Substitui o áudio do vídeo por um trecho contínuo da música, SEM adicionar silêncio.
     Alinha para que 'music_impact' (segundo na música) ocorra exatamente em 'segundo_video' (segundo no vídeo).
@@ -78,9 +422,51 @@ def adicionar_musica(
     Parâmetros mantidos para compatibilidade com a API atual:
     - 'segundo_video' = impacto no vídeo (antes você já usava esse nome)
     - 'music_impact'  = impacto na música (antes você já usava esse nome)
+
+    'modo' escolhe o render: "single" (padrão, um único ffmpeg) ou "two_pass"
+    (WAV intermediário). Se omitido, usa a variável de ambiente RENDER_MODE.
+
+    'video_modo' escolhe o tratamento do vídeo: "auto" (padrão, copia o stream
+    quando a fonte já é H.264 yuv420p compatível) ou "transcode". Se omitido,
+    usa a variável de ambiente VIDEO_MODE.
+
+    'pcm_cache', no modo single, lê a música já decodificada do cache PCM:
+    o trecho alinhado é um slice por offset de amostras enviado pelo stdin.
+
+    'perfil' escolhe o perfil de encode (ver PERFIS_ENCODER). Se omitido,
+    usa a variável de ambiente ENCODER_PROFILE.
+
+    'progresso', se informado, recebe o andamento de cada ffmpeg (etapas
+    "audio_extract" e "mux", com 'percent' sobre a duração do vídeo).
+
+    'video_parcial' indica um MP4 ainda sendo baixado, com o índice ('moov')
+    já completo (ver scripts/fluxo.py): o ffmpeg lê os bytes conforme chegam.
+    Só no modo single.
+
+    'saida' entrega o vídeo enquanto ele é renderizado: o ffmpeg escreve MP4
+    fragmentado em um pipe e cada bloco vai para output_path e para quem lê a
+    SaidaProgressiva (ver scripts/fluxo.py). Só no modo single, sem 'progresso'
+    (o stdout do ffmpeg é o vídeo).
+
+    Retorna dict com 'output_path', 'render_mode', 'video_mode' ("copy" ou
+    "transcode", o caminho efetivamente usado), 'audio_source'
+    ("pcm_cache" ou "decode") e 'encoder_profile'.
     """
 
-    print("🎬 Iniciando a edição (sem silêncio artificial)…")
+    modo = modo or RENDER_MODE
+    if modo not in RENDER_MODES:
+        raise ValueError(f"Modo de render inválido: {modo}. Use: {', '.join(RENDER_MODES)}")
+    video_modo = video_modo or VIDEO_MODE
+    if video_modo not in VIDEO_MODES:
+        raise ValueError(f"Modo de vídeo inválido: {video_modo}. Use: {', '.join(VIDEO_MODES)}")
+    if video_parcial and modo != "single":
+        raise ValueError("Leitura do vídeo durante o download só é suportada no modo single")
+    if saida is not None and modo != "single":
+        raise ValueError("Saída progressiva só é suportada no modo single")
+    perfil = perfil or ENCODER_PROFILE
+    _perfil(perfil)
+
+    print(f"🎬 Iniciando a edição (sem silêncio artificial, modo {modo}, perfil {perfil})…")
 
     # Pastas/paths
     os.makedirs("processed", exist_ok=True)
@@ -94,76 +480,306 @@ def adicionar_musica(
     if not os.path.exists(musica_path):
         raise FileNotFoundError(f"Música não encontrada: {musica_path}")
 
-    # Durações
-    duracao_video = _ffprobe_duration(video_path)
-    duracao_musica = _ffprobe_duration(musica_path)
+    # Durações (o probe do vídeo já traz codec/pix_fmt/profile p/ decidir a cópia)
+    # Arquivo parcial: a duração e os streams vêm do 'moov'; não entra no cache de probes
+    info = sondar(video_path, memorizar=not video_parcial)
+    info_video = info["video"] or {}
+    duracao_video = info["duration"]
+    if not duracao_video:
+        raise RuntimeError(f"Não foi possível ler duração do vídeo {video_path}")
+    usar_pcm = modo == "single" and pcm_cache is not None and pcm_cache.ativo
+    if usar_pcm:
+        pcm = pcm_cache.obter(musica_path)
+        duracao_musica = len(pcm) / TAXA
+    else:
+        duracao_musica = duracao(musica_path)
     print(f"✅ Duração vídeo: {duracao_video:.3f}s | ✅ Duração música: {duracao_musica:.3f}s")
 
+    copiar_video = video_modo == "auto" and _video_compativel(info_video)
+    resultado = {
+        "output_path": output_path,
+        "render_mode": modo,
+        "video_mode": "copy" if copiar_video else "transcode",
+        "audio_source": "pcm_cache" if usar_pcm else "decode",
+        "encoder_profile": perfil
+    }
+    if copiar_video:
+        print("⚡ Vídeo já compatível com Reels: copiando stream de vídeo (sem reencode)")
+    else:
+        print(
+            f"🔁 Vídeo será transcodificado (codec={info_video.get('codec_name')}, "
+            f"pix_fmt={info_video.get('pix_fmt')}, profile={info_video.get('profile')})"
+        )
+
     # Cálculo de alinhamento (sem silêncio)
-    # Queremos: music_impact no t=segundo_video do vídeo
-    # Logo, o início do trecho da música que usaremos é:
-    start_music = float(music_impact) - float(segundo_video)
+    start_music = _calcular_inicio_musica(music_impact, segundo_video, duracao_musica, duracao_video)
 
-    # Clampeia para os limites da música (sem sair do range)
-    # 1) Não pode começar antes do 0
-    if start_music < 0:
-        print(f"⚠️ Impacto da música cairia antes do início. Ajustando início de {start_music:.3f}s → 0.000s")
-        start_music = 0.0
+    print(f"🎯 Início do trecho da música: {start_music:.3f}s (music_impact={music_impact:.3f}s ↔ segundo_video={float(segundo_video):.3f}s)")
 
-    # 2) Não pode ultrapassar o final (precisamos de 'duracao_video' de música)
-    max_start = max(0.0, duracao_musica - duracao_video)
-    if start_music > max_start:
-        print(f"⚠️ Ajuste no início para caber o vídeo: {start_music:.3f}s → {max_start:.3f}s")
-        start_music = max_start
+    # Falha, timeout ou cancelamento no meio do render: não deixa saída parcial
+    try:
+        if modo == "single":
+            _render_passo_unico(
+                video_path, musica_path, start_music, duracao_video, gain_db, output_path,
+                copiar_video, perfil, pcm if usar_pcm else None, progresso, video_parcial, saida
+            )
+        else:
+            _render_dois_passos(
+                video_path, musica_path, start_music, duracao_video, gain_db, output_path,
+                copiar_video, perfil, debug, progresso
+            )
+    except BaseException:
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        raise
+
+    print(f"✅ Finalizado com sucesso!\n📄 Saída: {output_path}")
+    return resultado
 
-    print(f"🎯 Início do trecho da música: {start_music:.3f}s (music_impact={music_impact:.3f}s ↔ segundo_video={float(segundo_video):.3f}s)")
 
+def _render_passo_unico(
+    video_path: str,
+    musica_path: str,
+    start_music: float,
+    duracao_video: float,
+    gain_db: float,
+    output_path: str,
+    copiar_video: bool,
+    perfil: str,
+    pcm=None,
+    progresso: Optional[Callable[[dict], None]] = None,
+    video_parcial: bool = False,
+    saida: Optional[SaidaProgressiva] = None
+) -> None:
+    """
+    Modo single: um único ffmpeg (música decodificada ou PCM do cache pelo stdin).
+    Com 'saida', o MP4 fragmentado sai pelo stdout e é gravado bloco a bloco.
+    """
+    print("🎥 Renderizando vídeo final (passo único)…")
+    cmd = _cmd_single_pass(
+        video_path, musica_path, start_music, duracao_video, gain_db, output_path,
+        copiar_video, pcm_stdin=pcm is not None, perfil=perfil, video_parcial=video_parcial,
+        fragmentado=saida is not None
+    )
+    with etapa("mux", bytes_entrada=tamanho(video_path)) as medida:
+        acompanhamento = dict(progresso=progresso, duracao_total=duracao_video, nome_etapa="mux")
+        if saida is not None:
+            saida.abrir(output_path)
+            acompanhamento = dict(ao_ler_bloco=saida.escrever, nome_etapa="mux")
+        try:
+            if pcm is not None:
+                _run(cmd, entrada=blocos(fatiar(pcm, start_music, duracao_video)), **acompanhamento)
+            else:
+                _run(cmd, **acompanhamento)
+        finally:
+            if saida is not None:
+                saida.fechar()
+        medida["bytes_saida"] = tamanho(output_path)
+
+
+def _render_dois_passos(
+    video_path: str,
+    musica_path: str,
+    start_music: float,
+    duracao_video: float,
+    gain_db: float,
+    output_path: str,
+    copiar_video: bool,
+    perfil: str,
+    debug: bool = False,
+    progresso: Optional[Callable[[dict], None]] = None
+) -> None:
+    """Modo two_pass: WAV alinhado intermediário e depois o mux com o vídeo."""
     # Áudio temporário (único p/ evitar corrida)
     temp_audio = os.path.join("processed", f"audio_{uuid.uuid4().hex}.wav")
+    try:
+        # Gerar o áudio alinhado (sem silêncio, só corte)
+        cmd_audio = _cmd_audio_alinhado(musica_path, start_music, duracao_video, gain_db, temp_audio)
+        print("🎵 Gerando áudio alinhado…")
+        with etapa("audio_extract", bytes_entrada=tamanho(musica_path)) as medida:
+            _run(cmd_audio, progresso=progresso, duracao_total=duracao_video, nome_etapa="audio_extract")
+            medida["bytes_saida"] = tamanho(temp_audio)
 
-    # Gerar o áudio alinhado (sem silêncio, só corte)
-    # Observação: usamos -ss APÓS o -i para busca precisa (ainda que um pouco mais lenta).
-    cmd_audio = [
-        "ffmpeg", "-y",
-        "-i", musica_path,
-        "-ss", f"{start_music:.3f}",
-        "-t", f"{duracao_video:.3f}",
-        "-ac", "2", "-ar", "48000",
-        "-af", f"volume={gain_db}dB",
-        "-c:a", "pcm_s16le",
-        temp_audio
-    ]
-    print("🎵 Gerando áudio alinhado…")
-    _run(cmd_audio)
-
-    # Sanidade do áudio gerado
-    if not os.path.exists(temp_audio) or os.path.getsize(temp_audio) < 1024:
-        raise RuntimeError(f"Áudio temporário inválido/pequeno: {temp_audio}")
-    dur_temp = _ffprobe_duration(temp_audio)
-    if dur_temp <= 0.0:
-        raise RuntimeError(f"Áudio temporário com duração zero: {temp_audio}")
-    print(f"✅ Áudio OK ({dur_temp:.3f}s): {temp_audio}")
-
-    # Mux final (força compatibilidade ampla p/ Reels: H.264 + yuv420p + AAC)
-    cmd_final = [
-        "ffmpeg", "-y",
-        "-i", video_path, "-i", temp_audio,
-        "-map", "0:v:0", "-map", "1:a:0",
-        "-c:v", "libx264", "-pix_fmt", "yuv420p",
-        "-preset", "veryfast", "-crf", "20",
-        "-c:a", "aac", "-b:a", "192k", "-ar", "48000",
-        "-shortest",  # Garante término no menor fluxo (evita arrasto se algo sair fora)
-        output_path
-    ]
-    print("🎥 Renderizando vídeo final…")
-    _run(cmd_final)
+        # Sanidade do áudio gerado
+        if not os.path.exists(temp_audio) or os.path.getsize(temp_audio) < 1024:
+            raise RuntimeError(f"Áudio temporário inválido/pequeno: {temp_audio}")
+        dur_temp = duracao(temp_audio, memorizar=False)
+        if dur_temp <= 0.0:
+            raise RuntimeError(f"Áudio temporário com duração zero: {temp_audio}")
+        print(f"✅ Áudio OK ({dur_temp:.3f}s): {temp_audio}")
+
+        # Mux final
+        cmd_final = _cmd_mux(video_path, temp_audio, output_path, copiar_video, perfil)
+        print("🎥 Renderizando vídeo final…")
+        with etapa("mux", bytes_entrada=tamanho(video_path, temp_audio)) as medida:
+            _run(cmd_final, progresso=progresso, duracao_total=duracao_video, nome_etapa="mux")
+            medida["bytes_saida"] = tamanho(output_path)
+    finally:
+        # Limpeza (também em falha/cancelamento)
+        with etapa("cleanup"):
+            try:
+                if not debug and os.path.exists(temp_audio):
+                    os.remove(temp_audio)
+            except Exception as e:
+                print("⚠️ Não foi possível remover temporário:", e)
+
+
+def renderizar_lote(
+    video_path: str,
+    variantes: list[dict],
+    video_modo: str = None,
+    pcm_cache: Optional[PcmCache] = None,
+    max_paralelo: Optional[int] = None,
+    debug: bool = False,
+    perfil: str = None,
+    progresso: Optional[Callable[[dict], None]] = None
+) -> dict:
+    """
+    Renderiza várias variantes (música + pontos de impacto) sobre o MESMO vídeo.
 
-    # Limpeza
+    - O vídeo é analisado (ffprobe) uma única vez.
+    - Se a fonte já é compatível com Reels, todas as variantes copiam o stream
+      de vídeo; senão, o vídeo é encodado UMA vez (sem áudio) e as variantes
+      copiam esse intermediário.
+    - A duração de cada música é obtida uma vez por faixa, e as variantes
+      rodam em paralelo (até 'max_paralelo', padrão: núcleos da máquina),
+      cada uma em um ffmpeg de passo único que só produz o áudio novo.
+
+    Cada variante é um dict com 'musica_path', 'music_impact', 'segundo_video',
+    'output_path' e, opcionalmente, 'gain_db' (padrão 6.0).
+
+    'perfil' é o perfil de encode (ver PERFIS_ENCODER) do vídeo e do áudio.
+
+    'progresso', se informado, recebe o andamento do encode do intermediário
+    (etapa "video_encode") e um evento por variante concluída (etapa "variants").
+
+    Retorna dict com 'video_mode', 'encoder_profile' e 'results' (um por
+    variante, na mesma ordem, com 'ok', 'output_path', 'start_music' ou
+    'error'). Falha em uma variante não interrompe as demais.
+    """
+    video_modo = video_modo or VIDEO_MODE
+    if video_modo not in VIDEO_MODES:
+        raise ValueError(f"Modo de vídeo inválido: {video_modo}. Use: {', '.join(VIDEO_MODES)}")
+    perfil = perfil or ENCODER_PROFILE
+    _perfil(perfil)
+
+    print(f"🎬 Iniciando lote com {len(variantes)} variante(s)…")
+    os.makedirs("processed", exist_ok=True)
+    video_path = _abspath(video_path)
+    if not os.path.exists(video_path):
+        raise FileNotFoundError(f"Vídeo não encontrado: {video_path}")
+
+    info = sondar(video_path)
+    info_video = info["video"] or {}
+    duracao_video = info["duration"]
+    if not duracao_video:
+        raise RuntimeError(f"Não foi possível ler duração do vídeo {video_path}")
+    copiar_video = video_modo == "auto" and _video_compativel(info_video)
+    usar_pcm = pcm_cache is not None and pcm_cache.ativo
+
+    # Uma leitura por música distinta (PCM do cache ou duração via ffprobe)
+    musicas = {}
+    for v in variantes:
+        caminho = _abspath(v["musica_path"])
+        if caminho in musicas:
+            continue
+        if not os.path.exists(caminho):
+            raise FileNotFoundError(f"Música não encontrada: {caminho}")
+        if usar_pcm:
+            pcm = pcm_cache.obter(caminho)
+            musicas[caminho] = (pcm, len(pcm) / TAXA)
+        else:
+            musicas[caminho] = (None, duracao(caminho))
+
+    intermediario = os.path.join("processed", f"video_{uuid.uuid4().hex}.mp4")
     try:
-        if not debug and os.path.exists(temp_audio):
-            os.remove(temp_audio)
-    except Exception as e:
-        print("⚠️ Não foi possível remover temporário:", e)
+        return _renderizar_variantes(
+            video_path, variantes, musicas, duracao_video, copiar_video, usar_pcm,
+            intermediario, max_paralelo, perfil, progresso
+        )
+    finally:
+        if not debug and os.path.exists(intermediario):
+            os.remove(intermediario)
 
-    print(f"✅ Finalizado com sucesso!\n📄 Saída: {output_path}")
-    return output_path
+
+def _renderizar_variantes(
+    video_path: str,
+    variantes: list[dict],
+    musicas: dict,
+    duracao_video: float,
+    copiar_video: bool,
+    usar_pcm: bool,
+    intermediario: str,
+    max_paralelo: Optional[int],
+    perfil: str,
+    progresso: Optional[Callable[[dict], None]]
+) -> dict:
+    """Parte de renderizar_lote após as leituras: intermediário (se preciso) e variantes em paralelo."""
+    fonte = video_path
+    if copiar_video:
+        print("⚡ Vídeo já compatível com Reels: todas as variantes copiam o stream de vídeo")
+    else:
+        print("🔁 Encodando o vídeo uma única vez para o lote…")
+        with etapa("video_encode", bytes_entrada=tamanho(video_path)) as medida:
+            _run(
+                _cmd_video_intermediario(video_path, intermediario, perfil),
+                progresso=progresso, duracao_total=duracao_video, nome_etapa="video_encode"
+            )
+            medida["bytes_saida"] = tamanho(intermediario)
+        fonte = _abspath(intermediario)
+
+    def _renderizar(v: dict) -> dict:
+        caminho = _abspath(v["musica_path"])
+        output_path = _abspath(v["output_path"])
+        pcm, duracao_musica = musicas[caminho]
+        try:
+            start_music = _calcular_inicio_musica(v["music_impact"], v["segundo_video"], duracao_musica, duracao_video)
+            cmd = _cmd_single_pass(
+                fonte, caminho, start_music, duracao_video, v.get("gain_db", 6.0), output_path,
+                copiar_video=True, pcm_stdin=usar_pcm, perfil=perfil
+            )
+            with etapa("mux", bytes_entrada=tamanho(fonte)) as medida:
+                if usar_pcm:
+                    _run(cmd, quiet=True, entrada=blocos(fatiar(pcm, start_music, duracao_video)), nome_etapa="mux")
+                else:
+                    _run(cmd, quiet=True, nome_etapa="mux")
+                medida["bytes_saida"] = tamanho(output_path)
+            return {"ok": True, "output_path": output_path, "start_music": start_music}
+        except Exception as e:
+            if os.path.exists(output_path):
+                os.remove(output_path)
+            if isinstance(e, Cancelado):
+                raise
+            print(f"❌ Variante falhou ({output_path}): {e}")
+            return {"ok": False, "output_path": output_path, "error": str(e)}
+
+    concluidas = 0
+    trava_progresso = threading.Lock()
+
+    def _renderizar_e_reportar(v: dict) -> dict:
+        nonlocal concluidas
+        r = _renderizar(v)
+        if progresso is not None:
+            with trava_progresso:
+                concluidas += 1
+                progresso({
+                    "stage": "variants",
+                    "out_time": None,
+                    "speed": None,
+                    "percent": round(concluidas / len(variantes) * 100, 1),
+                    "done": concluidas == len(variantes)
+                })
+        return r
+
+    # Cada variante roda com uma cópia do contexto (cancelamento e tempos do pedido)
+    with ThreadPoolExecutor(max_workers=max_paralelo or os.cpu_count() or 1) as pool:
+        futuros = [pool.submit(contextvars.copy_context().run, _renderizar_e_reportar, v) for v in variantes]
+        results = [f.result() for f in futuros]
+
+    print(f"✅ Lote finalizado: {sum(r['ok'] for r in results)}/{len(results)} variante(s) OK")
+    return {
+        "video_mode": "copy" if copiar_video else "transcode",
+        "audio_source": "pcm_cache" if usar_pcm else "decode",
+        "encoder_profile": perfil,
+        "results": results
+    }
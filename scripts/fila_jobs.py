@@ -0,0 +1,348 @@
+# scripts/fila_jobs.py
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import time
+import uuid
+import queue
+import sqlite3
+import importlib
+import threading
+from typing import Iterable, Optional
+
+
+# =========================
+# Configuração
+# =========================
+
+JOBS_DIR = os.getenv("JOBS_DIR", "jobs")
+# sqlite (padrão, durável e compartilhável entre processos), files (JSON por job,
+# fila só no processo) ou "pacote.modulo:Classe" (backend próprio, ver FilaJobs)
+JOB_BACKEND = os.getenv("JOB_BACKEND", "sqlite")
+# Banco da fila SQLite (vazio = JOBS_DIR/jobs.sqlite3)
+JOB_DB = os.getenv("JOB_DB", "")
+# Job em execução sem sinal de vida do worker por mais que isso (s) volta para a fila
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+# Quantas vezes um job pode ser retomado após a queda do worker antes de virar erro
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+# Intervalo (s) entre consultas à fila quando ela está vazia
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "0.5"))
+
+
+# =========================
+# Interface
+# =========================
+
+class FilaJobs:
+    """
+    Armazenamento e fila dos jobs de render (usada pelo JobManager).
+
+    Um backend guarda o estado de cada job (dict serializável em JSON) e
+    entrega os jobs enfileirados aos workers, um worker por job. Backends
+    próprios (ex.: em um banco de rede, para nós em máquinas diferentes)
+    implementam os métodos abaixo e são escolhidos por
+    JOB_BACKEND="pacote.modulo:Classe".
+
+    'lease' é o tempo (s) sem renovar() depois do qual um job em execução é
+    considerado órfão e volta para a fila; None = o backend não retoma jobs.
+    """
+
+    lease: Optional[float] = None
+
+    def enfileirar(self, job: dict) -> None:
+        """Grava um job novo (status 'queued') e o torna disponível para pegar()."""
+        raise NotImplementedError
+
+    def pegar(self, worker: str, espera: float) -> Optional[dict]:
+        """Reserva o próximo job da fila para 'worker', esperando até 'espera' segundos."""
+        raise NotImplementedError
+
+    def salvar(self, job: dict) -> bool:
+        """
+        Grava o estado atual do job. Retorna False se o job não pertence mais
+        a job["worker"] (o lease expirou e outro worker o assumiu): o estado
+        não é gravado e quem o executava deve parar.
+        """
+        raise NotImplementedError
+
+    def obter(self, job_id: str) -> Optional[dict]:
+        """Estado do job, ou None se não existir."""
+        raise NotImplementedError
+
+    def pedir_cancelamento(self, job_id: str) -> None:
+        """Marca o job para cancelamento (o worker que o executa, em qualquer nó, o vê)."""
+        raise NotImplementedError
+
+    def cancelamento_pedido(self, job_id: str) -> bool:
+        raise NotImplementedError
+
+    def limpar_cancelamento(self, job_id: str) -> None:
+        raise NotImplementedError
+
+    def cancelamentos_pedidos(self, job_ids: Iterable[str]) -> set[str]:
+        """Quais dos jobs têm cancelamento pedido (backends podem responder numa consulta só)."""
+        return {job_id for job_id in job_ids if self.cancelamento_pedido(job_id)}
+
+    def renovar(self, job_ids: Iterable[str], worker: str) -> set[str]:
+        """
+        Sinal de vida dos jobs que 'worker' está executando (ver 'lease').
+        Retorna os que não são mais dele (retomados por outro worker).
+        """
+        return set()
+
+    def pendentes(self) -> int:
+        """Jobs aguardando na fila."""
+        raise NotImplementedError
+
+
+def criar_fila(backend: str = JOB_BACKEND, jobs_dir: str = JOBS_DIR) -> FilaJobs:
+    """Instancia o backend configurado (ver JOB_BACKEND)."""
+    if backend == "sqlite":
+        return FilaSqlite(JOB_DB or os.path.join(jobs_dir, "jobs.sqlite3"))
+    if backend == "files":
+        return FilaArquivos(jobs_dir)
+    modulo, _, classe = backend.partition(":")
+    if not modulo or not classe:
+        raise ValueError(f"JOB_BACKEND inválido: {backend}. Use sqlite, files ou pacote.modulo:Classe")
+    return getattr(importlib.import_module(modulo), classe)()
+
+
+# =========================
+# Arquivos JSON (fila no processo)
+# =========================
+
+class FilaArquivos(FilaJobs):
+    """
+    Um JSON por job em 'jobs_dir' (legível por qualquer processo) e marcador
+    <id>.cancel para cancelamento. A fila em si fica na memória do processo
+    que recebeu o job: não sobrevive a reinícios nem é dividida entre nós.
+    """
+
+    def __init__(self, jobs_dir: str = JOBS_DIR):
+        self.jobs_dir = jobs_dir
+        self._fila: queue.Queue[str] = queue.Queue()
+        os.makedirs(self.jobs_dir, exist_ok=True)
+
+    def _caminho(self, job_id: str) -> str:
+        return os.path.join(self.jobs_dir, f"{job_id}.json")
+
+    def _caminho_cancelamento(self, job_id: str) -> str:
+        return os.path.join(self.jobs_dir, f"{job_id}.cancel")
+
+    def enfileirar(self, job: dict) -> None:
+        self.salvar(job)
+        self._fila.put(job["id"])
+
+    def pegar(self, worker: str, espera: float) -> Optional[dict]:
+        try:
+            job_id = self._fila.get(timeout=espera)
+        except queue.Empty:
+            return None
+        return self.obter(job_id)
+
+    def salvar(self, job: dict) -> bool:
+        # Escrita atômica: leitores nunca veem um JSON pela metade
+        temp = self._caminho(job["id"]) + f".{uuid.uuid4().hex}.tmp"
+        with open(temp, "w", encoding="utf-8") as f:
+            json.dump(job, f, ensure_ascii=False)
+        os.replace(temp, self._caminho(job["id"]))
+        return True
+
+    def obter(self, job_id: str) -> Optional[dict]:
+        try:
+            with open(self._caminho(job_id), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def pedir_cancelamento(self, job_id: str) -> None:
+        with open(self._caminho_cancelamento(job_id), "w"):
+            pass
+
+    def cancelamento_pedido(self, job_id: str) -> bool:
+        return os.path.exists(self._caminho_cancelamento(job_id))
+
+    def limpar_cancelamento(self, job_id: str) -> None:
+        try:
+            os.remove(self._caminho_cancelamento(job_id))
+        except FileNotFoundError:
+            pass
+
+    def pendentes(self) -> int:
+        return self._fila.qsize()
+
+
+# =========================
+# SQLite (fila durável)
+# =========================
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id         TEXT PRIMARY KEY,
+    status     TEXT NOT NULL,
+    dados      TEXT NOT NULL,
+    criado_em  REAL NOT NULL,
+    worker     TEXT,
+    heartbeat  REAL,
+    cancelar   INTEGER NOT NULL DEFAULT 0
+)
+"""
+_INDICE = "CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, criado_em)"
+
+
+class FilaSqlite(FilaJobs):
+    """
+    Fila durável em SQLite: jobs enfileirados e seus estados sobrevivem a
+    reinícios, e vários processos (workers do uvicorn, `python -m api.worker`)
+    consomem a mesma fila, cada job reservado por um só (transação IMMEDIATE).
+
+    Jobs em execução têm um lease: o worker renova o heartbeat enquanto
+    trabalha; se ele cair, o job volta para a fila na próxima reserva (até
+    'max_tentativas' vezes, depois vira erro).
+
+    O SQLite precisa de locks de arquivo confiáveis: serve para processos e
+    containers na mesma máquina (volume compartilhado). Entre máquinas, use
+    um backend de rede pela interface FilaJobs.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        lease: float = JOB_LEASE_SECONDS,
+        max_tentativas: int = JOB_MAX_ATTEMPTS,
+        intervalo: float = JOB_POLL_INTERVAL
+    ):
+        self.db_path = db_path
+        self.lease = lease
+        self.max_tentativas = max_tentativas
+        self.intervalo = intervalo
+        # Acorda os workers deste processo assim que um job é enfileirado aqui
+        self._aviso = threading.Event()
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        with self._conectar() as conn:
+            conn.execute(_SCHEMA)
+            conn.execute(_INDICE)
+
+    def _conectar(self) -> sqlite3.Connection:
+        # Uma conexão por operação: a fila é usada de várias threads/processos
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def enfileirar(self, job: dict) -> None:
+        with self._conectar() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, status, dados, criado_em) VALUES (?, ?, ?, ?)",
+                (job["id"], job["status"], json.dumps(job, ensure_ascii=False), job["created_at"])
+            )
+        self._aviso.set()
+
+    def _retomar_orfaos(self, conn: sqlite3.Connection, agora: float) -> None:
+        """Jobs cujo worker parou de renovar o lease voltam para a fila (ou viram erro)."""
+        orfaos = conn.execute(
+            "SELECT id, dados, worker FROM jobs WHERE status = 'running' AND heartbeat < ?",
+            (agora - self.lease,)
+        ).fetchall()
+        for job_id, dados, worker in orfaos:
+            job = json.loads(dados)
+            if job.get("attempts", 0) >= self.max_tentativas:
+                job.update(
+                    status="error", finished_at=agora, worker=None,
+                    error=f"Worker {worker} parou de responder ({job.get('attempts', 0)} tentativa(s))"
+                )
+            else:
+                print(f"♻️ Job {job_id} retomado: worker {worker} parou de responder")
+                job.update(status="queued", started_at=None, progress=None, worker=None)
+            conn.execute(
+                "UPDATE jobs SET status = ?, dados = ?, worker = NULL, heartbeat = NULL WHERE id = ?",
+                (job["status"], json.dumps(job, ensure_ascii=False), job_id)
+            )
+
+    def _reservar(self, worker: str) -> Optional[dict]:
+        agora = time.time()
+        with self._conectar() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._retomar_orfaos(conn, agora)
+                row = conn.execute(
+                    "SELECT id, dados FROM jobs WHERE status = 'queued' ORDER BY criado_em LIMIT 1"
+                ).fetchone()
+                job = None
+                if row is not None:
+                    job = json.loads(row[1])
+                    job["attempts"] = job.get("attempts", 0) + 1
+                    job["worker"] = worker
+                    conn.execute(
+                        "UPDATE jobs SET status = 'running', dados = ?, worker = ?, heartbeat = ? WHERE id = ?",
+                        (json.dumps(job, ensure_ascii=False), worker, agora, row[0])
+                    )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return job
+
+    def pegar(self, worker: str, espera: float) -> Optional[dict]:
+        limite = time.monotonic() + espera
+        while True:
+            self._aviso.clear()
+            job = self._reservar(worker)
+            restante = limite - time.monotonic()
+            if job is not None or restante <= 0:
+                return job
+            self._aviso.wait(min(self.intervalo, restante))
+
+    def salvar(self, job: dict) -> bool:
+        # Só quem detém o lease grava: um worker que o perdeu não sobrescreve o novo dono
+        with self._conectar() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, dados = ? WHERE id = ? AND worker IS ?",
+                (job["status"], json.dumps(job, ensure_ascii=False), job["id"], job.get("worker"))
+            )
+        return cursor.rowcount > 0
+
+    def obter(self, job_id: str) -> Optional[dict]:
+        with self._conectar() as conn:
+            row = conn.execute("SELECT dados FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def pedir_cancelamento(self, job_id: str) -> None:
+        with self._conectar() as conn:
+            conn.execute("UPDATE jobs SET cancelar = 1 WHERE id = ?", (job_id,))
+
+    def cancelamento_pedido(self, job_id: str) -> bool:
+        with self._conectar() as conn:
+            row = conn.execute("SELECT cancelar FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return bool(row and row[0])
+
+    def limpar_cancelamento(self, job_id: str) -> None:
+        with self._conectar() as conn:
+            conn.execute("UPDATE jobs SET cancelar = 0 WHERE id = ?", (job_id,))
+
+    def cancelamentos_pedidos(self, job_ids: Iterable[str]) -> set[str]:
+        ids = list(job_ids)
+        if not ids:
+            return set()
+        with self._conectar() as conn:
+            rows = conn.execute(
+                f"SELECT id FROM jobs WHERE cancelar = 1 AND id IN ({', '.join('?' * len(ids))})", ids
+            ).fetchall()
+        return {row[0] for row in rows}
+
+    def renovar(self, job_ids: Iterable[str], worker: str) -> set[str]:
+        perdidos = set()
+        agora = time.time()
+        with self._conectar() as conn:
+            for job_id in job_ids:
+                cursor = conn.execute(
+                    "UPDATE jobs SET heartbeat = ? WHERE id = ? AND worker = ? AND status = 'running'",
+                    (agora, job_id, worker)
+                )
+                if cursor.rowcount == 0:
+                    perdidos.add(job_id)
+        return perdidos
+
+    def pendentes(self) -> int:
+        with self._conectar() as conn:
+            return conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
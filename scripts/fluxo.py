@@ -0,0 +1,208 @@
+# scripts/fluxo.py
+# -*- coding: utf-8 -*-
+
+import os
+import struct
+import threading
+import contextvars
+from typing import Callable, Optional
+
+
+# =========================
+# Configuração
+# =========================
+
+# 1 = o render começa enquanto o vídeo ainda está sendo baixado (ver scripts/pipeline.py)
+STREAM_RENDER = os.getenv("STREAM_RENDER", "0") == "1"
+# Sem bytes novos no arquivo parcial por mais que isso (s), o ffmpeg desiste de esperar
+STREAM_STALL_TIMEOUT = float(os.getenv("STREAM_STALL_TIMEOUT", "60"))
+# Duração máxima (s) de cada fragmento do MP4 entregue com return_format "stream"
+MP4_FRAGMENT_SECONDS = float(os.getenv("MP4_FRAGMENT_SECONDS", "1"))
+# Intervalo (s) entre as leituras do cabeçalho do arquivo parcial
+_INTERVALO_CABECALHO = 0.05
+
+
+def entrada_crescente(espera: float = STREAM_STALL_TIMEOUT) -> list[str]:
+    """
+    Opções de entrada do ffmpeg para ler um arquivo que ainda está sendo
+    escrito: no fim dos bytes disponíveis o protocolo 'file' espera mais
+    (até 'espera' segundos sem novidade) em vez de tratar como fim do arquivo.
+    """
+    return ["-follow", "1", "-rw_timeout", str(int(espera * 1_000_000))]
+
+
+def saida_fragmentada(duracao_fragmento: float = MP4_FRAGMENT_SECONDS) -> list[str]:
+    """
+    Opções de saída do ffmpeg para MP4 fragmentado em um pipe: 'moov' vazio
+    no início e um fragmento ('moof' + 'mdat') a cada keyframe ou a cada
+    'duracao_fragmento' segundos, o que vier antes. Cada fragmento é
+    tocável assim que chega, sem o ffmpeg voltar ao início do arquivo.
+    """
+    return [
+        "-movflags", "frag_keyframe+empty_moov+default_base_moof",
+        "-frag_duration", str(int(duracao_fragmento * 1_000_000)),
+        "-f", "mp4"
+    ]
+
+
+# =========================
+# Cabeçalho MP4
+# =========================
+
+def mp4_transmissivel(caminho: str) -> Optional[bool]:
+    """
+    Lê as caixas de topo de um MP4 (possivelmente ainda sendo escrito) e
+    indica se ele pode ser lido enquanto cresce:
+    - True: o 'moov' (índice das amostras) chegou inteiro antes do 'mdat';
+    - False: o 'mdat' vem antes do 'moov' (ou não é MP4) — só lendo o arquivo completo;
+    - None: ainda não chegaram bytes suficientes para decidir.
+    """
+    try:
+        tamanho_arquivo = os.path.getsize(caminho)
+        f = open(caminho, "rb")
+    except OSError:
+        return None
+    with f:
+        posicao = 0
+        primeira = True
+        while True:
+            f.seek(posicao)
+            cabecalho = f.read(16)
+            if len(cabecalho) < 8:
+                return None
+            tamanho, tipo = struct.unpack(">I4s", cabecalho[:8])
+            if primeira and tipo not in (b"ftyp", b"styp"):
+                return False
+            primeira = False
+            if tamanho == 1:
+                if len(cabecalho) < 16:
+                    return None
+                tamanho = struct.unpack(">Q", cabecalho[8:16])[0]
+            if tipo == b"mdat":
+                return False
+            if tipo == b"moov":
+                # tamanho 0 = "até o fim do arquivo": não dá para saber se já chegou tudo
+                return True if tamanho and posicao + tamanho <= tamanho_arquivo else None
+            if tamanho < 8:
+                return False
+            posicao += tamanho
+
+
+# =========================
+# Download em segundo plano
+# =========================
+
+class DownloadEmSegundoPlano:
+    """
+    Roda 'baixar(ao_receber)' em uma thread com o contexto do pedido
+    (cancelamento, tempos, relatório do download) e avisa quando o arquivo
+    parcial começa a ser escrito. 'baixar' chama 'ao_receber' com os eventos
+    de progresso do yt-dlp ('tmpfilename') e retorna o resultado final.
+    'ao_falhar' é chamado (na thread do download) se ele levantar.
+    """
+
+    def __init__(
+        self,
+        baixar: Callable[[Callable[[dict], None]], object],
+        ao_falhar: Optional[Callable[[BaseException], None]] = None
+    ):
+        self.parcial: Optional[str] = None
+        self._baixar = baixar
+        self._ao_falhar = ao_falhar
+        self._resultado = None
+        self._erro: Optional[BaseException] = None
+        self._recebendo = threading.Event()
+        self._fim = threading.Event()
+        contexto = contextvars.copy_context()
+        self._thread = threading.Thread(target=contexto.run, args=(self._executar,), name="download", daemon=True)
+
+    def iniciar(self) -> "DownloadEmSegundoPlano":
+        self._thread.start()
+        return self
+
+    def _ao_receber(self, status: dict) -> None:
+        if self.parcial is None and status.get("tmpfilename"):
+            self.parcial = status["tmpfilename"]
+            self._recebendo.set()
+
+    def _executar(self) -> None:
+        try:
+            self._resultado = self._baixar(self._ao_receber)
+        except BaseException as e:
+            self._erro = e
+            if self._ao_falhar is not None:
+                self._ao_falhar(e)
+        finally:
+            self._fim.set()
+            self._recebendo.set()
+
+    @property
+    def concluido(self) -> bool:
+        return self._fim.is_set()
+
+    def esperar_cabecalho(self) -> Optional[str]:
+        """
+        Espera o arquivo parcial ter o cabeçalho completo. Retorna o caminho
+        parcial se ele puder ser lido enquanto cresce; None se o download
+        terminou antes (ou falhou) ou se o arquivo só pode ser lido completo.
+        """
+        self._recebendo.wait()
+        while not self._fim.is_set():
+            transmissivel = mp4_transmissivel(self.parcial)
+            if transmissivel is not None:
+                return self.parcial if transmissivel else None
+            self._fim.wait(_INTERVALO_CABECALHO)
+        return None
+
+    def resultado(self):
+        """Espera o download terminar e retorna o resultado (ou levanta o erro dele)."""
+        self._thread.join()
+        if self._erro is not None:
+            raise self._erro
+        return self._resultado
+
+
+# =========================
+# Saída progressiva
+# =========================
+
+class SaidaProgressiva:
+    """
+    Saída de um render em MP4 fragmentado que é entregue enquanto é produzida.
+
+    O render abre a saída com o caminho do arquivo final (abrir), grava cada
+    bloco do stdout do ffmpeg (escrever) e fecha; quem responde ao cliente lê
+    o mesmo arquivo enquanto ele cresce, até encerrar() ser chamado no fim do
+    pedido (com o erro, se houver). O arquivo gravado é o mesmo que vai para
+    processed/ e para o cache de renders (numa chave só de saídas fragmentadas).
+    """
+
+    def __init__(self):
+        self.caminho: Optional[str] = None
+        self.escritos = 0
+        self.concluida = False
+        self.erro: Optional[BaseException] = None
+        self._arquivo = None
+
+    def abrir(self, caminho: str) -> None:
+        # Bytes já entregues não voltam: um segundo render (fallback) não pode recomeçar a saída
+        if self.escritos:
+            raise RuntimeError("A saída progressiva já foi entregue em parte; o render não pode recomeçar")
+        self.caminho = caminho
+        self._arquivo = open(caminho, "wb")
+
+    def escrever(self, bloco: bytes) -> None:
+        self._arquivo.write(bloco)
+        self._arquivo.flush()
+        self.escritos += len(bloco)
+
+    def fechar(self) -> None:
+        if self._arquivo is not None:
+            self._arquivo.close()
+            self._arquivo = None
+
+    def encerrar(self, erro: Optional[BaseException] = None) -> None:
+        """Fim do pedido: não virão mais bytes ('erro' = o pedido falhou)."""
+        self.fechar()
+        self.erro = erro
+        self.concluida = True
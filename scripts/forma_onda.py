@@ -0,0 +1,221 @@
+# scripts/forma_onda.py
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import uuid
+import threading
+from typing import Callable, Optional
+
+import numpy as np
+
+from scripts.metricas import etapa, registrar_cache
+from scripts.pcm_cache import TAXA
+
+
+# =========================
+# Configuração
+# =========================
+
+WAVEFORM_DIR = os.getenv("WAVEFORM_DIR", "cache/waveform")
+# Amostras por pico de cada nível de zoom (cada um múltiplo do anterior)
+WAVEFORM_LEVELS = tuple(int(n) for n in os.getenv("WAVEFORM_LEVELS", "256,1024,4096,16384").split(","))
+
+# Picos lidos do PCM por vez no nível mais fino (memória constante)
+_PICOS_POR_BLOCO = 4096
+
+
+# =========================
+# Cálculo (NumPy)
+# =========================
+
+def _para_int8(valores: np.ndarray) -> np.ndarray:
+    """s16 → s8 (8 bits bastam para desenhar; metade do tamanho)."""
+    return np.right_shift(valores, 8).astype(np.int8)
+
+
+def calcular_picos(pcm: np.ndarray, niveis: tuple = WAVEFORM_LEVELS) -> list[np.ndarray]:
+    """
+    Picos (mínimo, máximo) int8 da faixa em cada nível: um array (picos x 2)
+    por nível, todos os canais misturados. O nível mais fino é lido do PCM em
+    blocos; os demais saem dele, agrupando picos.
+    """
+    base = niveis[0]
+    canais = pcm.shape[1] if pcm.ndim == 2 else 1
+    total = -(-len(pcm) // base)
+    picos = np.zeros((total, 2), dtype=np.int8)
+
+    for p in range(0, total, _PICOS_POR_BLOCO):
+        n = min(_PICOS_POR_BLOCO, total - p)
+        trecho = np.asarray(pcm[p * base:(p + n) * base]).reshape(-1)
+        falta = n * base * canais - len(trecho)
+        if falta:
+            # Último pico incompleto: repete a última amostra (não altera mín/máx)
+            trecho = np.concatenate([trecho, np.full(falta, trecho[-1], dtype=trecho.dtype)])
+        janelas = trecho.reshape(n, base * canais)
+        picos[p:p + n, 0] = _para_int8(janelas.min(axis=1))
+        picos[p:p + n, 1] = _para_int8(janelas.max(axis=1))
+
+    resultado = [picos]
+    for anterior, nivel in zip(niveis, niveis[1:]):
+        fator = nivel // anterior
+        atual = resultado[-1]
+        falta = -len(atual) % fator
+        if falta:
+            atual = np.concatenate([atual, np.repeat(atual[-1:], falta, axis=0)])
+        grupos = atual.reshape(-1, fator, 2)
+        resultado.append(np.stack([grupos[:, :, 0].min(axis=1), grupos[:, :, 1].max(axis=1)], axis=1))
+    return resultado
+
+
+# =========================
+# Cache em disco
+# =========================
+
+class CacheFormaDeOnda:
+    """
+    Picos da forma de onda de cada música em vários níveis de zoom, gerados
+    uma vez por faixa (no upload) a partir do PCM decodificado.
+
+    Cada faixa vira um arquivo binário (int8 mínimo/máximo intercalados, os
+    níveis em sequência) e um sidecar .json com os offsets de cada nível e o
+    tamanho/mtime da fonte, para detectar alterações (como no PcmCache).
+    Um trecho é servido lendo só o intervalo de bytes dele, sem recalcular.
+
+    'carregar_pcm' recebe o caminho da música e retorna o PCM (ex.: PcmCache.carregar).
+    """
+
+    def __init__(
+        self,
+        carregar_pcm: Callable[[str], np.ndarray],
+        cache_dir: str = WAVEFORM_DIR,
+        niveis: tuple = WAVEFORM_LEVELS
+    ):
+        if any(b % a for a, b in zip(niveis, niveis[1:])):
+            raise ValueError(f"Cada nível deve ser múltiplo do anterior: {niveis}")
+        self.carregar_pcm = carregar_pcm
+        self.cache_dir = cache_dir
+        self.niveis = tuple(niveis)
+        self._lock = threading.Lock()
+        self._locks_chave: dict[str, threading.Lock] = {}
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _caminhos(self, nome: str) -> tuple[str, str]:
+        base = os.path.join(self.cache_dir, nome)
+        return base + ".peaks", base + ".json"
+
+    def _lock_chave(self, nome: str) -> threading.Lock:
+        with self._lock:
+            return self._locks_chave.setdefault(nome, threading.Lock())
+
+    # ---------- ciclo de vida ----------
+
+    def invalidar(self, nome: str) -> None:
+        """Descarta os picos de uma faixa (música deletada ou reenviada)."""
+        for caminho in self._caminhos(nome):
+            try:
+                os.remove(caminho)
+            except FileNotFoundError:
+                pass
+
+    def _ler_meta(self, musica_path: str, picos_path: str, meta_path: str) -> Optional[dict]:
+        """Sidecar da faixa, se ainda valer para a fonte e para os níveis configurados."""
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            st = os.stat(musica_path)
+            tamanho = sum(2 * n["peaks"] for n in meta["levels"])
+            if (
+                meta.get("source_size") == st.st_size
+                and meta.get("source_mtime_ns") == st.st_mtime_ns
+                and [n["samples_per_peak"] for n in meta["levels"]] == list(self.niveis)
+                and os.path.getsize(picos_path) == tamanho
+            ):
+                return meta
+        except (FileNotFoundError, KeyError, json.JSONDecodeError):
+            pass
+        return None
+
+    def _gerar(self, musica_path: str, picos_path: str, meta_path: str) -> dict:
+        print(f"🌊 Gerando picos da forma de onda: {musica_path}")
+        st = os.stat(musica_path)
+        with etapa("waveform") as medida:
+            pcm = self.carregar_pcm(musica_path)
+            medida["bytes_entrada"] = pcm.nbytes
+            niveis = calcular_picos(pcm, self.niveis)
+
+        meta = {
+            "source_size": st.st_size,
+            "source_mtime_ns": st.st_mtime_ns,
+            "sample_rate": TAXA,
+            "frames": len(pcm),
+            "levels": [],
+        }
+        temp = f"{picos_path}.{uuid.uuid4().hex}.tmp"
+        try:
+            offset = 0
+            with open(temp, "wb") as f:
+                for nivel, picos in zip(self.niveis, niveis):
+                    f.write(picos.tobytes())
+                    meta["levels"].append({"samples_per_peak": nivel, "offset": offset, "peaks": len(picos)})
+                    offset += picos.nbytes
+            os.replace(temp, picos_path)
+        finally:
+            if os.path.exists(temp):
+                os.remove(temp)
+
+        meta_temp = f"{meta_path}.{uuid.uuid4().hex}.tmp"
+        with open(meta_temp, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(meta_temp, meta_path)
+        return meta
+
+    def obter(self, musica_path: str) -> dict:
+        """Sidecar dos picos da música, gerando-os na primeira vez ou quando a fonte mudou."""
+        nome = os.path.splitext(os.path.basename(musica_path))[0]
+        picos_path, meta_path = self._caminhos(nome)
+        with self._lock_chave(nome):
+            meta = self._ler_meta(musica_path, picos_path, meta_path)
+            registrar_cache("waveform", hit=meta is not None)
+            if meta is None:
+                meta = self._gerar(musica_path, picos_path, meta_path)
+        return meta
+
+    # ---------- leitura ----------
+
+    def trecho(self, musica_path: str, inicio: float = 0.0, fim: Optional[float] = None, largura: int = 1000) -> dict:
+        """
+        Picos de [inicio, fim) segundos no nível mais grosso que ainda dê ao
+        menos 'largura' picos (ou no mais fino, se nenhum der). Retorna dict com
+        'samples_per_peak', 'start'/'end' (alinhados aos picos), 'peaks',
+        'data' (bytes int8 mínimo/máximo intercalados) e 'version' (muda
+        quando a fonte muda).
+        """
+        meta = self.obter(musica_path)
+        duracao = meta["frames"] / meta["sample_rate"]
+        fim = duracao if fim is None else min(fim, duracao)
+        inicio = max(0.0, min(inicio, fim))
+        amostras = (fim - inicio) * meta["sample_rate"]
+
+        candidatos = [n for n in meta["levels"] if amostras / n["samples_per_peak"] >= largura]
+        nivel = candidatos[-1] if candidatos else meta["levels"][0]
+        por_pico = nivel["samples_per_peak"]
+        primeiro = min(nivel["peaks"], int(inicio * meta["sample_rate"] // por_pico))
+        ultimo = min(nivel["peaks"], int(-(-fim * meta["sample_rate"] // por_pico)))
+
+        nome = os.path.splitext(os.path.basename(musica_path))[0]
+        picos_path, _ = self._caminhos(nome)
+        with open(picos_path, "rb") as f:
+            f.seek(nivel["offset"] + 2 * primeiro)
+            dados = f.read(2 * (ultimo - primeiro))
+
+        return {
+            "sample_rate": meta["sample_rate"],
+            "samples_per_peak": por_pico,
+            "start": primeiro * por_pico / meta["sample_rate"],
+            "end": min(duracao, ultimo * por_pico / meta["sample_rate"]),
+            "duration": duracao,
+            "peaks": len(dados) // 2,
+            "data": dados,
+            "version": f"{meta['source_size']:x}-{meta['source_mtime_ns']:x}",
+        }
@@ -0,0 +1,276 @@
+# scripts/jobs.py
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import uuid
+import socket
+import inspect
+import threading
+from typing import Callable, Optional
+
+from scripts.fila_jobs import JOBS_DIR, FilaJobs, criar_fila
+from scripts.processos import Cancelado, Cancelamento, cancelavel
+
+
+# =========================
+# Configuração
+# =========================
+
+# Intervalo mínimo entre gravações de progresso de um job (troca de etapa grava sempre)
+JOB_PROGRESS_INTERVAL = float(os.getenv("JOB_PROGRESS_INTERVAL", "0.5"))
+# 0 = este processo só enfileira (a API); os renders ficam com `python -m api.worker`
+JOB_LOCAL_WORKERS = os.getenv("JOB_LOCAL_WORKERS", "1") == "1"
+# Quanto um worker ocioso espera por um job antes de checar se deve encerrar
+_ESPERA_FILA = 0.5
+# Intervalo entre consultas (uma só para todos os jobs em execução) a cancelamentos pedidos por outros processos
+_INTERVALO_VIGIA = 0.5
+
+
+def _workers_padrao() -> int:
+    """
+    Tamanho padrão do pool de render: os núcleos da máquina divididos entre
+    os processos do uvicorn (APP_WORKERS), para que o total não passe do hardware.
+    """
+    configurado = int(os.getenv("RENDER_WORKERS", "0") or 0)
+    if configurado > 0:
+        return configurado
+    app_workers = max(1, int(os.getenv("APP_WORKERS", "1") or 1))
+    return max(1, (os.cpu_count() or 1) // app_workers)
+
+
+# =========================
+# Gerenciador de jobs
+# =========================
+
+class JobManager:
+    """
+    Fila de jobs de render com workers de tamanho fixo.
+
+    - submeter() registra o job na fila e retorna imediatamente com o ID.
+    - Os workers (threads) pegam os jobs da fila e executam a função
+      'executar' (pipeline download → alinhamento → mux).
+    - O estado e a fila ficam no backend 'fila' (ver scripts/fila_jobs.py;
+      padrão: JOB_BACKEND). Com o SQLite, qualquer processo responde GET
+      /jobs/{id}, jobs enfileirados sobrevivem a reinícios e vários processos
+      ou nós (`python -m api.worker`) dividem a mesma fila.
+
+    Estados: queued → running → done | error | cancelled
+
+    cancelar() marca o job no backend: o worker que o executa (em qualquer
+    processo) vê a marca e encerra os subprocessos do render. Um job cujo
+    lease foi assumido por outro worker também é interrompido, sem gravar.
+
+    Se 'executar' aceitar o argumento 'progresso', recebe um callback cujo
+    último evento fica em job["progress"] (com 'updated_at'), gravado no
+    máximo a cada 'intervalo_progresso' segundos.
+
+    Com iniciar=False nenhum worker roda neste processo até iniciar() (ex.:
+    a API com JOB_LOCAL_WORKERS=0 só enfileira).
+    """
+
+    def __init__(
+        self,
+        executar: Callable[[dict], dict],
+        max_workers: Optional[int] = None,
+        jobs_dir: str = JOBS_DIR,
+        intervalo_progresso: float = JOB_PROGRESS_INTERVAL,
+        fila: Optional[FilaJobs] = None,
+        iniciar: bool = True,
+    ):
+        self.executar = executar
+        self.intervalo_progresso = intervalo_progresso
+        self._com_progresso = "progresso" in inspect.signature(executar).parameters
+        self.max_workers = max_workers or _workers_padrao()
+        self.fila = fila or criar_fila(jobs_dir=jobs_dir)
+        # Identifica este processo nos jobs que ele reserva (e no lease)
+        self.worker = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self._lock = threading.Lock()
+        self._executando = 0
+        self._cancelamentos: dict[str, Cancelamento] = {}
+        self._parar = threading.Event()
+        # A vigia (lease e cancelamentos) só para depois do último worker deste processo
+        self._fim_vigia = threading.Event()
+        self._consumidores = 0
+        self._threads: list[threading.Thread] = []
+        if iniciar:
+            self.iniciar()
+
+    def obter(self, job_id: str) -> Optional[dict]:
+        """Retorna o estado do job ou None se não existir."""
+        # IDs são hex de uuid4; qualquer outra coisa não é um job nosso
+        if not job_id or not all(c in "0123456789abcdef" for c in job_id):
+            return None
+        return self.fila.obter(job_id)
+
+    # ---------- execução ----------
+
+    def iniciar(self) -> None:
+        """Sobe os workers deste processo (uma vez)."""
+        with self._lock:
+            if self._threads:
+                return
+            self._consumidores = self.max_workers
+            for i in range(self.max_workers):
+                self._threads.append(threading.Thread(target=self._consumir, name=f"render_{i}", daemon=True))
+            self._threads.append(threading.Thread(target=self._vigiar, name="render_vigia", daemon=True))
+        for thread in self._threads:
+            thread.start()
+
+    def submeter(self, params: dict) -> dict:
+        """Registra um novo job na fila."""
+        job = {
+            "id": uuid.uuid4().hex,
+            "status": "queued",
+            "params": params,
+            "result": None,
+            "error": None,
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "progress": None,
+        }
+        self.fila.enfileirar(job)
+        return job
+
+    def _consumir(self) -> None:
+        try:
+            while not self._parar.is_set():
+                try:
+                    job = self.fila.pegar(self.worker, _ESPERA_FILA)
+                except Exception as e:
+                    print(f"⚠️ Falha ao ler a fila de jobs: {e}")
+                    self._parar.wait(_ESPERA_FILA)
+                    continue
+                if job is not None:
+                    self._executar_job(job)
+        finally:
+            with self._lock:
+                self._consumidores -= 1
+                if self._consumidores == 0:
+                    self._fim_vigia.set()
+
+    def _vigiar(self) -> None:
+        """
+        Acompanha os jobs em execução neste processo: uma consulta por ciclo
+        traz os cancelamentos pedidos por outros processos e, a cada lease/3,
+        o lease é renovado (jobs retomados por outro worker são interrompidos).
+        Roda até o último worker terminar, inclusive durante encerrar(wait=True).
+        """
+        intervalo = min(_INTERVALO_VIGIA, self.fila.lease / 3) if self.fila.lease else _INTERVALO_VIGIA
+        renovado = 0.0
+        while not self._fim_vigia.wait(intervalo):
+            with self._lock:
+                em_execucao = dict(self._cancelamentos)
+            if not em_execucao:
+                continue
+            try:
+                for job_id in self.fila.cancelamentos_pedidos(em_execucao):
+                    em_execucao[job_id].cancelar("job cancelado")
+                if self.fila.lease and time.monotonic() - renovado >= self.fila.lease / 3:
+                    renovado = time.monotonic()
+                    for job_id in self.fila.renovar(em_execucao, self.worker):
+                        em_execucao[job_id].cancelar("job assumido por outro worker")
+            except Exception as e:
+                print(f"⚠️ Falha ao acompanhar os jobs em execução: {e}")
+
+    def _executar_job(self, job: dict) -> None:
+        # Pedidos de outros processos chegam pela vigia (_vigiar), não a cada verificação
+        cancelamento = Cancelamento()
+        if self.fila.cancelamento_pedido(job["id"]):
+            cancelamento.cancelar("job cancelado")
+        with self._lock:
+            self._executando += 1
+            self._cancelamentos[job["id"]] = cancelamento
+        try:
+            job["started_at"] = time.time()
+            try:
+                cancelamento.verificar_ou_levantar()
+                job["status"] = "running"
+                if not self.fila.salvar(job):
+                    cancelamento.cancelar("job assumido por outro worker")
+                    cancelamento.verificar_ou_levantar()
+                with cancelavel(cancelamento):
+                    if self._com_progresso:
+                        job["result"] = self.executar(job["params"], progresso=self._progresso(job, cancelamento))
+                    else:
+                        job["result"] = self.executar(job["params"])
+                job["status"] = "done"
+            except Cancelado as e:
+                print(f"🛑 Job {job['id']} cancelado")
+                job["error"] = str(e)
+                job["status"] = "cancelled"
+            except Exception as e:
+                print(f"❌ Job {job['id']} falhou: {e}")
+                job["error"] = str(e)
+                job["status"] = "error"
+            job["finished_at"] = time.time()
+        finally:
+            # Sai da contagem antes do estado final aparecer para quem consulta
+            with self._lock:
+                self._executando -= 1
+                self._cancelamentos.pop(job["id"], None)
+        if self.fila.salvar(job):
+            self.fila.limpar_cancelamento(job["id"])
+        else:
+            # O pedido de cancelamento, se houver, agora é do novo dono
+            print(f"⚠️ Job {job['id']} assumido por outro worker: resultado deste descartado")
+
+    def cancelar(self, job_id: str) -> Optional[dict]:
+        """
+        Pede o cancelamento de um job. Retorna o estado do job (None se não
+        existir); jobs já finalizados não mudam.
+        """
+        job = self.obter(job_id)
+        if job is None or job["status"] in ("done", "error", "cancelled"):
+            return job
+        self.fila.pedir_cancelamento(job_id)
+        with self._lock:
+            cancelamento = self._cancelamentos.get(job_id)
+        if cancelamento is not None:
+            cancelamento.cancelar("job cancelado")
+        if job["status"] == "queued":
+            # Ainda na fila: já aparece como cancelado (o worker confirma ao pegá-lo)
+            job.update(status="cancelled", error="Processamento cancelado: job cancelado", finished_at=time.time())
+            if not self.fila.salvar(job):
+                # Um worker o pegou nesse meio-tempo: ele vê a marca e cancela
+                job = self.obter(job_id)
+        return job
+
+    def _progresso(self, job: dict, cancelamento: Cancelamento) -> Callable[[dict], None]:
+        """
+        Callback de progresso do job: grava o último evento, com limite de
+        frequência. Se a gravação for recusada (job assumido por outro
+        worker), cancela a execução deste.
+        """
+        trava = threading.Lock()
+        ultimo = {"gravado": 0.0, "stage": None}
+
+        def reportar(evento: dict) -> None:
+            agora = time.time()
+            with trava:
+                job["progress"] = {**evento, "updated_at": agora}
+                mudou_etapa = evento.get("stage") != ultimo["stage"]
+                if mudou_etapa or evento.get("done") or agora - ultimo["gravado"] >= self.intervalo_progresso:
+                    ultimo.update(gravado=agora, stage=evento.get("stage"))
+                    if not self.fila.salvar(job):
+                        cancelamento.cancelar("job assumido por outro worker")
+
+        return reportar
+
+    def profundidade(self) -> int:
+        """Jobs aguardando na fila (compartilhada, com o SQLite) ou em execução neste processo."""
+        with self._lock:
+            executando = self._executando
+        return self.fila.pendentes() + executando
+
+    def encerrar(self, wait: bool = False) -> None:
+        """
+        Para de pegar jobs novos. Com wait=True, espera os que estão em
+        execução terminarem (o lease deles continua sendo renovado até lá);
+        os enfileirados ficam na fila (no SQLite, para o próximo worker).
+        """
+        self._parar.set()
+        if wait:
+            for thread in self._threads:
+                thread.join()
@@ -0,0 +1,340 @@
+# scripts/metricas.py
+# -*- coding: utf-8 -*-
+
+import os
+import math
+import time
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Iterator, Optional, Union
+
+
+# =========================
+# Métricas (formato de exposição do Prometheus)
+# =========================
+# Registro em memória, por processo: com vários workers do uvicorn cada um
+# expõe os próprios valores (o Prometheus agrega por instância).
+
+BUCKETS_PADRAO = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+
+def _formatar_valor(valor: float) -> str:
+    if valor == math.inf:
+        return "+Inf"
+    if float(valor).is_integer():
+        return str(int(valor))
+    return repr(float(valor))
+
+
+def _escapar(valor: str) -> str:
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _formatar_labels(nomes: tuple, valores: tuple, extra: Optional[tuple] = None) -> str:
+    pares = list(zip(nomes, valores))
+    if extra:
+        pares.append(extra)
+    if not pares:
+        return ""
+    return "{" + ",".join(f'{nome}="{_escapar(valor)}"' for nome, valor in pares) + "}"
+
+
+class _Metrica:
+    tipo = "untyped"
+
+    def __init__(self, nome: str, ajuda: str, labels: tuple = ()):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.labels = tuple(labels)
+        self._valores: dict[tuple, object] = {}
+        self._lock = threading.Lock()
+
+    def _chave(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labels):
+            raise ValueError(f"Labels de {self.nome} devem ser {self.labels}, recebido {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.labels)
+
+    def _linhas(self) -> list[str]:
+        raise NotImplementedError
+
+    def exportar(self) -> str:
+        cabecalho = [f"# HELP {self.nome} {self.ajuda}", f"# TYPE {self.nome} {self.tipo}"]
+        return "\n".join(cabecalho + self._linhas())
+
+
+class Contador(_Metrica):
+    """Valor que só cresce (ex.: total de execuções)."""
+    tipo = "counter"
+
+    def inc(self, valor: float = 1, **labels) -> None:
+        chave = self._chave(labels)
+        with self._lock:
+            self._valores[chave] = self._valores.get(chave, 0) + valor
+
+    def valor(self, **labels) -> float:
+        with self._lock:
+            return self._valores.get(self._chave(labels), 0)
+
+    def _linhas(self) -> list[str]:
+        with self._lock:
+            itens = sorted(self._valores.items())
+        return [f"{self.nome}{_formatar_labels(self.labels, k)} {_formatar_valor(v)}" for k, v in itens]
+
+
+class Medidor(_Metrica):
+    """
+    Valor que sobe e desce (ex.: jobs em andamento). Com 'funcao', o valor
+    é calculado na hora da exportação e deve retornar {labels: valor}
+    (ou um número, se a métrica não tiver labels).
+    """
+    tipo = "gauge"
+
+    def __init__(self, nome: str, ajuda: str, labels: tuple = (), funcao: Callable[[], object] = None):
+        super().__init__(nome, ajuda, labels)
+        self.funcao = funcao
+
+    def set(self, valor: float, **labels) -> None:
+        with self._lock:
+            self._valores[self._chave(labels)] = valor
+
+    def inc(self, valor: float = 1, **labels) -> None:
+        chave = self._chave(labels)
+        with self._lock:
+            self._valores[chave] = self._valores.get(chave, 0) + valor
+
+    def dec(self, valor: float = 1, **labels) -> None:
+        self.inc(-valor, **labels)
+
+    @contextmanager
+    def rastrear(self, **labels) -> Iterator[None]:
+        """Soma 1 enquanto o bloco executa (ex.: pedidos em andamento)."""
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+    def _linhas(self) -> list[str]:
+        if self.funcao is not None:
+            try:
+                resultado = self.funcao()
+            except Exception as e:
+                print(f"⚠️ Métrica {self.nome} indisponível: {e}")
+                return []
+            if not isinstance(resultado, dict):
+                resultado = {(): resultado}
+            itens = sorted((k if isinstance(k, tuple) else (k,), v) for k, v in resultado.items() if v is not None)
+        else:
+            with self._lock:
+                itens = sorted(self._valores.items())
+        return [f"{self.nome}{_formatar_labels(self.labels, k)} {_formatar_valor(v)}" for k, v in itens]
+
+
+class Histograma(_Metrica):
+    """Distribuição de valores (ex.: durações) em buckets cumulativos."""
+    tipo = "histogram"
+
+    def __init__(self, nome: str, ajuda: str, labels: tuple = (), buckets: tuple = BUCKETS_PADRAO):
+        super().__init__(nome, ajuda, labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, valor: float, **labels) -> None:
+        chave = self._chave(labels)
+        with self._lock:
+            contagens, soma = self._valores.get(chave, ([0] * len(self.buckets), 0.0))
+            for i, limite in enumerate(self.buckets):
+                if valor <= limite:
+                    contagens[i] += 1
+            self._valores[chave] = (contagens, soma + valor)
+
+    def contagem(self, **labels) -> int:
+        with self._lock:
+            contagens, _ = self._valores.get(self._chave(labels), ([0] * len(self.buckets), 0.0))
+            return contagens[-1]
+
+    def _linhas(self) -> list[str]:
+        with self._lock:
+            itens = sorted((k, (list(c), s)) for k, (c, s) in self._valores.items())
+        linhas = []
+        for chave, (contagens, soma) in itens:
+            for limite, n in zip(self.buckets, contagens):
+                linhas.append(
+                    f"{self.nome}_bucket{_formatar_labels(self.labels, chave, ('le', _formatar_valor(limite)))} {n}"
+                )
+            linhas.append(f"{self.nome}_sum{_formatar_labels(self.labels, chave)} {_formatar_valor(soma)}")
+            linhas.append(f"{self.nome}_count{_formatar_labels(self.labels, chave)} {contagens[-1]}")
+        return linhas
+
+
+class Registro:
+    """Conjunto de métricas exportadas juntas em /metrics."""
+
+    def __init__(self):
+        self._metricas: dict[str, _Metrica] = {}
+        self._lock = threading.Lock()
+
+    def registrar(self, metrica: _Metrica) -> _Metrica:
+        with self._lock:
+            if metrica.nome in self._metricas:
+                raise ValueError(f"Métrica já registrada: {metrica.nome}")
+            self._metricas[metrica.nome] = metrica
+        return metrica
+
+    def contador(self, nome: str, ajuda: str, labels: tuple = ()) -> Contador:
+        return self.registrar(Contador(nome, ajuda, labels))
+
+    def medidor(self, nome: str, ajuda: str, labels: tuple = (), funcao: Callable[[], object] = None) -> Medidor:
+        return self.registrar(Medidor(nome, ajuda, labels, funcao))
+
+    def histograma(self, nome: str, ajuda: str, labels: tuple = (), buckets: tuple = BUCKETS_PADRAO) -> Histograma:
+        return self.registrar(Histograma(nome, ajuda, labels, buckets))
+
+    def exportar(self) -> str:
+        with self._lock:
+            metricas = list(self._metricas.values())
+        return "\n".join(m.exportar() for m in metricas) + "\n"
+
+
+REGISTRO = Registro()
+
+# Tipo de conteúdo do formato texto do Prometheus
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+# =========================
+# Métricas do pipeline
+# =========================
+
+ETAPA_SEGUNDOS = REGISTRO.histograma(
+    "clip_stage_duration_seconds", "Duração de cada etapa do pipeline", ("stage",)
+)
+ETAPA_TOTAL = REGISTRO.contador(
+    "clip_stage_total", "Execuções de cada etapa do pipeline por resultado", ("stage", "status")
+)
+ETAPA_BYTES_ENTRADA = REGISTRO.contador(
+    "clip_stage_bytes_in_total", "Bytes lidos por etapa", ("stage",)
+)
+ETAPA_BYTES_SAIDA = REGISTRO.contador(
+    "clip_stage_bytes_out_total", "Bytes produzidos por etapa", ("stage",)
+)
+SUBPROCESSO_SEGUNDOS = REGISTRO.histograma(
+    "clip_subprocess_duration_seconds", "Duração dos subprocessos (ffmpeg/ffprobe)", ("program",)
+)
+SUBPROCESSO_TOTAL = REGISTRO.contador(
+    "clip_subprocess_total",
+    "Subprocessos executados por código de saída (ou timeout, cancelled, spawn_error, error)",
+    ("program", "exit_code")
+)
+SUBPROCESSO_BYTES_ENTRADA = REGISTRO.contador(
+    "clip_subprocess_stdin_bytes_total", "Bytes enviados ao stdin dos subprocessos", ("program",)
+)
+SUBPROCESSO_BYTES_SAIDA = REGISTRO.contador(
+    "clip_subprocess_stdout_bytes_total", "Bytes lidos do stdout dos subprocessos", ("program",)
+)
+CACHE_CONSULTAS = REGISTRO.contador(
+    "clip_cache_requests_total", "Consultas aos caches por resultado (hit/miss)", ("cache", "result")
+)
+PIPELINES_EM_ANDAMENTO = REGISTRO.medidor(
+    "clip_pipelines_in_flight", "Pedidos de edição sendo processados neste worker"
+)
+
+
+def _taxas_de_acerto() -> dict:
+    """Taxa de acerto de cada cache desde o início do processo."""
+    with CACHE_CONSULTAS._lock:
+        caches = {chave[0] for chave in CACHE_CONSULTAS._valores}
+    taxas = {}
+    for cache in caches:
+        hits = CACHE_CONSULTAS.valor(cache=cache, result="hit")
+        total = hits + CACHE_CONSULTAS.valor(cache=cache, result="miss")
+        taxas[(cache,)] = hits / total if total else None
+    return taxas
+
+
+REGISTRO.medidor(
+    "clip_cache_hit_ratio", "Taxa de acerto de cada cache neste worker", ("cache",), funcao=_taxas_de_acerto
+)
+
+
+def registrar_cache(cache: str, hit: bool) -> None:
+    CACHE_CONSULTAS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+# =========================
+# Instrumentação
+# =========================
+
+# Tempos das etapas do pedido atual (ver coletar_tempos)
+_tempos_pedido: ContextVar[Optional[dict]] = ContextVar("tempos_pedido", default=None)
+
+
+@contextmanager
+def coletar_tempos() -> Iterator[dict]:
+    """Acumula em um dict {etapa: segundos} as etapas executadas neste contexto."""
+    tempos = {}
+    token = _tempos_pedido.set(tempos)
+    try:
+        yield tempos
+    finally:
+        _tempos_pedido.reset(token)
+
+
+def registrar_etapa(
+    nome: str,
+    duracao: float,
+    ok: bool = True,
+    bytes_entrada: Optional[int] = None,
+    bytes_saida: Optional[int] = None
+) -> None:
+    """Registra uma etapa já medida (para etapas que não cabem em um bloco 'with')."""
+    ETAPA_SEGUNDOS.observe(duracao, stage=nome)
+    ETAPA_TOTAL.inc(stage=nome, status="ok" if ok else "error")
+    if bytes_entrada:
+        ETAPA_BYTES_ENTRADA.inc(bytes_entrada, stage=nome)
+    if bytes_saida:
+        ETAPA_BYTES_SAIDA.inc(bytes_saida, stage=nome)
+    tempos = _tempos_pedido.get()
+    if tempos is not None:
+        tempos[nome] = round(tempos.get(nome, 0.0) + duracao, 4)
+
+
+@contextmanager
+def etapa(nome: str, bytes_entrada: Optional[int] = None) -> Iterator[dict]:
+    """
+    Mede uma etapa do pipeline: duração, status (ok/error) e bytes.
+    O dict retornado aceita 'bytes_entrada'/'bytes_saida' preenchidos no bloco.
+    """
+    registro = {"bytes_entrada": bytes_entrada, "bytes_saida": None}
+    inicio = time.perf_counter()
+    ok = False
+    try:
+        yield registro
+        ok = True
+    finally:
+        registrar_etapa(
+            nome, time.perf_counter() - inicio, ok,
+            registro["bytes_entrada"], registro["bytes_saida"]
+        )
+
+
+def registrar_subprocesso(
+    programa: str, duracao: float, codigo: Union[int, str], bytes_stdin: int = 0, bytes_stdout: int = 0
+) -> None:
+    SUBPROCESSO_SEGUNDOS.observe(duracao, program=programa)
+    SUBPROCESSO_TOTAL.inc(program=programa, exit_code=codigo)
+    if bytes_stdin:
+        SUBPROCESSO_BYTES_ENTRADA.inc(bytes_stdin, program=programa)
+    if bytes_stdout:
+        SUBPROCESSO_BYTES_SAIDA.inc(bytes_stdout, program=programa)
+
+
+def tamanho(*caminhos: str) -> int:
+    """Soma dos tamanhos dos arquivos existentes (0 para os ausentes)."""
+    total = 0
+    for caminho in caminhos:
+        try:
+            total += os.path.getsize(caminho)
+        except (OSError, TypeError):
+            pass
+    return total
@@ -0,0 +1,205 @@
+# scripts/pcm_cache.py
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import uuid
+import threading
+from typing import Iterator, Optional
+
+import numpy as np
+
+from scripts.metricas import etapa, registrar_cache, tamanho
+from scripts.processos import executar, timeout_etapa
+
+
+# =========================
+# Configuração
+# =========================
+
+PCM_CACHE_DIR = os.getenv("PCM_CACHE_DIR", "cache/pcm")
+# 0 desativa o cache (volta a decodificar a música a cada render)
+PCM_CACHE_MAX_BYTES = int(os.getenv("PCM_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))
+
+# Formato canônico do cache: PCM s16le intercalado, 48 kHz, estéreo
+TAXA = 48000
+CANAIS = 2
+BYTES_POR_FRAME = CANAIS * 2
+
+# Argumentos de entrada do ffmpeg para ler o PCM do cache (arquivo ou pipe)
+FFMPEG_INPUT_PCM = ["-f", "s16le", "-ar", str(TAXA), "-ac", str(CANAIS)]
+
+
+def _cmd_decodificar(musica_path: str, destino: str) -> list[str]:
+    """ffmpeg que decodifica a música para o PCM canônico em 'destino' (arquivo ou pipe:1)."""
+    return [
+        "ffmpeg", "-y", "-v", "error",
+        "-i", musica_path,
+        "-map", "0:a:0",
+        "-ac", str(CANAIS), "-ar", str(TAXA),
+        "-c:a", "pcm_s16le", "-f", "s16le",
+        destino
+    ]
+
+
+# =========================
+# Cache de PCM decodificado
+# =========================
+
+class PcmCache:
+    """
+    Cache em disco das músicas já decodificadas para PCM canônico
+    (48 kHz, estéreo, s16le), uma vez por faixa.
+
+    O corte do trecho alinhado vira um slice por offset de amostras de um
+    buffer memory-mapped (NumPy), sem decodificar o MP3 desde o início.
+
+    - Cada faixa é identificada pelo nome (stem) do arquivo de música; um
+      sidecar .json guarda tamanho/mtime da fonte para detectar alterações.
+    - O tamanho total é limitado por 'max_bytes' com despejo LRU (mtime é
+      atualizado a cada uso).
+    """
+
+    def __init__(self, cache_dir: str = PCM_CACHE_DIR, max_bytes: int = PCM_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._locks_chave: dict[str, threading.Lock] = {}
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @property
+    def ativo(self) -> bool:
+        return self.max_bytes > 0
+
+    def _caminhos(self, nome: str) -> tuple[str, str]:
+        base = os.path.join(self.cache_dir, nome)
+        return base + ".s16le", base + ".json"
+
+    def _lock_chave(self, nome: str) -> threading.Lock:
+        with self._lock:
+            return self._locks_chave.setdefault(nome, threading.Lock())
+
+    # ---------- ciclo de vida ----------
+
+    def invalidar(self, nome: str) -> None:
+        """Descarta o PCM de uma faixa (música deletada ou reenviada)."""
+        for caminho in self._caminhos(nome):
+            try:
+                os.remove(caminho)
+            except FileNotFoundError:
+                pass
+
+    def _valido(self, musica_path: str, pcm_path: str, meta_path: str) -> bool:
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            st = os.stat(musica_path)
+            return (
+                meta.get("source_size") == st.st_size
+                and meta.get("source_mtime_ns") == st.st_mtime_ns
+                and os.path.getsize(pcm_path) == meta.get("frames", -1) * BYTES_POR_FRAME
+            )
+        except (FileNotFoundError, json.JSONDecodeError):
+            return False
+
+    def _decodificar(self, musica_path: str, pcm_path: str, meta_path: str) -> None:
+        print(f"🎵 Decodificando música para o cache PCM: {musica_path}")
+        st = os.stat(musica_path)
+        temp = f"{pcm_path}.{uuid.uuid4().hex}.tmp"
+        try:
+            proc = executar(_cmd_decodificar(musica_path, temp), timeout=timeout_etapa("audio_decode"))
+            if proc.returncode != 0:
+                raise RuntimeError(f"Falha ao decodificar {musica_path} para PCM: {proc.stderr}")
+            frames = os.path.getsize(temp) // BYTES_POR_FRAME
+            os.replace(temp, pcm_path)
+        finally:
+            if os.path.exists(temp):
+                os.remove(temp)
+
+        meta_temp = f"{meta_path}.{uuid.uuid4().hex}.tmp"
+        with open(meta_temp, "w", encoding="utf-8") as f:
+            json.dump({"source_size": st.st_size, "source_mtime_ns": st.st_mtime_ns, "frames": frames}, f)
+        os.replace(meta_temp, meta_path)
+
+    def obter(self, musica_path: str) -> np.memmap:
+        """
+        Retorna o PCM da música como memmap (frames x canais, int16),
+        decodificando na primeira vez ou quando a fonte mudou.
+        """
+        nome = os.path.splitext(os.path.basename(musica_path))[0]
+        pcm_path, meta_path = self._caminhos(nome)
+
+        with self._lock_chave(nome):
+            if not self._valido(musica_path, pcm_path, meta_path):
+                registrar_cache("pcm", hit=False)
+                with etapa("audio_decode", bytes_entrada=tamanho(musica_path)) as medida:
+                    self._decodificar(musica_path, pcm_path, meta_path)
+                    medida["bytes_saida"] = tamanho(pcm_path)
+                self._despejar(manter=pcm_path)
+            else:
+                registrar_cache("pcm", hit=True)
+                os.utime(pcm_path)  # marca uso recente p/ LRU
+
+        if os.path.getsize(pcm_path) == 0:
+            return np.zeros((0, CANAIS), dtype=np.int16)
+        return np.memmap(pcm_path, dtype=np.int16, mode="r").reshape(-1, CANAIS)
+
+    def carregar(self, musica_path: str) -> np.ndarray:
+        """
+        PCM da música para as análises (ritmo, forma de onda): do cache se ele
+        estiver ativo; senão decodificado para um array transitório, sem
+        gravar nada em cache_dir.
+        """
+        if self.ativo:
+            return self.obter(musica_path)
+        dados = bytearray()
+        with etapa("audio_decode", bytes_entrada=tamanho(musica_path)) as medida:
+            proc = executar(
+                _cmd_decodificar(musica_path, "pipe:1"),
+                timeout=timeout_etapa("audio_decode"), ao_ler_bloco=dados.extend
+            )
+            if proc.returncode != 0:
+                raise RuntimeError(f"Falha ao decodificar {musica_path} para PCM: {proc.stderr}")
+            medida["bytes_saida"] = len(dados)
+        del dados[len(dados) - len(dados) % BYTES_POR_FRAME:]
+        return np.frombuffer(dados, dtype=np.int16).reshape(-1, CANAIS)
+
+    def _despejar(self, manter: Optional[str] = None) -> None:
+        """Remove as faixas menos usadas até o cache caber em max_bytes."""
+        entradas = []
+        for arquivo in os.listdir(self.cache_dir):
+            if not arquivo.endswith(".s16le"):
+                continue
+            caminho = os.path.join(self.cache_dir, arquivo)
+            try:
+                st = os.stat(caminho)
+            except FileNotFoundError:
+                continue
+            entradas.append((st.st_mtime, st.st_size, caminho))
+
+        total = sum(tamanho for _, tamanho, _ in entradas)
+        for _, tamanho, caminho in sorted(entradas):
+            if total <= self.max_bytes:
+                break
+            if caminho == manter:
+                continue
+            # Um memmap aberto continua válido após o unlink (Linux)
+            self.invalidar(os.path.splitext(os.path.basename(caminho))[0])
+            total -= tamanho
+
+
+# =========================
+# Corte alinhado
+# =========================
+
+def fatiar(pcm: np.ndarray, inicio: float, duracao: float) -> np.ndarray:
+    """Trecho [inicio, inicio + duracao) em segundos, por offset de amostras (O(1), sem cópia)."""
+    primeiro = max(0, int(round(inicio * TAXA)))
+    ultimo = min(len(pcm), primeiro + int(round(duracao * TAXA)))
+    return pcm[primeiro:ultimo]
+
+
+def blocos(trecho: np.ndarray, frames_por_bloco: int = TAXA) -> Iterator[bytes]:
+    """Gera o trecho em blocos de bytes (padrão: 1 s) para alimentar o stdin do ffmpeg."""
+    for i in range(0, len(trecho), frames_por_bloco):
+        yield np.ascontiguousarray(trecho[i:i + frames_por_bloco]).tobytes()
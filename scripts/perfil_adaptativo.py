@@ -0,0 +1,102 @@
+# scripts/perfil_adaptativo.py
+# -*- coding: utf-8 -*-
+
+import os
+import threading
+from typing import Callable, Optional
+
+from scripts.edit import ENCODER_PROFILE, PERFIS_ENCODER
+
+
+# =========================
+# Configuração
+# =========================
+
+# Liga a troca automática de perfil conforme a carga do servidor
+ENCODER_ADAPTIVE = os.getenv("ENCODER_ADAPTIVE", "0") == "1"
+# Perfil usado enquanto o servidor está sob carga
+ENCODER_PROFILE_UNDER_LOAD = os.getenv("ENCODER_PROFILE_UNDER_LOAD", "preview")
+
+# Entra em carga acima dos limites "HIGH" e só volta abaixo dos "LOW" (histerese,
+# para não alternar de perfil a cada pedido)
+ADAPTIVE_QUEUE_HIGH = int(os.getenv("ADAPTIVE_QUEUE_HIGH", "4"))
+ADAPTIVE_QUEUE_LOW = int(os.getenv("ADAPTIVE_QUEUE_LOW", "1"))
+# Load average de 1 minuto por núcleo
+ADAPTIVE_LOAD_HIGH = float(os.getenv("ADAPTIVE_LOAD_HIGH", "0.9"))
+ADAPTIVE_LOAD_LOW = float(os.getenv("ADAPTIVE_LOAD_LOW", "0.6"))
+
+
+def carga_cpu() -> float:
+    """Load average de 1 minuto dividido pelo número de núcleos."""
+    try:
+        return os.getloadavg()[0] / (os.cpu_count() or 1)
+    except (AttributeError, OSError):
+        return 0.0
+
+
+# =========================
+# Seleção do perfil
+# =========================
+
+class SeletorPerfil:
+    """
+    Decide o perfil de encode de cada render.
+
+    Perfil pedido explicitamente é respeitado. Sem pedido (ou com "auto"),
+    usa o perfil padrão e, no modo adaptativo, passa para o perfil rápido
+    enquanto a fila de renders ou a carga de CPU estiverem acima dos limites,
+    voltando ao padrão quando as duas caem abaixo dos limites inferiores.
+    """
+
+    def __init__(
+        self,
+        profundidade: Callable[[], int],
+        carga: Callable[[], float] = carga_cpu,
+        adaptativo: bool = ENCODER_ADAPTIVE,
+        padrao: str = ENCODER_PROFILE,
+        sob_carga: str = ENCODER_PROFILE_UNDER_LOAD,
+        fila_alta: int = ADAPTIVE_QUEUE_HIGH,
+        fila_baixa: int = ADAPTIVE_QUEUE_LOW,
+        carga_alta: float = ADAPTIVE_LOAD_HIGH,
+        carga_baixa: float = ADAPTIVE_LOAD_LOW
+    ):
+        for nome in (padrao, sob_carga):
+            if nome not in PERFIS_ENCODER:
+                raise ValueError(f"Perfil de encode inválido: {nome}. Use: {', '.join(PERFIS_ENCODER)}")
+        self.profundidade = profundidade
+        self.carga = carga
+        self.adaptativo = adaptativo
+        self.padrao = padrao
+        self.perfil_sob_carga = sob_carga
+        self.fila_alta = fila_alta
+        self.fila_baixa = fila_baixa
+        self.carga_alta = carga_alta
+        self.carga_baixa = carga_baixa
+        self.sob_carga = False
+        self._lock = threading.Lock()
+
+    def _atualizar(self) -> bool:
+        """Reavalia a carga e retorna se o servidor está sob carga."""
+        fila, cpu = self.profundidade(), self.carga()
+        with self._lock:
+            if not self.sob_carga and (fila >= self.fila_alta or cpu >= self.carga_alta):
+                self.sob_carga = True
+                print(f"🐢 Servidor sob carga (fila={fila}, cpu={cpu:.2f}): perfil '{self.perfil_sob_carga}'")
+            elif self.sob_carga and fila <= self.fila_baixa and cpu <= self.carga_baixa:
+                self.sob_carga = False
+                print(f"🚀 Carga normalizada (fila={fila}, cpu={cpu:.2f}): perfil '{self.padrao}'")
+            return self.sob_carga
+
+    def escolher(self, pedido: Optional[str] = None) -> dict:
+        """
+        Retorna {'encoder_profile': perfil aplicado, 'degraded': bool}.
+        Levanta ValueError para perfil desconhecido.
+        """
+        if pedido and pedido != "auto":
+            if pedido not in PERFIS_ENCODER:
+                raise ValueError(f"Perfil de encode inválido: {pedido}. Use: auto, {', '.join(PERFIS_ENCODER)}")
+            return {"encoder_profile": pedido, "degraded": False}
+
+        if self.adaptativo and self._atualizar():
+            return {"encoder_profile": self.perfil_sob_carga, "degraded": self.perfil_sob_carga != self.padrao}
+        return {"encoder_profile": self.padrao, "degraded": False}
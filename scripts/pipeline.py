@@ -0,0 +1,377 @@
+# scripts/pipeline.py
+# -*- coding: utf-8 -*-
+
+import os
+from typing import Callable, Optional, Union
+
+from scripts.download import baixar_reel, chave_video, opcoes_formato, relatar_download, DownloadCache
+from scripts.edit import renderizar_musica, renderizar_lote, parametros_encoder, ENCODER_PROFILE, RENDER_MODE
+from scripts.fluxo import STREAM_RENDER, DownloadEmSegundoPlano, SaidaProgressiva
+from scripts.metricas import etapa, tamanho, PIPELINES_EM_ANDAMENTO
+from scripts.pcm_cache import PcmCache
+from scripts.render_cache import RenderCache, chave_render
+from scripts.ritmo import IndiceRitmo, resolver_impacto
+from scripts.processos import Cancelado, Cancelamento, cancelamento_atual, cancelavel, verificar_cancelamento
+from scripts.utils import em_uso
+
+# Ganho aplicado à música nos pedidos da API
+GAIN_DB = 6.0
+
+
+# =========================
+# Utilidades
+# =========================
+
+def _avisar_download(progresso: Optional[Callable[[dict], None]], concluido: bool) -> None:
+    """Reporta início/fim do download (sem percentual: o yt-dlp não é acompanhado)."""
+    if progresso is not None:
+        progresso({"stage": "download", "out_time": None, "speed": None,
+                   "percent": 100.0 if concluido else None, "done": concluido})
+
+
+def _baixar_video(
+    url: str,
+    cookie_file_path: str,
+    download_cache: Optional[DownloadCache],
+    progresso: Optional[Callable[[dict], None]] = None,
+    perfil: Optional[str] = None,
+    ao_receber: Optional[Callable[[dict], None]] = None
+) -> tuple[str, dict]:
+    """
+    Obtém o vídeo (do cache de downloads, se houver) no formato do perfil de
+    encode e retorna (caminho, relatório do download: ver relatar_download).
+    'ao_receber' acompanha o download, se houver (ver baixar_reel).
+    Levanta RuntimeError se falhar.
+    """
+    perfil = perfil or ENCODER_PROFILE
+    _avisar_download(progresso, False)
+    with etapa("download") as medida, relatar_download() as relatorio:
+        if download_cache is not None:
+            video_path = download_cache.obter(
+                url, cookie_file_path=cookie_file_path, perfil=perfil, ao_receber=ao_receber
+            )
+        else:
+            video_path = baixar_reel(url, cookie_file_path=cookie_file_path, perfil=perfil, ao_receber=ao_receber)
+        medida["bytes_entrada"] = relatorio["bytes"]
+        medida["bytes_saida"] = tamanho(video_path)
+    if not video_path or not os.path.exists(video_path):
+        raise RuntimeError("Falha ao baixar o vídeo. Verifique se a sessão de cookies ainda é válida.")
+    _avisar_download(progresso, True)
+    verificar_cancelamento()
+    return video_path, relatorio
+
+
+def _renderizar_durante_download(
+    baixar: Callable[[Callable[[dict], None]], tuple[str, dict]],
+    renderizar: Callable[[str, bool], dict],
+    preparar_musica: Callable[[], object]
+) -> tuple[str, dict, Optional[dict]]:
+    """
+    Modo STREAM_RENDER: o download ('baixar', ver _baixar_video) roda em
+    segundo plano e o render começa assim que o MP4 parcial tem o índice
+    completo ('moov' antes do 'mdat'), lendo os bytes conforme chegam; enquanto
+    isso a música é preparada ('preparar_musica'). A latência fica perto do
+    maior dos dois, e não da soma.
+
+    Sem arquivo parcial legível (vídeo em cache, 'moov' no fim) ou se o render
+    parcial falhar por outro motivo que não o cancelamento do pedido, só espera
+    o download: o render do arquivo completo fica com quem chamou. Falha no
+    download interrompe o render e o erro do download sobe.
+
+    Retorna (caminho do vídeo, relatório do download, resultado do render ou
+    None se ele ainda precisa ser feito).
+    """
+    pedido = cancelamento_atual()
+    cancelamento = Cancelamento(verificar=lambda: pedido is not None and pedido.cancelado)
+    baixando = DownloadEmSegundoPlano(baixar, ao_falhar=lambda _: cancelamento.cancelar("falha no download")).iniciar()
+
+    preparar_musica()
+    parcial = baixando.esperar_cabecalho()
+    render = None
+    if parcial is not None:
+        print(f"🌊 Renderizando durante o download: {parcial}")
+        try:
+            with cancelavel(cancelamento):
+                render = renderizar(parcial, True)
+        except Cancelado:
+            if pedido is not None and pedido.cancelado:
+                raise
+            # Download falhou: o erro dele sobe em baixando.resultado()
+        except Exception as e:
+            print(f"⚠️ Render durante o download falhou ({e}); renderizando o arquivo completo")
+
+    video_path, download = baixando.resultado()
+    download["streamed"] = render is not None
+    return video_path, download, render
+
+
+def _descartar_video(video_path: str, download_cache: Optional[DownloadCache]) -> None:
+    """
+    Sem cache, remove o vídeo original após processamento
+    (com cache, a remoção fica por conta da política de despejo).
+    """
+    with etapa("cleanup"):
+        try:
+            if download_cache is None and os.path.exists(video_path):
+                os.remove(video_path)
+                print(f"✅ Vídeo original removido: {video_path}")
+        except Exception as e:
+            # Não falha o processamento se não conseguir remover
+            print(f"⚠️ Aviso: Não foi possível remover vídeo original {video_path}: {e}")
+
+
+def _chave(
+    url: str,
+    musica_path: str,
+    impact_music: float,
+    impact_video: float,
+    render_cache: RenderCache,
+    perfil: Optional[str] = None,
+    fragmentado: bool = False
+) -> str:
+    """
+    Chave do cache de renders para um pedido (ver chave_render). O contêiner
+    entra na chave: o MP4 fragmentado de um pedido "stream" não é servido a
+    pedidos que esperam o arquivo com faststart, e vice-versa.
+    """
+    return chave_render(
+        video=chave_video(url),
+        music_sha256=render_cache.hash_musica(musica_path),
+        impact_music=float(impact_music),
+        impact_video=float(impact_video),
+        gain_db=GAIN_DB,
+        encoder=parametros_encoder(perfil=perfil),
+        download=opcoes_formato(perfil or ENCODER_PROFILE),
+        container="fragmented" if fragmentado else "faststart"
+    )
+
+
+# =========================
+# Pipeline completo (download → alinhamento → mux)
+# =========================
+
+def executar_pipeline(
+    url: str,
+    music: str,
+    impact_music: Union[float, str],
+    impact_video: float,
+    cookie_file_path: str = None,
+    pcm_cache: Optional[PcmCache] = None,
+    download_cache: Optional[DownloadCache] = None,
+    render_cache: Optional[RenderCache] = None,
+    encoder_profile: Optional[str] = None,
+    progresso: Optional[Callable[[dict], None]] = None,
+    indice_ritmo: Optional[IndiceRitmo] = None,
+    saida: Optional[SaidaProgressiva] = None,
+) -> dict:
+    """
+    Executa o pipeline completo de um pedido de edição e retorna um dict com
+    'filename' e 'video_path' do vídeo final em processed/, 'video_mode'
+    ("copy" ou "transcode", o caminho de render usado), 'encoder_profile',
+    'cache' ("hit", "miss" ou None sem cache de renders), 'impact_music'
+    (em segundos, já resolvido) e 'download' (bytes recebidos, tempo de
+    merge e formato; None se nada foi baixado, ver relatar_download).
+
+    Usado tanto pelo endpoint síncrono /processar quanto pela fila de jobs.
+    Com 'pcm_cache', a música é lida já decodificada do cache PCM.
+    Com 'download_cache', o vídeo vem do cache de downloads (e fica lá para
+    os próximos pedidos); sem ele, é baixado e removido ao final.
+    Com 'render_cache', um pedido idêntico a um já renderizado devolve a
+    saída existente sem baixar nem renderizar nada.
+    Com 'progresso', o callback recebe o andamento do download e de cada
+    ffmpeg do render (ver renderizar_musica).
+    Com 'indice_ritmo', 'impact_music' aceita "auto" e "beat:X" (ver
+    scripts/ritmo.py), resolvidos antes do cache de renders.
+    Com 'saida', o render (modo single) grava MP4 fragmentado que pode ser
+    entregue enquanto é produzido (ver SaidaProgressiva); num acerto do cache
+    de renders nada é escrito nela. No cache, essa saída fica numa chave
+    própria (ver _chave).
+    Erros seguem o padrão do sistema:
+    - FileNotFoundError: música inexistente
+    - SemBatidas: impacto automático sem batidas detectadas na música
+    - RuntimeError: falha no download do vídeo
+    """
+    musica_path = os.path.join("music", f"{music}.mp3")
+    if not os.path.exists(musica_path):
+        raise FileNotFoundError(f"Música não encontrada: {musica_path}")
+    impact_music = resolver_impacto(indice_ritmo, musica_path, impact_music)
+    download = None
+
+    def _renderizar(output_path: str) -> dict:
+        nonlocal download
+
+        def _render(video_path: str, video_parcial: bool = False) -> dict:
+            return renderizar_musica(
+                video_path=video_path,
+                musica_path=musica_path,
+                segundo_video=impact_video,
+                output_path=output_path,
+                music_impact=impact_music,
+                gain_db=GAIN_DB,
+                pcm_cache=pcm_cache,
+                perfil=encoder_profile,
+                progresso=progresso,
+                video_parcial=video_parcial,
+                modo="single" if saida is not None else None,
+                saida=saida
+            )
+
+        def _baixar(ao_receber: Optional[Callable[[dict], None]] = None) -> tuple[str, dict]:
+            return _baixar_video(url, cookie_file_path, download_cache, progresso, encoder_profile, ao_receber)
+
+        def _preparar_musica() -> None:
+            # Decodifica a música para o cache PCM enquanto o vídeo chega
+            if pcm_cache is not None and pcm_cache.ativo:
+                pcm_cache.obter(musica_path)
+
+        if STREAM_RENDER and RENDER_MODE == "single":
+            video_path, download, render = _renderizar_durante_download(_baixar, _render, _preparar_musica)
+        else:
+            (video_path, download), render = _baixar(), None
+        try:
+            if render is None:
+                # Marca o vídeo em uso: a limpeza de disco não o remove durante o render
+                with em_uso(video_path):
+                    render = _render(video_path)
+        finally:
+            _descartar_video(video_path, download_cache)
+        return {"video_mode": render["video_mode"], "encoder_profile": render["encoder_profile"]}
+
+    with PIPELINES_EM_ANDAMENTO.rastrear():
+        if render_cache is None:
+            filename = f"{chave_video(url)}_{music}.mp4"
+            out = os.path.join("processed", filename)
+            render = _renderizar(out)
+            return {
+                "filename": filename, "video_path": out, "cache": None,
+                "impact_music": impact_music, "download": download, **render
+            }
+
+        chave = _chave(
+            url, musica_path, impact_music, impact_video, render_cache, encoder_profile, fragmentado=saida is not None
+        )
+        filename = render_cache.nome_arquivo(chave, f"{chave_video(url)}_{music}")
+        out, meta, hit = render_cache.obter_ou_renderizar(chave, filename, _renderizar)
+        if hit:
+            print(f"♻️ Render em cache: {out}")
+
+        return {
+            "filename": os.path.basename(out),
+            "video_path": out,
+            "video_mode": meta.get("video_mode"),
+            "encoder_profile": meta.get("encoder_profile") or encoder_profile or ENCODER_PROFILE,
+            "cache": "hit" if hit else "miss",
+            "impact_music": impact_music,
+            "download": download
+        }
+
+
+def executar_lote(
+    url: str,
+    variantes: list[dict],
+    cookie_file_path: str = None,
+    pcm_cache: Optional[PcmCache] = None,
+    download_cache: Optional[DownloadCache] = None,
+    render_cache: Optional[RenderCache] = None,
+    encoder_profile: Optional[str] = None,
+    progresso: Optional[Callable[[dict], None]] = None,
+    indice_ritmo: Optional[IndiceRitmo] = None,
+) -> dict:
+    """
+    Executa um lote: um vídeo, várias variantes (music, impact_music, impact_video).
+    O vídeo é baixado e analisado uma única vez; ver renderizar_lote.
+    Com 'render_cache', só as variantes ainda não renderizadas são processadas
+    (e o download só acontece se houver alguma).
+    Com 'progresso', o callback recebe o andamento (ver renderizar_lote).
+    Com 'indice_ritmo', cada 'impact_music' aceita "auto" e "beat:X".
+
+    Retorna dict com 'video_mode', 'encoder_profile', 'download' (ver
+    executar_pipeline) e 'results' (um por variante, na ordem recebida, com
+    'ok', 'filename', 'video_path', 'cache' ou 'error', e 'impact_music' já
+    em segundos).
+    """
+    for v in variantes:
+        musica_path = os.path.join("music", f"{v['music']}.mp3")
+        if not os.path.exists(musica_path):
+            raise FileNotFoundError(f"Música não encontrada: {musica_path}")
+    variantes = [
+        {**v, "impact_music": resolver_impacto(indice_ritmo, os.path.join("music", f"{v['music']}.mp3"), v["impact_music"])}
+        for v in variantes
+    ]
+
+    base = chave_video(url)
+    results = [{**v} for v in variantes]
+    pendentes = []  # (índice, chave, filename, caminho de escrita)
+    for i, v in enumerate(variantes):
+        musica_path = os.path.join("music", f"{v['music']}.mp3")
+        if render_cache is None:
+            filename = f"{base}_{v['music']}_iv{v['impact_video']:.2f}_im{v['impact_music']:.2f}.mp4"
+            pendentes.append((i, None, filename, os.path.join("processed", filename)))
+            continue
+
+        chave = _chave(url, musica_path, v["impact_music"], v["impact_video"], render_cache, encoder_profile)
+        encontrado = render_cache.procurar(chave)
+        render_cache.contar(encontrado is not None)
+        if encontrado:
+            out, _ = encontrado
+            results[i].update({"ok": True, "filename": os.path.basename(out), "video_path": out, "cache": "hit"})
+        else:
+            filename = render_cache.nome_arquivo(chave, f"{base}_{v['music']}")
+            pendentes.append((i, chave, filename, render_cache.caminho_temporario(chave)))
+
+    video_mode = None
+    download = None
+    if pendentes:
+        video_path, download = _baixar_video(url, cookie_file_path, download_cache, progresso, encoder_profile)
+        try:
+            # Vídeo protegido da limpeza de disco enquanto o lote roda
+            with em_uso(video_path):
+                lote = renderizar_lote(
+                    video_path,
+                    [
+                        {
+                            "musica_path": os.path.join("music", f"{variantes[i]['music']}.mp3"),
+                            "music_impact": variantes[i]["impact_music"],
+                            "segundo_video": variantes[i]["impact_video"],
+                            "output_path": destino,
+                            "gain_db": GAIN_DB,
+                        }
+                        for i, _, _, destino in pendentes
+                    ],
+                    pcm_cache=pcm_cache,
+                    perfil=encoder_profile,
+                    progresso=progresso
+                )
+        except BaseException:
+            # Falha/cancelamento do lote inteiro: descarta as saídas temporárias já geradas
+            if render_cache is not None:
+                for _, _, _, destino in pendentes:
+                    if os.path.exists(destino):
+                        os.remove(destino)
+            raise
+        finally:
+            _descartar_video(video_path, download_cache)
+
+        video_mode = lote["video_mode"]
+        for (i, chave, filename, destino), r in zip(pendentes, lote["results"]):
+            if not r["ok"]:
+                results[i].update({"ok": False, "error": r["error"]})
+                if render_cache is not None and os.path.exists(destino):
+                    os.remove(destino)
+                continue
+            if render_cache is not None:
+                out = render_cache.publicar(
+                    destino, filename, {"video_mode": video_mode, "encoder_profile": lote["encoder_profile"]}
+                )
+                results[i].update({"ok": True, "filename": filename, "video_path": out, "cache": "miss"})
+            else:
+                results[i].update({"ok": True, "filename": filename, "video_path": destino, "cache": None})
+        if render_cache is not None:
+            render_cache.despejar()
+
+    return {
+        "video_mode": video_mode,
+        "encoder_profile": encoder_profile or ENCODER_PROFILE,
+        "download": download,
+        "results": results
+    }
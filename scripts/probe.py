@@ -0,0 +1,234 @@
+# scripts/probe.py
+# -*- coding: utf-8 -*-
+
+import os
+import copy
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from scripts.metricas import etapa, registrar_cache, tamanho
+from scripts.processos import TempoEsgotado, executar
+
+
+# =========================
+# Configuração
+# =========================
+
+PROBE_CACHE_MAX_ENTRIES = int(os.getenv("PROBE_CACHE_MAX_ENTRIES", "1024"))
+# Vazio = cache só em memória (por processo); um caminho .sqlite3 compartilha entre workers
+PROBE_CACHE_PATH = os.getenv("PROBE_CACHE_PATH", "")
+PROBE_TIMEOUT = float(os.getenv("PROBE_TIMEOUT", "30"))
+
+# Janela (s) de pacotes lidos para medir o intervalo entre keyframes (sem decodificar)
+_JANELA_KEYFRAMES = 10
+
+
+# =========================
+# ffprobe
+# =========================
+
+def _executar_ffprobe(path: str, timeout: float) -> dict:
+    """Uma única chamada ao ffprobe: formato, todos os streams e pacotes do início."""
+    cmd = [
+        "ffprobe", "-v", "error",
+        "-show_entries", "format=duration,format_name,bit_rate",
+        "-show_entries",
+        "stream=index,codec_type,codec_name,profile,pix_fmt,width,height,"
+        "avg_frame_rate,r_frame_rate,sample_rate,channels",
+        "-show_entries", "packet=stream_index,pts_time,flags",
+        "-read_intervals", f"%+{_JANELA_KEYFRAMES}",
+        "-of", "json",
+        path
+    ]
+    try:
+        proc = executar(cmd, timeout=timeout)
+    except TempoEsgotado:
+        raise RuntimeError(f"Timeout ao analisar {path}")
+    if proc.returncode != 0:
+        raise RuntimeError(f"ffprobe falhou para {path}: {proc.stderr.strip()}")
+    try:
+        return json.loads(proc.stdout)
+    except json.JSONDecodeError as e:
+        raise RuntimeError(f"Erro ao processar resposta do ffprobe para {path}: {e}")
+
+
+def _fracao(valor: Optional[str]) -> Optional[float]:
+    """'30000/1001' → 29.97; None para ausente ou '0/0'."""
+    try:
+        num, _, den = (valor or "").partition("/")
+        resultado = float(num) / float(den or 1)
+    except (ValueError, ZeroDivisionError):
+        return None
+    return resultado or None
+
+
+def _intervalo_keyframes(pacotes: list[dict], indice: int) -> Optional[float]:
+    """Média (s) entre keyframes consecutivos do stream na janela lida."""
+    tempos = sorted(
+        float(p["pts_time"]) for p in pacotes
+        if p.get("stream_index") == indice and "K" in p.get("flags", "") and p.get("pts_time") not in (None, "N/A")
+    )
+    if len(tempos) < 2:
+        return None
+    return round((tempos[-1] - tempos[0]) / (len(tempos) - 1), 3)
+
+
+def _normalizar(data: dict) -> dict:
+    """
+    Resume a saída do ffprobe: duração/formato e o primeiro stream de vídeo e
+    de áudio ('video'/'audio' são None se o arquivo não tiver esse tipo).
+    """
+    formato = data.get("format") or {}
+    streams = data.get("streams") or []
+
+    try:
+        duracao = float(formato.get("duration"))
+    except (TypeError, ValueError):
+        duracao = None
+
+    video = next((s for s in streams if s.get("codec_type") == "video"), None)
+    audio = next((s for s in streams if s.get("codec_type") == "audio"), None)
+
+    info = {
+        "duration": duracao,
+        "format_name": formato.get("format_name"),
+        "bit_rate": int(formato["bit_rate"]) if str(formato.get("bit_rate", "")).isdigit() else None,
+        "video": None,
+        "audio": None,
+    }
+    if video is not None:
+        info["video"] = {
+            "codec_name": video.get("codec_name"),
+            "profile": video.get("profile"),
+            "pix_fmt": video.get("pix_fmt"),
+            "width": video.get("width"),
+            "height": video.get("height"),
+            "fps": _fracao(video.get("avg_frame_rate")) or _fracao(video.get("r_frame_rate")),
+            "keyframe_interval": _intervalo_keyframes(data.get("packets") or [], video.get("index")),
+        }
+    if audio is not None:
+        info["audio"] = {
+            "codec_name": audio.get("codec_name"),
+            "sample_rate": int(audio["sample_rate"]) if audio.get("sample_rate") else None,
+            "channels": audio.get("channels"),
+        }
+    return info
+
+
+# =========================
+# Cache
+# =========================
+
+class ProbeCache:
+    """
+    LRU limitado dos resultados de probe, indexado por (caminho, inode,
+    tamanho, mtime): qualquer alteração no arquivo gera uma nova chave.
+    Com 'caminho_db', os resultados também ficam em SQLite e são
+    reaproveitados por outros workers e após reinícios.
+    """
+
+    def __init__(self, max_entradas: int = PROBE_CACHE_MAX_ENTRIES, caminho_db: str = PROBE_CACHE_PATH):
+        self.max_entradas = max_entradas
+        self.caminho_db = caminho_db or None
+        self.hits = 0
+        self.misses = 0
+        self._memoria: OrderedDict[str, dict] = OrderedDict()
+        self._lock = threading.Lock()
+        if self.caminho_db:
+            os.makedirs(os.path.dirname(self.caminho_db) or ".", exist_ok=True)
+            with self._conectar() as conn:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS probes "
+                    "(chave TEXT PRIMARY KEY, info TEXT NOT NULL, usado_em REAL NOT NULL)"
+                )
+
+    def _conectar(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.caminho_db, timeout=30)
+
+    @staticmethod
+    def chave(path: str) -> str:
+        st = os.stat(path)
+        return f"{os.path.abspath(path)}|{st.st_ino}|{st.st_size}|{st.st_mtime_ns}"
+
+    def obter(self, chave: str) -> Optional[dict]:
+        with self._lock:
+            info = self._memoria.get(chave)
+            if info is not None:
+                self._memoria.move_to_end(chave)
+                self.hits += 1
+                return info
+        if self.caminho_db:
+            with self._conectar() as conn:
+                row = conn.execute("SELECT info FROM probes WHERE chave = ?", (chave,)).fetchone()
+            if row:
+                info = json.loads(row[0])
+                self._guardar_memoria(chave, info)
+                with self._lock:
+                    self.hits += 1
+                return info
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def _guardar_memoria(self, chave: str, info: dict) -> None:
+        with self._lock:
+            self._memoria[chave] = info
+            self._memoria.move_to_end(chave)
+            while len(self._memoria) > self.max_entradas:
+                self._memoria.popitem(last=False)
+
+    def guardar(self, chave: str, info: dict) -> None:
+        self._guardar_memoria(chave, info)
+        if self.caminho_db:
+            with self._conectar() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO probes (chave, info, usado_em) VALUES (?, ?, julianday('now'))",
+                    (chave, json.dumps(info))
+                )
+                # Mantém o arquivo limitado ao mesmo número de entradas
+                conn.execute(
+                    "DELETE FROM probes WHERE chave NOT IN "
+                    "(SELECT chave FROM probes ORDER BY usado_em DESC LIMIT ?)",
+                    (self.max_entradas,)
+                )
+
+
+_cache = ProbeCache()
+
+
+def _executar(path: str, timeout: float) -> dict:
+    with etapa("probe", bytes_entrada=tamanho(path)):
+        return _normalizar(_executar_ffprobe(path, timeout))
+
+
+def sondar(path: str, memorizar: bool = True, timeout: float = PROBE_TIMEOUT) -> dict:
+    """
+    Analisa um arquivo de mídia em uma única chamada ao ffprobe e retorna
+    duração, formato e dados do primeiro stream de vídeo (codec, pix_fmt,
+    profile, resolução, fps, intervalo entre keyframes) e de áudio (codec,
+    taxa de amostragem, canais). Sondagens repetidas do mesmo arquivo saem
+    do cache; use memorizar=False para arquivos temporários.
+    Levanta RuntimeError se o ffprobe falhar.
+    """
+    if not memorizar:
+        return _executar(path, timeout)
+
+    chave = ProbeCache.chave(path)
+    info = _cache.obter(chave)
+    registrar_cache("probe", hit=info is not None)
+    if info is None:
+        info = _executar(path, timeout)
+        _cache.guardar(chave, info)
+    return copy.deepcopy(info)
+
+
+def duracao(path: str, memorizar: bool = True) -> float:
+    """Duração (segundos) via sondar(); levanta RuntimeError se o arquivo não tiver duração."""
+    info = sondar(path, memorizar=memorizar)
+    if not info["duration"]:
+        raise RuntimeError(f"Não foi possível ler duração de {path}")
+    return info["duration"]
@@ -0,0 +1,292 @@
+# scripts/processos.py
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import time
+import signal
+import asyncio
+import threading
+import subprocess
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Iterable, Iterator, Optional
+
+from scripts.metricas import registrar_subprocesso
+
+
+# =========================
+# Configuração
+# =========================
+
+# Tempo máximo (s) de cada etapa; ajustes via STAGE_TIMEOUTS='{"mux": 3600}' (0 = sem limite).
+# O ffprobe usa PROBE_TIMEOUT (scripts/probe.py)
+TIMEOUTS_PADRAO = {
+    "download": 600,
+    "audio_decode": 300,
+    "audio_extract": 300,
+    "video_encode": 1800,
+    "mux": 1800,
+    "upload_convert": 120,
+}
+STAGE_TIMEOUTS = {**TIMEOUTS_PADRAO, **json.loads(os.getenv("STAGE_TIMEOUTS", "{}") or "{}")}
+
+# Tempo entre o SIGTERM e o SIGKILL ao encerrar um grupo de processos
+PROCESS_KILL_GRACE = float(os.getenv("PROCESS_KILL_GRACE", "2"))
+# Frequência com que o cancelamento é verificado enquanto o processo roda
+_INTERVALO_CANCELAMENTO = 0.1
+# Quanto do stderr guardar para mensagens de erro (o restante é descartado ao ler)
+STDERR_MAX_BYTES = 64 * 1024
+
+
+def timeout_etapa(nome: str) -> Optional[float]:
+    """Timeout configurado da etapa (None = sem limite)."""
+    valor = STAGE_TIMEOUTS.get(nome)
+    return float(valor) if valor else None
+
+
+# =========================
+# Cancelamento
+# =========================
+
+class Cancelado(RuntimeError):
+    """O pedido foi cancelado (cliente desconectou ou job cancelado)."""
+
+
+class TempoEsgotado(RuntimeError):
+    """Um subprocesso passou do timeout da sua etapa."""
+
+
+class Cancelamento:
+    """
+    Sinal de cancelamento de um pedido. 'verificar' é uma checagem extra
+    (ex.: marcador em disco de um job cancelado por outro worker).
+    """
+
+    def __init__(self, verificar: Optional[Callable[[], bool]] = None):
+        self.verificar = verificar
+        self.motivo = None
+        self._evento = threading.Event()
+
+    def cancelar(self, motivo: str = "cancelado") -> None:
+        self.motivo = self.motivo or motivo
+        self._evento.set()
+
+    @property
+    def cancelado(self) -> bool:
+        if not self._evento.is_set() and self.verificar is not None and self.verificar():
+            self.cancelar("job cancelado")
+        return self._evento.is_set()
+
+    def verificar_ou_levantar(self) -> None:
+        if self.cancelado:
+            raise Cancelado(f"Processamento cancelado: {self.motivo}")
+
+
+_cancelamento: ContextVar[Optional[Cancelamento]] = ContextVar("cancelamento", default=None)
+
+
+@contextmanager
+def cancelavel(cancelamento: Cancelamento) -> Iterator[Cancelamento]:
+    """
+    Associa o cancelamento ao contexto atual: os subprocessos iniciados dentro
+    do bloco (nesta thread, ou em threads que herdem o contexto) são encerrados
+    quando ele for acionado.
+    """
+    token = _cancelamento.set(cancelamento)
+    try:
+        yield cancelamento
+    finally:
+        _cancelamento.reset(token)
+
+
+def cancelamento_atual() -> Optional[Cancelamento]:
+    return _cancelamento.get()
+
+
+def verificar_cancelamento() -> None:
+    """Levanta Cancelado se o pedido atual já foi cancelado (checagem entre etapas)."""
+    atual = _cancelamento.get()
+    if atual is not None:
+        atual.verificar_ou_levantar()
+
+
+# =========================
+# Execução
+# =========================
+
+async def iniciar_async(cmd: list[str], **kwargs) -> asyncio.subprocess.Process:
+    """Inicia o processo em um grupo próprio, para poder encerrá-lo com os filhos."""
+    return await asyncio.create_subprocess_exec(*cmd, start_new_session=True, **kwargs)
+
+
+async def encerrar_grupo(proc: asyncio.subprocess.Process, espera: float = PROCESS_KILL_GRACE) -> None:
+    """SIGTERM no grupo do processo e, se não sair em 'espera' segundos, SIGKILL."""
+    for sinal in (signal.SIGTERM, signal.SIGKILL):
+        try:
+            os.killpg(proc.pid, sinal)
+        except (ProcessLookupError, PermissionError):
+            break
+        try:
+            await asyncio.wait_for(proc.wait(), espera)
+            break
+        except asyncio.TimeoutError:
+            continue
+    if proc.returncode is None:
+        await proc.wait()
+
+
+async def _vigiar(cancelamento: Cancelamento) -> None:
+    while not cancelamento.cancelado:
+        await asyncio.sleep(_INTERVALO_CANCELAMENTO)
+
+
+async def executar_async(
+    cmd: list[str],
+    *,
+    timeout: Optional[float] = None,
+    entrada: Optional[Iterable[bytes]] = None,
+    ao_ler_linha: Optional[Callable[[str], None]] = None,
+    ao_ler_bloco: Optional[Callable[[bytes], None]] = None,
+    cancelamento: Optional[Cancelamento] = None
+) -> subprocess.CompletedProcess:
+    """
+    Executa o comando em um grupo de processos próprio, com stdout/stderr
+    drenados enquanto ele roda:
+    - stdin recebe os blocos de 'entrada' conforme são gerados (se houver);
+    - stdout vai linha a linha para 'ao_ler_linha' (progresso), bloco a bloco
+      para 'ao_ler_bloco' (saída binária, ex.: vídeo em um pipe) ou é acumulado;
+    - do stderr só ficam os últimos STDERR_MAX_BYTES.
+
+    Passando de 'timeout' (TempoEsgotado) ou com o 'cancelamento' acionado
+    (Cancelado), o grupo inteiro é encerrado antes de a exceção subir; o mesmo
+    vale se a própria corrotina for cancelada.
+
+    Toda execução vai para as métricas de subprocessos (clip_subprocess_*),
+    inclusive as que não terminam: 'exit_code' é o código de saída ou
+    timeout, cancelled, spawn_error (o processo nem iniciou) ou error.
+    """
+    cancelamento = cancelamento or cancelamento_atual()
+    if cancelamento is not None:
+        cancelamento.verificar_ou_levantar()
+
+    bytes_lidos = {"bytes_stdin": 0, "bytes_stdout": 0}
+    inicio = time.perf_counter()
+    desfecho = "spawn_error"
+    try:
+        proc = await iniciar_async(
+            cmd,
+            stdin=subprocess.PIPE if entrada is not None else subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE
+        )
+        desfecho = "error"
+        resultado = await _acompanhar(proc, cmd, timeout, entrada, ao_ler_linha, ao_ler_bloco, cancelamento, bytes_lidos)
+        desfecho = resultado.returncode
+        return resultado
+    except TempoEsgotado:
+        desfecho = "timeout"
+        raise
+    except (Cancelado, asyncio.CancelledError):
+        desfecho = "cancelled"
+        raise
+    finally:
+        registrar_subprocesso(os.path.basename(cmd[0]), time.perf_counter() - inicio, desfecho, **bytes_lidos)
+
+
+async def _acompanhar(
+    proc: asyncio.subprocess.Process,
+    cmd: list[str],
+    timeout: Optional[float],
+    entrada: Optional[Iterable[bytes]],
+    ao_ler_linha: Optional[Callable[[str], None]],
+    ao_ler_bloco: Optional[Callable[[bytes], None]],
+    cancelamento: Optional[Cancelamento],
+    bytes_lidos: dict
+) -> subprocess.CompletedProcess:
+    """Corpo de executar_async com o processo já iniciado; conta os bytes de stdin/stdout em 'bytes_lidos'."""
+    saida = bytearray()
+    cauda_stderr = bytearray()
+
+    async def _escrever():
+        try:
+            for bloco in entrada:
+                proc.stdin.write(bloco)
+                await proc.stdin.drain()
+                bytes_lidos["bytes_stdin"] += len(bloco)
+        except (BrokenPipeError, ConnectionResetError):
+            # O processo encerrou antes de consumir tudo (ex.: -shortest); o returncode decide
+            pass
+        finally:
+            try:
+                proc.stdin.close()
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+    async def _ler_stdout():
+        if ao_ler_bloco is not None:
+            while bloco := await proc.stdout.read(65536):
+                bytes_lidos["bytes_stdout"] += len(bloco)
+                ao_ler_bloco(bloco)
+            return
+        if ao_ler_linha is None:
+            while bloco := await proc.stdout.read(65536):
+                bytes_lidos["bytes_stdout"] += len(bloco)
+                saida.extend(bloco)
+            return
+        async for linha in proc.stdout:
+            bytes_lidos["bytes_stdout"] += len(linha)
+            ao_ler_linha(linha.decode("utf-8", "replace"))
+
+    async def _ler_stderr():
+        while bloco := await proc.stderr.read(8192):
+            cauda_stderr.extend(bloco)
+            if len(cauda_stderr) > STDERR_MAX_BYTES:
+                del cauda_stderr[:len(cauda_stderr) - STDERR_MAX_BYTES]
+
+    tarefas = [_ler_stdout(), _ler_stderr()]
+    if entrada is not None:
+        tarefas.append(_escrever())
+    principal = asyncio.ensure_future(asyncio.gather(*tarefas, proc.wait()))
+    vigia = asyncio.ensure_future(_vigiar(cancelamento)) if cancelamento is not None else None
+
+    try:
+        concluidas, _ = await asyncio.wait(
+            [t for t in (principal, vigia) if t is not None],
+            timeout=timeout,
+            return_when=asyncio.FIRST_COMPLETED
+        )
+        if principal not in concluidas:
+            await encerrar_grupo(proc)
+            if vigia is not None and vigia in concluidas:
+                raise Cancelado(f"Processamento cancelado: {cancelamento.motivo}")
+            raise TempoEsgotado(f"Tempo esgotado ({timeout:.0f}s): {os.path.basename(cmd[0])}")
+        principal.result()
+    except BaseException:
+        if proc.returncode is None:
+            await asyncio.shield(encerrar_grupo(proc))
+        raise
+    finally:
+        for tarefa in (principal, vigia):
+            if tarefa is not None and not tarefa.done():
+                tarefa.cancel()
+                try:
+                    await tarefa
+                except (asyncio.CancelledError, Exception):
+                    pass
+
+    return subprocess.CompletedProcess(
+        cmd, proc.returncode,
+        saida.decode("utf-8", "replace"),
+        cauda_stderr.decode("utf-8", "replace")
+    )
+
+
+def executar(cmd: list[str], **kwargs) -> subprocess.CompletedProcess:
+    """
+    Versão síncrona de executar_async para código que roda em threads (render,
+    jobs): usa um event loop próprio da thread. O cancelamento padrão é o do
+    contexto atual (ver cancelavel).
+    """
+    kwargs.setdefault("cancelamento", cancelamento_atual())
+    return asyncio.run(executar_async(cmd, **kwargs))
@@ -0,0 +1,203 @@
+# scripts/render_cache.py
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import uuid
+import hashlib
+import threading
+from glob import glob, escape as glob_escape
+from typing import Callable, Optional
+
+from scripts.catalog import hash_arquivo
+from scripts.metricas import registrar_cache
+from scripts.utils import lock_arquivo, remover_se_livre
+
+
+# =========================
+# Configuração
+# =========================
+
+RENDER_CACHE_MAX_BYTES = int(os.getenv("RENDER_CACHE_MAX_BYTES", str(5 * 1024 ** 3)))
+# Renders sem uso há mais que isso são removidos pelo gerenciador de armazenamento (0 = sem TTL)
+RENDER_CACHE_TTL = int(os.getenv("RENDER_CACHE_TTL", str(7 * 24 * 3600)))
+
+# Quantos caracteres da chave entram no nome do arquivo de saída
+_TAMANHO_CHAVE_NOME = 16
+
+
+def chave_render(**entradas) -> str:
+    """
+    Hash (SHA-256) de todas as entradas que determinam a saída de um render:
+    ID do vídeo, hash da música, pontos de impacto, ganho, parâmetros do encoder
+    e contêiner (MP4 com faststart ou fragmentado).
+    """
+    return hashlib.sha256(json.dumps(entradas, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+# =========================
+# Cache de renders
+# =========================
+
+class RenderCache:
+    """
+    Cache endereçado por conteúdo dos vídeos renderizados em processed/.
+
+    - A chave é o hash de todas as entradas do render (ver chave_render) e vai
+      no nome do arquivo, então valores de impacto diferentes nunca se sobrescrevem.
+    - Um pedido idêntico a um já renderizado recebe o arquivo existente na hora.
+    - Renders da mesma chave são serializados por um lock (entre workers), e a
+      saída só aparece no nome final quando está completa.
+    - O total em disco é limitado por 'max_bytes' (despejo LRU; mtime é
+      atualizado a cada acerto). Contadores de acertos/falhas por processo.
+    """
+
+    def __init__(
+        self,
+        diretorio: str = "processed",
+        max_bytes: int = RENDER_CACHE_MAX_BYTES,
+        hash_musica: Callable[[str], str] = hash_arquivo
+    ):
+        self.diretorio = diretorio
+        self.max_bytes = max_bytes
+        # Hash do conteúdo da música; a API usa o do catálogo (evita reler o arquivo)
+        self.hash_musica = hash_musica
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.diretorio, exist_ok=True)
+
+    # ---------- nomes ----------
+
+    def nome_arquivo(self, chave: str, prefixo: str) -> str:
+        """Nome do arquivo de saída: '<prefixo>_<chave curta>.mp4'."""
+        return f"{prefixo}_{chave[:_TAMANHO_CHAVE_NOME]}.mp4"
+
+    def _meta_path(self, caminho: str) -> str:
+        return os.path.join(self.diretorio, f".{os.path.basename(caminho)}.json")
+
+    def _lock_path(self, chave: str) -> str:
+        return os.path.join(self.diretorio, f".render-{chave[:_TAMANHO_CHAVE_NOME]}.lock")
+
+    # ---------- consulta ----------
+
+    def contar(self, hit: bool) -> None:
+        """Registra um acerto ou falha do cache (ver estatisticas)."""
+        registrar_cache("render", hit)
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def procurar(self, chave: str) -> Optional[tuple[str, dict]]:
+        """Retorna (caminho, metadados do render) se a chave já foi renderizada."""
+        padrao = os.path.join(self.diretorio, f"*_{glob_escape(chave[:_TAMANHO_CHAVE_NOME])}.mp4")
+        for caminho in glob(padrao):
+            try:
+                os.utime(caminho)  # marca uso recente p/ LRU
+            except FileNotFoundError:
+                continue
+            try:
+                with open(self._meta_path(caminho), "r", encoding="utf-8") as f:
+                    meta = json.load(f)
+            except (FileNotFoundError, json.JSONDecodeError):
+                meta = {}
+            return caminho, meta
+        return None
+
+    # ---------- escrita ----------
+
+    def caminho_temporario(self, chave: str) -> str:
+        """Arquivo oculto para o ffmpeg escrever antes da publicação."""
+        return os.path.join(self.diretorio, f".{chave[:_TAMANHO_CHAVE_NOME]}.{uuid.uuid4().hex}.tmp.mp4")
+
+    def publicar(self, temp: str, filename: str, meta: dict) -> str:
+        """Move a saída completa para o nome final e grava os metadados do render."""
+        final = os.path.join(self.diretorio, filename)
+        with open(self._meta_path(final), "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(temp, final)
+        return final
+
+    def obter_ou_renderizar(
+        self,
+        chave: str,
+        filename: str,
+        renderizar: Callable[[str], dict]
+    ) -> tuple[str, dict, bool]:
+        """
+        Retorna (caminho, metadados, hit). Em caso de falha no cache, chama
+        renderizar(caminho_temporario) — que deve retornar os metadados do
+        render — e publica o resultado.
+        """
+        encontrado = self.procurar(chave)
+        if encontrado:
+            self.contar(True)
+            return (*encontrado, True)
+
+        with lock_arquivo(self._lock_path(chave)):
+            # Outro pedido pode ter renderizado enquanto esperávamos o lock
+            encontrado = self.procurar(chave)
+            if encontrado:
+                self.contar(True)
+                return (*encontrado, True)
+
+            self.contar(False)
+            temp = self.caminho_temporario(chave)
+            try:
+                meta = renderizar(temp)
+                final = self.publicar(temp, filename, meta)
+            finally:
+                if os.path.exists(temp):
+                    os.remove(temp)
+
+        self.despejar(manter=final)
+        return final, meta, False
+
+    # ---------- despejo ----------
+
+    def despejar(self, manter: Optional[str] = None) -> None:
+        """Remove as saídas menos usadas até o total caber em max_bytes."""
+        entradas = []
+        for arquivo in os.listdir(self.diretorio):
+            caminho = os.path.join(self.diretorio, arquivo)
+            if arquivo.startswith(".") or not arquivo.endswith(".mp4") or not os.path.isfile(caminho):
+                continue
+            try:
+                st = os.stat(caminho)
+            except FileNotFoundError:
+                continue
+            entradas.append((st.st_mtime, st.st_size, caminho))
+
+        total = sum(tamanho for _, tamanho, _ in entradas)
+        for _, tamanho, caminho in sorted(entradas):
+            if total <= self.max_bytes:
+                break
+            # Não remove o que está sendo entregue a um cliente
+            if caminho == manter or not remover_se_livre(caminho):
+                continue
+            try:
+                os.remove(self._meta_path(caminho))
+            except FileNotFoundError:
+                pass
+            total -= tamanho
+            print(f"🧹 Render removido do cache: {caminho}")
+
+    def estatisticas(self) -> dict:
+        """Acertos/falhas deste processo e uso de disco do cache."""
+        entradas = [
+            os.path.join(self.diretorio, a) for a in os.listdir(self.diretorio)
+            if not a.startswith(".") and a.endswith(".mp4")
+        ]
+        total = sum(os.path.getsize(c) for c in entradas if os.path.isfile(c))
+        with self._lock:
+            consultas = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / consultas if consultas else None,
+                "entries": len(entradas),
+                "size_bytes": total,
+                "max_bytes": self.max_bytes
+            }
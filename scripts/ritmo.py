@@ -0,0 +1,365 @@
+# scripts/ritmo.py
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Callable, Optional, Union
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from scripts.metricas import etapa, registrar_cache
+from scripts.pcm_cache import TAXA
+
+
+# =========================
+# Configuração
+# =========================
+
+# Envelopes: janela de ~21 ms a cada 10 ms (100 quadros por segundo)
+JANELA = 1024
+SALTO = TAXA // 100
+TAXA_ENVELOPE = TAXA / SALTO
+# Quadros por bloco de FFT (memória constante, qualquer duração de faixa)
+QUADROS_POR_BLOCO = 2048
+
+# Faixa de andamento procurada; o meio-termo desempata dobros/metades
+BPM_MIN = 60.0
+BPM_MAX = 200.0
+BPM_PREFERIDO = 120.0
+
+# Energia comparada antes/depois de cada batida para achar o "drop" (s)
+JANELA_IMPACTO = 4.0
+# Candidatos a impacto guardados por faixa (separados por ao menos JANELA_IMPACTO)
+MAX_CANDIDATOS = 8
+
+# Faixas mantidas em memória (o restante é lido do SQLite sob demanda)
+RHYTHM_INDEX_MAX_ENTRIES = int(os.getenv("RHYTHM_INDEX_MAX_ENTRIES", "256"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS rhythm (
+    filename    TEXT PRIMARY KEY,
+    sha256      TEXT NOT NULL,
+    duration    REAL NOT NULL,
+    tempo       REAL,
+    beats       BLOB NOT NULL,
+    impacts     BLOB NOT NULL,
+    analyzed_at REAL NOT NULL
+)
+"""
+
+
+class SemBatidas(ValueError):
+    """A faixa não tem batidas/impacto detectáveis (silêncio, curta demais)."""
+
+
+# =========================
+# Análise (NumPy)
+# =========================
+
+def envelopes(pcm: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Envelope de onsets (fluxo espectral positivo do log da magnitude) e de
+    energia (RMS) da faixa, um valor a cada SALTO amostras. O PCM (s16,
+    frames x canais ou mono) é lido em blocos, sem copiar a faixa inteira.
+    """
+    quadros = max(0, (len(pcm) - JANELA) // SALTO + 1)
+    fluxo = np.zeros(quadros, dtype=np.float32)
+    energia = np.zeros(quadros, dtype=np.float32)
+    janela = np.hanning(JANELA).astype(np.float32)
+    anterior = None
+
+    for q in range(0, quadros, QUADROS_POR_BLOCO):
+        n = min(QUADROS_POR_BLOCO, quadros - q)
+        trecho = np.asarray(pcm[q * SALTO:(q + n - 1) * SALTO + JANELA], dtype=np.float32)
+        mono = (trecho.mean(axis=1) if trecho.ndim == 2 else trecho) / 32768.0
+        janelas = sliding_window_view(mono, JANELA)[::SALTO]
+
+        energia[q:q + n] = np.sqrt(np.mean(janelas ** 2, axis=1))
+        log_mag = np.log1p(100.0 * np.abs(np.fft.rfft(janelas * janela, axis=1))).astype(np.float32)
+        diferenca = np.diff(log_mag, axis=0, prepend=log_mag[:1] if anterior is None else anterior)
+        fluxo[q:q + n] = np.maximum(diferenca, 0.0).sum(axis=1)
+        anterior = log_mag[-1:]
+
+    return fluxo, energia
+
+
+def _segundos(quadros: np.ndarray) -> np.ndarray:
+    """Instante de cada quadro: o fluxo sobe no primeiro quadro que alcança o ataque."""
+    return ((np.asarray(quadros) * SALTO + JANELA - SALTO / 2) / TAXA).astype(np.float32)
+
+
+def _periodo(onsets: np.ndarray) -> Optional[float]:
+    """Período da batida em quadros (fracionário), pela autocorrelação do envelope."""
+    n = len(onsets)
+    lag_min = int(TAXA_ENVELOPE * 60 / BPM_MAX)
+    lag_max = min(n - 2, int(np.ceil(TAXA_ENVELOPE * 60 / BPM_MIN)))
+    if lag_max <= lag_min:
+        return None
+
+    espectro = np.fft.rfft(onsets - onsets.mean(), n=2 * n)
+    auto = np.fft.irfft(np.abs(espectro) ** 2)[:n]
+    lags = np.arange(lag_min, lag_max + 1)
+    bpm = 60 * TAXA_ENVELOPE / lags
+    peso = np.exp(-0.5 * np.log2(bpm / BPM_PREFERIDO) ** 2)
+    melhor = int(lags[np.argmax(auto[lags] * peso)])
+    if auto[melhor] <= 0:
+        return None
+
+    # Interpolação parabólica em volta do pico
+    a, b, c = auto[melhor - 1], auto[melhor], auto[melhor + 1]
+    curvatura = a - 2 * b + c
+    desvio = 0.5 * (a - c) / curvatura if curvatura else 0.0
+    return melhor + float(np.clip(desvio, -0.5, 0.5))
+
+
+def _grade(onsets: np.ndarray, periodo: float) -> np.ndarray:
+    """
+    Grade de batidas (índices de quadro): a fase com mais energia de onset
+    sobre os múltiplos do período, e cada batida ajustada ao pico do envelope
+    a até 1/8 de período.
+    """
+    n = len(onsets)
+    k = np.arange(int(n / periodo) + 1)
+    fases = np.arange(int(np.ceil(periodo)))
+    indices = np.rint(fases[:, None] + k[None, :] * periodo).astype(np.int64)
+    validos = indices < n
+    pontos = np.where(validos, onsets[np.minimum(indices, n - 1)], 0.0).sum(axis=1)
+    melhor = int(np.argmax(pontos))
+    grade = indices[melhor][validos[melhor]]
+
+    raio = max(1, int(periodo / 8))
+    vizinhos = np.clip(grade[:, None] + np.arange(-raio, raio + 1)[None, :], 0, n - 1)
+    valores = onsets[vizinhos]
+    ajustada = vizinhos[np.arange(len(grade)), valores.argmax(axis=1)]
+    # Sem onset por perto (silêncio), a batida fica na grade
+    return np.unique(np.where(valores.max(axis=1) > 0, ajustada, grade))
+
+
+def _impactos(batidas: np.ndarray, energia: np.ndarray) -> np.ndarray:
+    """
+    Batidas candidatas a impacto, da melhor para a pior: maior salto de
+    energia entre os JANELA_IMPACTO segundos antes e depois da batida.
+    """
+    janela = int(JANELA_IMPACTO * TAXA_ENVELOPE)
+    acumulada = np.concatenate([[0.0], np.cumsum(energia, dtype=np.float64)])
+    inicio = np.maximum(batidas - janela, 0)
+    fim = np.minimum(batidas + janela, len(energia))
+    antes = (acumulada[batidas] - acumulada[inicio]) / np.maximum(batidas - inicio, 1)
+    depois = (acumulada[fim] - acumulada[batidas]) / np.maximum(fim - batidas, 1)
+    pontuacao = np.log((depois + 1e-4) / (antes + 1e-4))
+
+    # Ao menos 1 s de música antes e depois da batida
+    validas = (batidas >= TAXA_ENVELOPE) & (fim - batidas >= TAXA_ENVELOPE)
+    escolhidas = []
+    for i in np.argsort(-pontuacao, kind="stable"):
+        if not validas[i]:
+            continue
+        if all(abs(int(batidas[i]) - int(batidas[j])) >= janela for j in escolhidas):
+            escolhidas.append(i)
+            if len(escolhidas) == MAX_CANDIDATOS:
+                break
+    return batidas[escolhidas]
+
+
+def analisar_pcm(pcm: np.ndarray) -> dict:
+    """
+    Analisa o PCM (TAXA Hz) de uma faixa. Retorna 'duration', 'tempo' (BPM ou
+    None), 'beats' e 'impacts' (segundos, float32; impactos do melhor para o pior).
+    """
+    vazio = np.zeros(0, dtype=np.float32)
+    resultado = {"duration": len(pcm) / TAXA, "tempo": None, "beats": vazio, "impacts": vazio}
+
+    onsets, energia = envelopes(pcm)
+    if len(onsets) == 0 or onsets.max() <= 1e-6:
+        return resultado
+    # Remove a tendência (média de ~1 s) para que mudanças de volume não virem batidas
+    media = np.convolve(onsets, np.ones(int(TAXA_ENVELOPE)) / TAXA_ENVELOPE, mode="same")
+    onsets = np.maximum(onsets - media, 0.0)
+
+    periodo = _periodo(onsets)
+    if periodo is None:
+        return resultado
+    batidas = _grade(onsets, periodo)
+    resultado.update(
+        tempo=round(60 * TAXA_ENVELOPE / periodo, 2),
+        beats=_segundos(batidas),
+        impacts=_segundos(_impactos(batidas, energia))
+    )
+    return resultado
+
+
+# =========================
+# Pedido de impacto
+# =========================
+
+def interpretar_impacto(valor: Union[float, str]) -> tuple[str, Optional[float]]:
+    """
+    Interpreta 'impact_music' de um pedido:
+    - número (ou texto numérico) → ("fixo", segundos)
+    - "auto" → ("auto", None): melhor impacto detectado na faixa
+    - "beat:X" → ("beat", X): batida mais próxima de X segundos
+    Levanta ValueError para qualquer outro valor.
+    """
+    if isinstance(valor, (int, float)):
+        return "fixo", float(valor)
+    texto = str(valor).strip().lower()
+    if texto == "auto":
+        return "auto", None
+    alvo = texto[len("beat:"):] if texto.startswith("beat:") else None
+    try:
+        return ("beat", float(alvo)) if alvo is not None else ("fixo", float(texto))
+    except ValueError:
+        raise ValueError(
+            f"impact_music inválido: '{valor}'. Use segundos, \"auto\" ou \"beat:<segundos>\""
+        ) from None
+
+
+# =========================
+# Índice persistente
+# =========================
+
+class IndiceRitmo:
+    """
+    Índice de batidas e pontos de impacto de cada música, calculado uma vez
+    por faixa (no upload) a partir do PCM decodificado.
+
+    Fica em uma tabela própria do SQLite do catálogo: andamento e, como
+    float32 compactos, os instantes das batidas e dos candidatos a impacto.
+    A entrada vale enquanto o SHA-256 da música (ver MusicCatalog.hash_atual)
+    não muda; as últimas faixas consultadas ficam em memória, então resolver
+    "auto" ou "beat:X" não decodifica áudio nem lê o disco.
+
+    'carregar_pcm' recebe o caminho da música e retorna o PCM (ex.:
+    PcmCache.carregar); 'hash_musica' retorna o SHA-256 atual do arquivo.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        carregar_pcm: Callable[[str], np.ndarray],
+        hash_musica: Callable[[str], str],
+        max_entradas: int = RHYTHM_INDEX_MAX_ENTRIES
+    ):
+        self.db_path = db_path
+        self.carregar_pcm = carregar_pcm
+        self.hash_musica = hash_musica
+        self.max_entradas = max_entradas
+        self._memoria: OrderedDict[str, dict] = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        with self._conectar() as conn:
+            conn.execute(_SCHEMA)
+
+    def _conectar(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _memorizar(self, entrada: dict) -> None:
+        with self._lock:
+            self._memoria[entrada["filename"]] = entrada
+            self._memoria.move_to_end(entrada["filename"])
+            while len(self._memoria) > self.max_entradas:
+                self._memoria.popitem(last=False)
+
+    # ---------- escrita ----------
+
+    def analisar(self, musica_path: str, sha256: Optional[str] = None) -> dict:
+        """Analisa a faixa e grava (ou substitui) a entrada dela no índice."""
+        sha256 = sha256 or self.hash_musica(musica_path)
+        with etapa("beat_analysis") as medida:
+            pcm = self.carregar_pcm(musica_path)
+            medida["bytes_entrada"] = pcm.nbytes
+            analise = analisar_pcm(pcm)
+
+        entrada = {"filename": os.path.basename(musica_path), "sha256": sha256, **analise}
+        with self._conectar() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO rhythm "
+                "(filename, sha256, duration, tempo, beats, impacts, analyzed_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    entrada["filename"], sha256, entrada["duration"], entrada["tempo"],
+                    entrada["beats"].astype("<f4").tobytes(), entrada["impacts"].astype("<f4").tobytes(),
+                    time.time()
+                )
+            )
+        self._memorizar(entrada)
+        tempo = f"{entrada['tempo']:.1f} BPM" if entrada["tempo"] else "sem andamento"
+        print(f"🥁 Ritmo indexado: {musica_path} ({tempo}, {len(entrada['beats'])} batidas)")
+        return entrada
+
+    def remover(self, filename: str) -> None:
+        """Remove a entrada de uma faixa (música deletada ou reenviada)."""
+        with self._lock:
+            self._memoria.pop(filename, None)
+        with self._conectar() as conn:
+            conn.execute("DELETE FROM rhythm WHERE filename = ?", (filename,))
+
+    # ---------- leitura ----------
+
+    def obter(self, musica_path: str) -> dict:
+        """Entrada da faixa: da memória, do SQLite ou, se ausente/desatualizada, analisada agora."""
+        filename = os.path.basename(musica_path)
+        sha256 = self.hash_musica(musica_path)
+
+        with self._lock:
+            entrada = self._memoria.get(filename)
+            if entrada is not None and entrada["sha256"] == sha256:
+                self._memoria.move_to_end(filename)
+                registrar_cache("rhythm", hit=True)
+                return entrada
+
+        with self._conectar() as conn:
+            row = conn.execute("SELECT * FROM rhythm WHERE filename = ?", (filename,)).fetchone()
+        if row is None or row["sha256"] != sha256:
+            registrar_cache("rhythm", hit=False)
+            return self.analisar(musica_path, sha256)
+
+        registrar_cache("rhythm", hit=True)
+        entrada = {
+            "filename": filename,
+            "sha256": sha256,
+            "duration": row["duration"],
+            "tempo": row["tempo"],
+            "beats": np.frombuffer(row["beats"], dtype="<f4"),
+            "impacts": np.frombuffer(row["impacts"], dtype="<f4"),
+        }
+        self._memorizar(entrada)
+        return entrada
+
+    def resolver(self, musica_path: str, valor: Union[float, str]) -> float:
+        """
+        Converte 'impact_music' (ver interpretar_impacto) em segundos na música.
+        Levanta SemBatidas se a faixa não tiver impacto/batidas detectados.
+        """
+        modo, segundos = interpretar_impacto(valor)
+        if modo == "fixo":
+            return segundos
+
+        entrada = self.obter(musica_path)
+        if modo == "auto":
+            if len(entrada["impacts"]) == 0:
+                raise SemBatidas(f"Nenhum ponto de impacto detectado em {os.path.basename(musica_path)}")
+            return round(float(entrada["impacts"][0]), 3)
+
+        batidas = entrada["beats"]
+        if len(batidas) == 0:
+            raise SemBatidas(f"Nenhuma batida detectada em {os.path.basename(musica_path)}")
+        i = int(np.searchsorted(batidas, segundos))
+        vizinhas = batidas[max(0, i - 1):i + 1]
+        return round(float(vizinhas[np.argmin(np.abs(vizinhas - segundos))]), 3)
+
+
+def resolver_impacto(indice: Optional[IndiceRitmo], musica_path: str, valor: Union[float, str]) -> float:
+    """Segundos de 'impact_music'; "auto"/"beat:X" exigem o índice de ritmo."""
+    modo, segundos = interpretar_impacto(valor)
+    if modo == "fixo":
+        return segundos
+    if indice is None:
+        raise SemBatidas("impact_music automático requer o índice de ritmo")
+    return indice.resolver(musica_path, valor)
@@ -0,0 +1,286 @@
+# scripts/sessoes_ytdlp.py
+# -*- coding: utf-8 -*-
+
+import os
+import copy
+import time
+import queue
+import threading
+from contextlib import contextmanager
+from glob import glob
+from typing import Callable, Iterator, Optional
+
+import yt_dlp
+
+from scripts.processos import verificar_cancelamento
+
+
+# =========================
+# Configuração
+# =========================
+
+# Instâncias do YoutubeDL mantidas por sessão de cookies (em cada worker do uvicorn)
+YTDLP_POOL_SIZE = int(os.getenv("YTDLP_POOL_SIZE", "4"))
+# Sessões extras para o rodízio (arquivos *.netscape); vazio desliga o rodízio
+COOKIE_SESSIONS_DIR = os.getenv("COOKIE_SESSIONS_DIR", "cookies/sessions")
+# Tempo (s) que uma sessão fica no fim da fila após limite de taxa ou login exigido
+COOKIE_SESSION_COOLDOWN = int(os.getenv("COOKIE_SESSION_COOLDOWN", "300"))
+
+# Erros do yt-dlp que indicam a conta limitada (e não o vídeo indisponível)
+_SINAIS_DE_LIMITE = ("429", "too many requests", "rate-limit", "rate limit", "login required", "checkpoint_required")
+
+
+def limite_de_taxa(erro: Exception) -> bool:
+    """O erro indica que a sessão foi limitada (vale tentar com outra)?"""
+    mensagem = str(erro).lower()
+    return any(sinal in mensagem for sinal in _SINAIS_DE_LIMITE)
+
+
+def _assinatura(caminho: Optional[str]) -> Optional[tuple[int, int]]:
+    """(mtime_ns, tamanho) do arquivo de cookies, ou None se não existir."""
+    if not caminho:
+        return None
+    try:
+        st = os.stat(caminho)
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+# =========================
+# Instâncias aquecidas
+# =========================
+
+class _Instancia:
+    """
+    Um YoutubeDL de longa duração: extractors já inicializados, conexões
+    HTTP abertas e cookies carregados. Usado por uma thread por vez; os hooks
+    de cada download são trocados a cada uso.
+    """
+
+    def __init__(self, opcoes: dict, cookie_file: Optional[str]):
+        self.hook: Optional[Callable[[dict], None]] = None
+        self.assinatura = _assinatura(cookie_file)
+        params = copy.deepcopy(opcoes)
+        params.update(progress_hooks=[self._repassar], postprocessor_hooks=[self._repassar])
+        if cookie_file:
+            params["cookiefile"] = cookie_file
+        self.ydl = yt_dlp.YoutubeDL(params)
+
+    def _repassar(self, status: dict) -> None:
+        if self.hook is not None:
+            self.hook(status)
+
+    def sincronizar_cookies(self, cookie_file: Optional[str]) -> bool:
+        """Recarrega o cookie jar se o arquivo mudou desde a última carga."""
+        assinatura = _assinatura(cookie_file)
+        if assinatura == self.assinatura:
+            return False
+        self.assinatura = assinatura
+        # O jar é o mesmo objeto usado pelos handlers HTTP: as conexões continuam abertas
+        jar = self.ydl.cookiejar
+        jar.clear()
+        if assinatura is not None:
+            jar.load()
+        return True
+
+    def fechar(self) -> None:
+        # Sem salvar o jar por cima do arquivo (a fonte é /update-session)
+        self.ydl.params["cookiefile"] = None
+        self.ydl.close()
+
+
+class SessaoCookies:
+    """Uma sessão (arquivo de cookies) e suas instâncias do YoutubeDL."""
+
+    def __init__(self, cookie_file: Optional[str], opcoes: dict, tamanho: int = YTDLP_POOL_SIZE):
+        self.cookie_file = cookie_file
+        self.opcoes = opcoes
+        self.tamanho = max(1, tamanho)
+        self.espera_ate = 0.0
+        self.downloads = 0
+        self.recargas = 0
+        self._livres: queue.LifoQueue[_Instancia] = queue.LifoQueue()
+        self._criadas = 0
+        self._lock = threading.Lock()
+
+    @property
+    def instancias(self) -> int:
+        return self._criadas
+
+    def _pegar(self) -> _Instancia:
+        try:
+            # LIFO: a usada por último é a que tem conexões ainda abertas
+            return self._livres.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            criar = self._criadas < self.tamanho
+            if criar:
+                self._criadas += 1
+        if criar:
+            try:
+                return _Instancia(self.opcoes, self.cookie_file)
+            except BaseException:
+                with self._lock:
+                    self._criadas -= 1
+                raise
+        # Todas em uso: espera uma voltar, sem ignorar o cancelamento do pedido
+        while True:
+            verificar_cancelamento()
+            try:
+                return self._livres.get(timeout=0.5)
+            except queue.Empty:
+                continue
+
+    @contextmanager
+    def instancia(self) -> Iterator[_Instancia]:
+        """Empresta uma instância com os cookies em dia."""
+        inst = self._pegar()
+        try:
+            if inst.sincronizar_cookies(self.cookie_file):
+                self.recargas += 1
+                print(f"🍪 Cookies recarregados: {self.cookie_file}")
+            yield inst
+        finally:
+            inst.hook = None
+            self._livres.put(inst)
+
+    def fechar(self) -> None:
+        while True:
+            try:
+                inst = self._livres.get_nowait()
+            except queue.Empty:
+                break
+            inst.fechar()
+            with self._lock:
+                self._criadas -= 1
+
+
+# =========================
+# Pool com rodízio de sessões
+# =========================
+
+class PoolYtdlp:
+    """
+    Downloads do yt-dlp com instâncias do YoutubeDL reaproveitadas entre
+    pedidos (em vez de um YoutubeDL novo por download).
+
+    - Até 'tamanho' instâncias por sessão de cookies neste worker; cada uma
+      atende um download por vez.
+    - O cookie jar só é relido quando o arquivo muda (mtime/tamanho), ou
+      seja, quando /update-session grava uma sessão nova.
+    - Rodízio: além da sessão do pedido, os arquivos *.netscape de
+      'sessoes_dir' entram em round-robin. Uma sessão que bate em limite de
+      taxa/login vai para o fim da fila por 'cooldown' segundos e o download
+      é tentado na próxima.
+
+    'opcoes' são as opções base do YoutubeDL (sem cookies nem hooks).
+    """
+
+    def __init__(
+        self,
+        opcoes: dict,
+        tamanho: int = YTDLP_POOL_SIZE,
+        sessoes_dir: Optional[str] = COOKIE_SESSIONS_DIR,
+        cooldown: int = COOKIE_SESSION_COOLDOWN
+    ):
+        self.opcoes = opcoes
+        self.tamanho = tamanho
+        self.sessoes_dir = sessoes_dir
+        self.cooldown = cooldown
+        self._sessoes: dict[Optional[str], SessaoCookies] = {}
+        self._proxima = 0
+        self._lock = threading.Lock()
+
+    def _sessao(self, cookie_file: Optional[str]) -> SessaoCookies:
+        with self._lock:
+            sessao = self._sessoes.get(cookie_file)
+            if sessao is None:
+                sessao = self._sessoes[cookie_file] = SessaoCookies(cookie_file, self.opcoes, self.tamanho)
+            return sessao
+
+    def candidatas(self, cookie_file: Optional[str] = None) -> list[SessaoCookies]:
+        """Sessões a tentar, em ordem: round-robin, com as em espera por último."""
+        arquivos = [cookie_file] if cookie_file else []
+        if self.sessoes_dir:
+            vistos = {os.path.realpath(a) for a in arquivos}
+            for arquivo in sorted(glob(os.path.join(self.sessoes_dir, "*.netscape"))):
+                if os.path.realpath(arquivo) not in vistos:
+                    arquivos.append(arquivo)
+        sessoes = [self._sessao(a) for a in arquivos or [None]]
+
+        with self._lock:
+            inicio = self._proxima % len(sessoes)
+            self._proxima += 1
+        ordem = sessoes[inicio:] + sessoes[:inicio]
+        agora = time.time()
+        return [s for s in ordem if s.espera_ate <= agora] + [s for s in ordem if s.espera_ate > agora]
+
+    def baixar(
+        self,
+        url: str,
+        outtmpl: str,
+        cookie_file: Optional[str] = None,
+        hook: Optional[Callable[[dict], None]] = None,
+        opcoes: Optional[dict] = None
+    ) -> dict:
+        """
+        Baixa a URL para 'outtmpl' e retorna o info do yt-dlp. 'hook' recebe os
+        eventos de progresso/pós-processamento (e pode interromper levantando).
+        'opcoes' substitui opções do YoutubeDL só neste download (ex.: 'format').
+        Erros de limite passam para a próxima sessão; os demais sobem.
+        """
+        ultimo_erro = None
+        for sessao in self.candidatas(cookie_file):
+            with sessao.instancia() as inst:
+                inst.hook = hook
+                params = inst.ydl.params
+                anteriores = {chave: params[chave] for chave in opcoes or {} if chave in params}
+                outtmpl_base = params["outtmpl"].get("default")
+                params.update(opcoes or {})
+                params["outtmpl"]["default"] = outtmpl
+                try:
+                    info = inst.ydl.extract_info(url, download=True)
+                except Exception as e:
+                    if not limite_de_taxa(e):
+                        raise
+                    sessao.espera_ate = time.time() + self.cooldown
+                    print(f"⏳ Sessão limitada, em espera por {self.cooldown}s: {sessao.cookie_file}")
+                    ultimo_erro = e
+                    continue
+                finally:
+                    # A instância volta ao pool com as opções base (formato e destino)
+                    for chave in opcoes or {}:
+                        params.pop(chave, None)
+                    params.update(anteriores)
+                    if outtmpl_base is None:
+                        params["outtmpl"].pop("default", None)
+                    else:
+                        params["outtmpl"]["default"] = outtmpl_base
+            sessao.downloads += 1
+            return info
+        raise ultimo_erro
+
+    def estatisticas(self) -> list[dict]:
+        """Estado de cada sessão conhecida neste worker."""
+        agora = time.time()
+        with self._lock:
+            sessoes = list(self._sessoes.values())
+        return [
+            {
+                "cookie_file": s.cookie_file,
+                "instances": s.instancias,
+                "downloads": s.downloads,
+                "cookie_reloads": s.recargas,
+                "cooling_down_for": max(0.0, round(s.espera_ate - agora, 1)),
+            }
+            for s in sessoes
+        ]
+
+    def fechar(self) -> None:
+        """Fecha as instâncias ociosas (fim do worker)."""
+        with self._lock:
+            sessoes = list(self._sessoes.values())
+        for sessao in sessoes:
+            sessao.fechar()
@@ -1,4 +1,6 @@
 import os
+import fcntl
+from contextlib import contextmanager
 from glob import glob
 
 def ultimo_video(diretorio="videos/"):
@@ -6,3 +8,58 @@ def ultimo_video(diretorio="videos/"):
     if not arquivos:
         return None
     return max(arquivos, key=os.path.getctime)
+
+@contextmanager
+def lock_arquivo(caminho, bloquear=True):
+    """
+    Lock exclusivo (flock) em um arquivo de controle, válido entre threads e
+    entre processos (ex.: vários workers do uvicorn).
+    Com bloquear=False, entrega False em vez de esperar se o lock estiver ocupado.
+    """
+    os.makedirs(os.path.dirname(caminho) or ".", exist_ok=True)
+    with open(caminho, "a") as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | (0 if bloquear else fcntl.LOCK_NB))
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+@contextmanager
+def em_uso(caminho):
+    """
+    Marca um arquivo como em uso (flock compartilhado) enquanto o bloco roda:
+    quem limpa o disco (remover_se_livre) pula arquivos marcados, em qualquer
+    processo. Arquivo inexistente não é erro.
+    """
+    try:
+        f = open(caminho, "rb")
+    except FileNotFoundError:
+        yield
+        return
+    with f:
+        fcntl.flock(f, fcntl.LOCK_SH)
+        yield
+
+def remover_se_livre(caminho):
+    """
+    Remove o arquivo só se ninguém o estiver usando (lendo via em_uso ou
+    sendo entregue ao cliente). Retorna True se removeu.
+    """
+    try:
+        f = open(caminho, "rb")
+    except FileNotFoundError:
+        return False
+    with f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        try:
+            os.remove(caminho)
+        except FileNotFoundError:
+            return False
+        return True
@@ -0,0 +1,29 @@
+"""
+Fixtures e marcadores compartilhados pelos testes.
+"""
+import shutil
+import pytest
+from fastapi.testclient import TestClient
+import api.app as app_mod
+
+
+# Testes que geram/leem mídia de verdade: pulados sem ffmpeg/ffprobe no PATH
+requer_ffmpeg = pytest.mark.skipif(
+    not (shutil.which("ffmpeg") and shutil.which("ffprobe")),
+    reason="ffmpeg/ffprobe não disponíveis"
+)
+
+
+@pytest.fixture
+def client():
+    """Cria um cliente de teste da API."""
+    return TestClient(app_mod.app)
+
+
+@pytest.fixture
+def sessao_cookies(tmp_path, monkeypatch):
+    """Arquivo de sessão de cookies temporário (exigido por /processar)."""
+    sessao = tmp_path / "session.netscape"
+    sessao.write_text("# Netscape HTTP Cookie File\n")
+    monkeypatch.setattr(app_mod, "SESSION_FILE_PATH", str(sessao))
+    return str(sessao)
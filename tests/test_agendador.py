@@ -0,0 +1,81 @@
+"""
+Testes do agendador de CPU (vagas de encode entre threads e processos).
+"""
+import os
+import sys
+import time
+import threading
+import subprocess
+from scripts import edit
+from scripts.agendador import AgendadorCpu
+
+
+def test_divisao_dos_nucleos():
+    """Cada vaga recebe a sua parte dos núcleos; sem configuração, núcleos / 2 vagas."""
+    assert AgendadorCpu(slots=2, nucleos=8).threads == 4
+    padrao = AgendadorCpu(slots=0, nucleos=8)
+    assert (padrao.slots, padrao.threads) == (4, 2)
+    assert AgendadorCpu(slots=0, nucleos=1).slots == 1
+
+
+def test_limite_entre_threads(tmp_path):
+    """Nunca mais encodes simultâneos do que vagas."""
+    agendador = AgendadorCpu(slots=2, nucleos=4, diretorio=str(tmp_path))
+    ativos, pico = 0, 0
+    trava = threading.Lock()
+
+    def encode():
+        nonlocal ativos, pico
+        with agendador.reservar() as threads:
+            assert threads == 2
+            with trava:
+                ativos += 1
+                pico = max(pico, ativos)
+            time.sleep(0.05)
+            with trava:
+                ativos -= 1
+
+    threads = [threading.Thread(target=encode) for _ in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert pico == 2
+
+
+def test_limite_entre_processos(tmp_path):
+    """Uma vaga ocupada por outro processo (outro worker) faz o encode esperar."""
+    codigo = (
+        "import sys, time; sys.path.insert(0, sys.argv[2]);"
+        "from scripts.agendador import AgendadorCpu;"
+        "a = AgendadorCpu(slots=1, nucleos=1, diretorio=sys.argv[1], ativo=True)\n"
+        "with a.reservar():\n"
+        "    print('ok', flush=True); time.sleep(0.5)"
+    )
+    raiz = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    outro = subprocess.Popen([sys.executable, "-c", codigo, str(tmp_path), raiz], stdout=subprocess.PIPE, text=True)
+    try:
+        assert outro.stdout.readline().strip() == "ok"
+        inicio = time.perf_counter()
+        with AgendadorCpu(slots=1, nucleos=1, diretorio=str(tmp_path), ativo=True).reservar():
+            esperou = time.perf_counter() - inicio
+    finally:
+        outro.wait()
+    assert esperou >= 0.2
+
+
+def test_run_passa_threads_ao_encode(tmp_path, monkeypatch):
+    """Encodes libx264 recebem '-threads' antes da saída; outros comandos não passam pelo agendador."""
+    monkeypatch.setattr(edit, "agendador", AgendadorCpu(slots=2, nucleos=6, diretorio=str(tmp_path), ativo=True))
+    comandos = []
+
+    def executar(cmd, timeout=None, entrada=None, ao_ler_linha=None):
+        comandos.append(cmd)
+        return subprocess.CompletedProcess(cmd, 0, "", "")
+
+    monkeypatch.setattr(edit, "executar", executar)
+    edit._run(edit._cmd_video_intermediario("v.mp4", "o.mp4"), quiet=True)
+    edit._run(edit._cmd_audio_alinhado("m.mp3", 0.0, 5.0, 6.0, "a.wav"), quiet=True)
+
+    assert comandos[0][-3:] == ["-threads", "3", "o.mp4"]
+    assert "-threads" not in comandos[1]
@@ -0,0 +1,103 @@
+"""
+Testes do gerenciador de armazenamento (orçamento, TTL e arquivos em uso).
+"""
+import os
+import time
+import pytest
+from scripts.armazenamento import GerenciadorArmazenamento
+from scripts.utils import em_uso, lock_arquivo
+
+
+def _arquivo(diretorio, nome, tamanho=100, idade=0.0):
+    caminho = os.path.join(str(diretorio), nome)
+    with open(caminho, "wb") as f:
+        f.write(b"x" * tamanho)
+    mtime = time.time() - idade
+    os.utime(caminho, (mtime, mtime))
+    return caminho
+
+
+@pytest.fixture
+def gerenciador(tmp_path):
+    (tmp_path / "processed").mkdir()
+    return GerenciadorArmazenamento(
+        [{"diretorio": str(tmp_path / "processed"), "max_bytes": 250, "ttl": 3600}],
+        intervalo=0, temporarios_ttl=600, idade_minima=60, lock_path=str(tmp_path / "storage.lock")
+    )
+
+
+def test_ttl_e_lru(tmp_path, gerenciador):
+    """Expirados saem; acima do orçamento saem os usados há mais tempo; os jovens demais ficam mesmo acima."""
+    pasta = tmp_path / "processed"
+    expirado = _arquivo(pasta, "a.mp4", idade=7200)
+    antigo = _arquivo(pasta, "b.mp4", idade=300)
+    medio = _arquivo(pasta, "c.mp4", idade=200)
+    recente = _arquivo(pasta, "d.mp4", idade=30)
+    novo = _arquivo(pasta, "e.mp4", idade=1)
+    _arquivo(pasta, "f.mp4", tamanho=200, idade=1)
+
+    resultado = gerenciador.varrer()[str(pasta)]
+
+    assert resultado["removed"] == [expirado, antigo, medio]
+    assert os.path.exists(recente) and os.path.exists(novo)
+    assert resultado["bytes"] == 400
+
+
+def test_arquivo_em_uso_nao_e_removido(tmp_path, gerenciador):
+    """Arquivo sendo lido (em_uso) é preservado e relatado; sai na varredura seguinte."""
+    pasta = tmp_path / "processed"
+    lendo = _arquivo(pasta, "a.mp4", idade=7200)
+    with em_uso(lendo):
+        resultado = gerenciador.varrer()[str(pasta)]
+        assert resultado["in_use"] == [lendo]
+        assert os.path.exists(lendo)
+    gerenciador.varrer()
+    assert not os.path.exists(lendo)
+
+
+def test_temporarios_e_metadados(tmp_path, gerenciador):
+    """WAV/intermediários órfãos saem pelo TTL de temporários; metadados saem com o vídeo."""
+    pasta = tmp_path / "processed"
+    wav_orfao = _arquivo(pasta, "audio_" + "a" * 32 + ".wav", idade=1200)
+    wav_ativo = _arquivo(pasta, "audio_" + "b" * 32 + ".wav", idade=10)
+    render_orfao = _arquivo(pasta, ".chave.uuid.tmp.mp4", idade=1200)
+    video = _arquivo(pasta, "x_musica_0123456789abcdef.mp4", idade=7200)
+    meta = _arquivo(pasta, ".x_musica_0123456789abcdef.mp4.json", idade=7200)
+    trava = _arquivo(pasta, ".render-chave.lock", idade=7200)
+
+    gerenciador.varrer()
+
+    assert not any(os.path.exists(p) for p in (wav_orfao, render_orfao, video, meta))
+    assert os.path.exists(wav_ativo) and os.path.exists(trava)
+
+
+def test_uma_varredura_por_vez(tmp_path, gerenciador):
+    """Com outro worker varrendo, a varredura é pulada."""
+    with lock_arquivo(gerenciador.lock_path):
+        assert gerenciador.varrer() is None
+
+
+def test_esvaziar_e_uso(tmp_path, gerenciador):
+    """Esvaziar remove tudo menos o que está em uso; o relatório reflete o disco."""
+    pasta = tmp_path / "processed"
+    livre = _arquivo(pasta, "a.mp4", tamanho=50)
+    lendo = _arquivo(pasta, "b.mp4", tamanho=70)
+    _arquivo(pasta, "audio_" + "c" * 32 + ".wav", tamanho=30)
+
+    uso = gerenciador.uso()["directories"][str(pasta)]
+    assert (uso["bytes"], uso["files"], uso["temporary_files"]) == (150, 2, 1)
+    assert uso["usage_ratio"] == pytest.approx(0.6)
+
+    with em_uso(lendo):
+        resultado = gerenciador.esvaziar()
+    assert resultado["removed"] == [livre]
+    assert lendo in resultado["in_use"]
+
+
+def test_endpoint_storage(client):
+    """GET /storage devolve o uso por diretório e o espaço livre."""
+    response = client.get("/storage")
+    assert response.status_code == 200
+    corpo = response.json()
+    assert {"videos", "processed"} <= set(corpo["directories"])
+    assert corpo["disk"]["free"] > 0
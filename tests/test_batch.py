@@ -0,0 +1,67 @@
+"""
+Testes do render em lote (um vídeo, várias músicas/pontos de impacto).
+"""
+import os
+import subprocess
+from api.app import MAX_BATCH_VARIANTS
+from scripts import edit
+from tests.conftest import requer_ffmpeg
+
+
+def test_lote_sem_variantes(client):
+    """Lote vazio é rejeitado."""
+    response = client.post("/processar-lote", json={"url": "https://x", "variants": []})
+    assert response.status_code == 400
+
+
+def test_lote_acima_do_limite(client):
+    """Lote com mais variantes que o limite é rejeitado antes de baixar."""
+    variante = {"music": "Fala", "impact_music": 51.0, "impact_video": 10.0}
+    response = client.post(
+        "/processar-lote",
+        json={"url": "https://x", "variants": [variante] * (MAX_BATCH_VARIANTS + 1)}
+    )
+    assert response.status_code == 400
+    assert "máximo" in response.json()["detail"].lower()
+
+
+@requer_ffmpeg
+def test_renderizar_lote_encoda_video_uma_vez(tmp_path, monkeypatch):
+    """Fonte incompatível: um encode de vídeo, e cada variante só copia o stream."""
+    video = str(tmp_path / "video.mp4")
+    musica = str(tmp_path / "musica.mp3")
+    subprocess.run(
+        ["ffmpeg", "-v", "error", "-y", "-f", "lavfi",
+         "-i", "testsrc2=size=320x240:rate=30:duration=2",
+         "-c:v", "libx264", "-pix_fmt", "yuv444p", video],
+        check=True
+    )
+    subprocess.run(
+        ["ffmpeg", "-v", "error", "-y", "-f", "lavfi",
+         "-i", "sine=frequency=440:duration=6", "-c:a", "libmp3lame", musica],
+        check=True
+    )
+
+    comandos = []
+    run_original = edit._run
+
+    def run_registrando(cmd, **kwargs):
+        comandos.append(cmd)
+        return run_original(cmd, **kwargs)
+
+    monkeypatch.setattr(edit, "_run", run_registrando)
+    monkeypatch.chdir(tmp_path)
+
+    variantes = [
+        {"musica_path": musica, "music_impact": im, "segundo_video": 0.5, "output_path": str(tmp_path / f"out_{i}.mp4")}
+        for i, im in enumerate([1.0, 2.0, 3.0])
+    ]
+    lote = edit.renderizar_lote(video, variantes, max_paralelo=2)
+
+    assert lote["video_mode"] == "transcode"
+    assert all(r["ok"] for r in lote["results"])
+    assert [r["start_music"] for r in lote["results"]] == [0.5, 1.5, 2.5]
+    assert all(os.path.exists(v["output_path"]) for v in variantes)
+
+    encodes = [c for c in comandos if c[0] == "ffmpeg" and "libx264" in c]
+    assert len(encodes) == 1
@@ -0,0 +1,41 @@
+"""
+Testes da comparação do benchmark com a baseline.
+"""
+from benchmarks.run import comparar, main, medir
+
+
+def _resultado(**etapas):
+    return {"cases": {"5s_360x640": {e: {"median": v} for e, v in etapas.items()}}}
+
+
+def test_sem_regressao_dentro_da_tolerancia():
+    baseline = _resultado(mux=1.0, probe=0.02)
+    assert comparar(_resultado(mux=1.4, probe=0.02), baseline, tolerancia=0.5) == []
+
+
+def test_regressao_acima_da_tolerancia():
+    baseline = _resultado(mux=1.0)
+    regressoes = comparar(_resultado(mux=2.0), baseline, tolerancia=0.5)
+    assert len(regressoes) == 1
+    assert regressoes[0].startswith("5s_360x640/mux")
+
+
+def test_diferenca_minima_ignora_ruido():
+    """Etapas muito curtas não acusam regressão por variação de milissegundos."""
+    assert comparar(_resultado(probe=0.03), _resultado(probe=0.01), tolerancia=0.5, minimo=0.05) == []
+
+
+def test_etapas_novas_sao_ignoradas():
+    assert comparar(_resultado(mux=1.0, nova=9.0), _resultado(mux=1.0)) == []
+
+
+def test_medir():
+    chamadas = []
+    medida = medir(lambda: chamadas.append(1), repeticoes=3)
+    assert len(chamadas) == 3
+    assert medida["min"] <= medida["median"] <= medida["max"]
+
+
+def test_modo_ci_exige_baseline(tmp_path):
+    """Com --ci, a falta da baseline é erro (antes de medir), não um gate que sempre passa."""
+    assert main(["--ci", "--baseline", str(tmp_path / "baseline.json")]) == 3
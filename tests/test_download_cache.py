@@ -0,0 +1,109 @@
+"""
+Testes do cache de downloads e da coalescência de pedidos simultâneos.
+"""
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from scripts.download import DownloadCache, chave_video
+from scripts.utils import em_uso
+
+
+class BaixarFalso:
+    """Substitui o yt-dlp: grava um arquivo e conta as chamadas."""
+
+    def __init__(self, atraso=0.0, tamanho=100):
+        self.chamadas = 0
+        self.atraso = atraso
+        self.tamanho = tamanho
+        self._lock = threading.Lock()
+
+    def __call__(self, url, cookie_file_path=None, destino="videos/", nome_arquivo=None, perfil=None, ao_receber=None):
+        with self._lock:
+            self.chamadas += 1
+        time.sleep(self.atraso)
+        caminho = os.path.join(destino, f"{nome_arquivo}.mp4")
+        with open(caminho, "wb") as f:
+            f.write(b"v" * self.tamanho)
+        return caminho
+
+
+def test_chave_video_usa_id_do_extractor():
+    """URLs diferentes do mesmo reel têm a mesma chave."""
+    a = chave_video("https://www.instagram.com/reels/DKciWlhRFRE/")
+    b = chave_video("https://www.instagram.com/reel/DKciWlhRFRE/?igsh=abc")
+    assert a == b == "Instagram-DKciWlhRFRE"
+    assert chave_video("http://127.0.0.1/video.mp4").startswith("url-")
+
+
+def test_cache_reaproveita_download(tmp_path):
+    """O segundo pedido da mesma URL não baixa de novo."""
+    baixar = BaixarFalso()
+    cache = DownloadCache(destino=str(tmp_path), baixar=baixar)
+
+    url = "https://www.instagram.com/reel/DKciWlhRFRE/"
+    primeiro = cache.obter(url)
+    segundo = cache.obter(url)
+
+    assert primeiro == segundo
+    assert baixar.chamadas == 1
+
+
+def test_pedidos_simultaneos_coalescidos(tmp_path):
+    """Pedidos simultâneos da mesma URL compartilham um único download."""
+    baixar = BaixarFalso(atraso=0.2)
+    cache = DownloadCache(destino=str(tmp_path), baixar=baixar)
+
+    url = "https://www.instagram.com/reel/DKciWlhRFRE/"
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        caminhos = list(pool.map(lambda _: cache.obter(url), range(4)))
+
+    assert baixar.chamadas == 1
+    assert len(set(caminhos)) == 1
+
+
+def test_ttl_expira(tmp_path):
+    """Arquivo sem uso além do TTL é baixado novamente."""
+    baixar = BaixarFalso()
+    cache = DownloadCache(destino=str(tmp_path), ttl=60, baixar=baixar)
+
+    url = "https://www.instagram.com/reel/DKciWlhRFRE/"
+    caminho = cache.obter(url)
+    antigo = time.time() - 120
+    os.utime(caminho, (antigo, antigo))
+
+    cache.obter(url)
+    assert baixar.chamadas == 2
+
+
+def test_ttl_expirado_em_uso_nao_e_removido(tmp_path):
+    """Cópia expirada que um render ainda lê não é apagada: vale como acerto."""
+    baixar = BaixarFalso()
+    cache = DownloadCache(destino=str(tmp_path), ttl=60, baixar=baixar)
+
+    url = "https://www.instagram.com/reel/DKciWlhRFRE/"
+    caminho = cache.obter(url)
+    antigo = time.time() - 120
+    os.utime(caminho, (antigo, antigo))
+
+    with em_uso(caminho):
+        assert cache.obter(url) == caminho
+    assert os.path.exists(caminho) and baixar.chamadas == 1
+
+
+def test_orcamento_de_disco(tmp_path):
+    """Acima do orçamento, sai o vídeo usado há mais tempo."""
+    baixar = BaixarFalso(tamanho=100)
+    cache = DownloadCache(destino=str(tmp_path), max_bytes=250, baixar=baixar)
+
+    caminhos = []
+    for i, codigo in enumerate(["AAA", "BBB", "CCC"]):
+        caminho = cache.obter(f"https://www.instagram.com/reel/{codigo}/")
+        instante = time.time() - 100 + i
+        os.utime(caminho, (instante, instante))
+        caminhos.append(caminho)
+
+    cache.despejar()
+    assert not os.path.exists(caminhos[0])
+    assert os.path.exists(caminhos[1])
+    assert os.path.exists(caminhos[2])
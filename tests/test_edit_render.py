@@ -0,0 +1,172 @@
+"""
+Testes dos modos de render de adicionar_musica (single vs two_pass).
+"""
+import array
+import subprocess
+import pytest
+from scripts import edit
+from scripts.pcm_cache import PcmCache
+from tests.conftest import requer_ffmpeg
+
+
+def _pico_audio(path: str) -> float:
+    """Retorna o instante (s) da amostra de maior amplitude do áudio de um arquivo."""
+    raw = subprocess.run(
+        ["ffmpeg", "-v", "error", "-i", path, "-map", "0:a:0",
+         "-ac", "1", "-ar", "48000", "-f", "s16le", "-"],
+        capture_output=True, check=True
+    ).stdout
+    amostras = array.array("h", raw)
+    indice = max(range(len(amostras)), key=lambda i: abs(amostras[i]))
+    return indice / 48000
+
+
+def test_calcular_inicio_musica_clamp():
+    """O início é music_impact - segundo_video, limitado aos extremos da música."""
+    assert edit._calcular_inicio_musica(51.0, 10.0, 180.0, 30.0) == 41.0
+    assert edit._calcular_inicio_musica(5.0, 10.0, 180.0, 30.0) == 0.0
+    assert edit._calcular_inicio_musica(175.0, 1.0, 180.0, 30.0) == 150.0
+
+
+def test_modos_usam_mesmo_corte():
+    """O filtro do modo single corta exatamente o mesmo trecho que o -ss/-t do two_pass."""
+    cmd_audio = edit._cmd_audio_alinhado("m.mp3", 41.25, 12.5, 6.0, "a.wav")
+    ss = cmd_audio[cmd_audio.index("-ss") + 1]
+    t = cmd_audio[cmd_audio.index("-t") + 1]
+
+    cmd_single = edit._cmd_single_pass("v.mp4", "m.mp3", 41.25, 12.5, 6.0, "o.mp4")
+    filtro = cmd_single[cmd_single.index("-filter_complex") + 1]
+
+    assert f"atrim=start={ss}:duration={t}" in filtro
+    assert "volume=6.0dB" in filtro
+    # O passo único não gera WAV intermediário
+    assert not any(c.endswith(".wav") for c in cmd_single)
+
+
+def test_modo_invalido():
+    """Modo desconhecido é rejeitado antes de qualquer processamento."""
+    with pytest.raises(ValueError):
+        edit.adicionar_musica("v.mp4", "m.mp3", 1.0, "o.mp4", modo="xyz")
+
+
+def test_perfis_de_encode():
+    """Cada perfil define preset/CRF do vídeo e bitrate do áudio; perfil desconhecido é rejeitado."""
+    cmd = edit._cmd_single_pass("v.mp4", "m.mp3", 0.0, 5.0, 6.0, "o.mp4", perfil="preview")
+    assert cmd[cmd.index("-preset") + 1] == "ultrafast"
+    assert cmd[cmd.index("-b:a") + 1] == "128k"
+
+    cmd = edit._cmd_mux("v.mp4", "a.wav", "o.mp4", perfil="archival")
+    assert cmd[cmd.index("-preset") + 1] == "slow"
+
+    assert edit.parametros_encoder(perfil="preview") != edit.parametros_encoder(perfil="archival")
+    with pytest.raises(ValueError):
+        edit.adicionar_musica("v.mp4", "m.mp3", 1.0, "o.mp4", perfil="xyz")
+
+
+@requer_ffmpeg
+def test_modos_mesmo_alinhamento(tmp_path):
+    """Single e two_pass colocam o impacto da música no mesmo instante do vídeo."""
+    video = str(tmp_path / "video.mp4")
+    musica = str(tmp_path / "musica.mp3")
+    subprocess.run(
+        ["ffmpeg", "-v", "error", "-y", "-f", "lavfi",
+         "-i", "testsrc2=size=320x240:rate=30:duration=4",
+         "-c:v", "libx264", "-pix_fmt", "yuv420p", video],
+        check=True
+    )
+    # Música silenciosa com um clique em t=3s (o "impacto")
+    subprocess.run(
+        ["ffmpeg", "-v", "error", "-y", "-f", "lavfi",
+         "-i", "aevalsrc='if(between(t,3,3.01),0.9,0)':s=44100:d=8",
+         "-c:a", "libmp3lame", musica],
+        check=True
+    )
+
+    picos = {}
+    for modo in edit.RENDER_MODES:
+        out = str(tmp_path / f"out_{modo}.mp4")
+        edit.adicionar_musica(video, musica, 1.0, out, music_impact=3.0, debug=False, modo=modo)
+        picos[modo] = _pico_audio(out)
+
+    # Single lendo a música do cache PCM (slice por offset de amostras)
+    out = str(tmp_path / "out_pcm.mp4")
+    cache = PcmCache(str(tmp_path / "pcm"))
+    resultado = edit.renderizar_musica(video, musica, 1.0, out, music_impact=3.0, debug=False, pcm_cache=cache)
+    assert resultado["audio_source"] == "pcm_cache"
+    picos["pcm_cache"] = _pico_audio(out)
+
+    assert picos["single"] == pytest.approx(1.0, abs=0.02)
+    assert picos["single"] == pytest.approx(picos["two_pass"], abs=0.005)
+    assert picos["pcm_cache"] == pytest.approx(picos["single"], abs=0.005)
+
+
+def test_video_compativel():
+    """Só H.264 yuv420p em profiles suportados vai para cópia direta."""
+    assert edit._video_compativel({"codec_name": "h264", "pix_fmt": "yuv420p", "profile": "High"})
+    assert not edit._video_compativel({"codec_name": "h264", "pix_fmt": "yuv444p", "profile": "High 4:4:4 Predictive"})
+    assert not edit._video_compativel({"codec_name": "hevc", "pix_fmt": "yuv420p", "profile": "Main"})
+    assert not edit._video_compativel({})
+
+
+@requer_ffmpeg
+@pytest.mark.parametrize("pix_fmt,esperado", [("yuv420p", "copy"), ("yuv444p", "transcode")])
+def test_video_mode_escolhido(tmp_path, pix_fmt, esperado):
+    """Fonte compatível é copiada; incompatível cai no transcode."""
+    video = str(tmp_path / "video.mp4")
+    musica = str(tmp_path / "musica.mp3")
+    subprocess.run(
+        ["ffmpeg", "-v", "error", "-y", "-f", "lavfi",
+         "-i", "testsrc2=size=320x240:rate=30:duration=2",
+         "-c:v", "libx264", "-pix_fmt", pix_fmt, video],
+        check=True
+    )
+    subprocess.run(
+        ["ffmpeg", "-v", "error", "-y", "-f", "lavfi",
+         "-i", "sine=frequency=440:duration=4", "-c:a", "libmp3lame", musica],
+        check=True
+    )
+
+    resultado = edit.renderizar_musica(video, musica, 0.5, str(tmp_path / "out.mp4"), music_impact=1.0, debug=False)
+    assert resultado["video_mode"] == esperado
+
+
+def test_leitor_progresso():
+    """Blocos do '-progress' viram eventos com tempo, velocidade e percentual."""
+    eventos = []
+    leitor = edit._LeitorProgresso(eventos.append, duracao_total=10.0, etapa="mux")
+    for linha in ["frame=30", "out_time_us=2500000", "speed=1.5x", "progress=continue",
+                  "out_time_ms=N/A", "speed=N/A", "progress=continue",
+                  "out_time_us=10000000", "progress=end"]:
+        leitor.linha(linha + "\n")
+
+    assert eventos[0] == {"stage": "mux", "out_time": 2.5, "speed": 1.5, "percent": 25.0, "done": False}
+    assert eventos[1]["out_time"] is None and eventos[1]["percent"] is None
+    assert eventos[2]["percent"] == 100.0 and eventos[2]["done"]
+
+
+@requer_ffmpeg
+def test_progresso_do_render(tmp_path):
+    """O render reporta o andamento do ffmpeg até 100%."""
+    video = str(tmp_path / "video.mp4")
+    musica = str(tmp_path / "musica.mp3")
+    subprocess.run(
+        ["ffmpeg", "-v", "error", "-y", "-f", "lavfi",
+         "-i", "testsrc2=size=320x240:rate=30:duration=3",
+         "-c:v", "libx264", "-pix_fmt", "yuv444p", video],
+        check=True
+    )
+    subprocess.run(
+        ["ffmpeg", "-v", "error", "-y", "-f", "lavfi",
+         "-i", "sine=frequency=440:duration=6", "-c:a", "libmp3lame", musica],
+        check=True
+    )
+
+    eventos = []
+    edit.renderizar_musica(
+        video, musica, 0.5, str(tmp_path / "out.mp4"), music_impact=1.0,
+        debug=False, modo="single", progresso=eventos.append
+    )
+    assert eventos and all(e["stage"] == "mux" for e in eventos)
+    assert eventos[-1]["done"] and eventos[-1]["percent"] == 100.0
+    percentuais = [e["percent"] for e in eventos if e["percent"] is not None]
+    assert percentuais == sorted(percentuais)
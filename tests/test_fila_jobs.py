@@ -0,0 +1,211 @@
+"""
+Testes da fila de jobs persistente (backends SQLite e arquivos, workers em vários processos).
+"""
+import time
+import sqlite3
+import threading
+import pytest
+from scripts.fila_jobs import FilaArquivos, FilaSqlite, criar_fila
+from scripts.jobs import JobManager
+from scripts.processos import verificar_cancelamento
+
+
+def _aguardar(manager, job_id, timeout=5.0):
+    """Espera o job chegar a um estado final."""
+    limite = time.time() + timeout
+    while time.time() < limite:
+        job = manager.obter(job_id)
+        if job and job["status"] in ("done", "error", "cancelled"):
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"Job {job_id} não terminou a tempo")
+
+
+def _executar(params):
+    return {"filename": f"{params['music']}.mp4"}
+
+
+@pytest.mark.parametrize("backend", ["sqlite", "files"])
+def test_backends(tmp_path, backend):
+    """Os dois backends embutidos executam o job e guardam o resultado."""
+    fila = criar_fila(backend, jobs_dir=str(tmp_path))
+    assert isinstance(fila, FilaSqlite if backend == "sqlite" else FilaArquivos)
+    manager = JobManager(_executar, max_workers=1, fila=fila)
+    job = manager.submeter({"music": "Fala"})
+    final = _aguardar(manager, job["id"])
+    manager.encerrar(wait=True)
+    assert final["status"] == "done" and final["result"] == {"filename": "Fala.mp4"}
+
+
+def test_backend_invalido():
+    with pytest.raises(ValueError, match="JOB_BACKEND"):
+        criar_fila("redis")
+
+
+def test_fila_sobrevive_a_reinicio(tmp_path):
+    """Job enfileirado por um processo sem workers é executado por outro depois."""
+    db = str(tmp_path / "jobs.sqlite3")
+    api = JobManager(_executar, fila=FilaSqlite(db), iniciar=False)
+    job = api.submeter({"music": "Fala"})
+    assert api.profundidade() == 1
+    del api
+
+    worker = JobManager(_executar, max_workers=1, fila=FilaSqlite(db))
+    final = _aguardar(worker, job["id"])
+    worker.encerrar(wait=True)
+    assert final["status"] == "done" and final["attempts"] == 1
+    assert final["worker"] == worker.worker
+
+
+def test_job_orfao_volta_para_a_fila(tmp_path):
+    """Job de um worker que parou de renovar o lease é retomado por outro (até o limite)."""
+    fila = FilaSqlite(str(tmp_path / "jobs.sqlite3"), lease=0.1, max_tentativas=2)
+    manager = JobManager(_executar, fila=fila, iniciar=False)
+    job = manager.submeter({"music": "Fala"})
+
+    assert fila.pegar("caiu-1", espera=0)["id"] == job["id"]
+    time.sleep(0.15)
+    retomado = fila.pegar("caiu-2", espera=0)
+    assert retomado["id"] == job["id"] and retomado["attempts"] == 2
+
+    time.sleep(0.15)
+    assert fila.pegar("vivo", espera=0) is None
+    final = fila.obter(job["id"])
+    assert final["status"] == "error" and "caiu-2" in final["error"]
+
+
+def test_lease_renovado_mantem_o_job(tmp_path):
+    """Enquanto o worker renova o heartbeat, o job não é retomado por outro."""
+    fila = FilaSqlite(str(tmp_path / "jobs.sqlite3"), lease=0.2)
+    liberar = threading.Event()
+
+    def executar(params):
+        liberar.wait(5)
+        return {}
+
+    manager = JobManager(executar, max_workers=1, fila=fila)
+    job = manager.submeter({"music": "Fala"})
+    time.sleep(0.5)
+    assert fila.pegar("outro", espera=0) is None
+    liberar.set()
+    assert _aguardar(manager, job["id"])["attempts"] == 1
+    manager.encerrar(wait=True)
+
+
+def test_encerrar_mantem_o_lease_do_job_em_execucao(tmp_path):
+    """Durante encerrar(wait=True) o lease segue renovado: o job em execução não roda de novo em outro worker."""
+    db = str(tmp_path / "jobs.sqlite3")
+    execucoes = []
+    comecou = threading.Event()
+
+    def executar(params):
+        execucoes.append(params["music"])
+        comecou.set()
+        time.sleep(1.0)
+        return {}
+
+    worker = JobManager(executar, max_workers=1, fila=FilaSqlite(db, lease=0.2))
+    job = worker.submeter({"music": "Fala"})
+    assert comecou.wait(5)
+    outro = JobManager(executar, max_workers=1, fila=FilaSqlite(db, lease=0.2, intervalo=0.01))
+    worker.encerrar(wait=True)
+    final = _aguardar(outro, job["id"])
+    outro.encerrar(wait=True)
+
+    assert execucoes == ["Fala"]
+    assert final["status"] == "done" and final["attempts"] == 1 and final["worker"] == worker.worker
+
+
+def test_worker_sem_lease_nao_grava(tmp_path):
+    """Quem perdeu o lease não sobrescreve o estado gravado pelo novo dono do job."""
+    fila = FilaSqlite(str(tmp_path / "jobs.sqlite3"), lease=0.1)
+    job = JobManager(_executar, fila=fila, iniciar=False).submeter({"music": "Fala"})
+    antigo = fila.pegar("antigo", espera=0)
+    time.sleep(0.15)
+    novo = fila.pegar("novo", espera=0)
+    assert novo["worker"] == "novo" and novo["attempts"] == 2
+
+    antigo.update(status="done", result={"filename": "velho.mp4"})
+    assert not fila.salvar(antigo)
+    assert fila.renovar([job["id"]], "antigo") == {job["id"]}
+    assert fila.renovar([job["id"]], "novo") == set()
+    atual = fila.obter(job["id"])
+    assert atual["worker"] == "novo" and atual["result"] is None
+    assert fila.salvar({**novo, "status": "done"})
+
+
+def test_job_assumido_por_outro_worker_e_interrompido(tmp_path):
+    """O worker que perde o job para outro interrompe o render e descarta o resultado."""
+    db = str(tmp_path / "jobs.sqlite3")
+    comecou, roubado = threading.Event(), threading.Event()
+    interrompido = []
+
+    def executar(params, progresso=None):
+        comecou.set()
+        roubado.wait(5)
+        progresso({"stage": "mux", "percent": 10.0, "done": False})
+        try:
+            while True:
+                verificar_cancelamento()
+                time.sleep(0.01)
+        except Exception as e:
+            interrompido.append(str(e))
+            raise
+
+    worker = JobManager(executar, max_workers=1, fila=FilaSqlite(db), intervalo_progresso=0)
+    job = worker.submeter({"music": "Fala"})
+    assert comecou.wait(5)
+    conn = sqlite3.connect(db)
+    conn.execute("UPDATE jobs SET worker = 'outro' WHERE id = ?", (job["id"],))
+    conn.commit()
+    conn.close()
+    roubado.set()
+    worker.encerrar(wait=True)
+
+    assert interrompido and "outro worker" in interrompido[0]
+    atual = worker.obter(job["id"])
+    assert atual["status"] == "running" and atual["progress"] is None
+
+
+def test_workers_dividem_a_fila(tmp_path):
+    """Dois workers na mesma fila: cada job é executado exatamente uma vez."""
+    db = str(tmp_path / "jobs.sqlite3")
+    execucoes = []
+
+    def executar(params):
+        execucoes.append(params["music"])
+        time.sleep(0.02)
+        return {}
+
+    api = JobManager(executar, fila=FilaSqlite(db), iniciar=False)
+    ids = [api.submeter({"music": f"m{i}"})["id"] for i in range(8)]
+    workers = [JobManager(executar, max_workers=2, fila=FilaSqlite(db, intervalo=0.01)) for _ in range(2)]
+    finais = [_aguardar(api, job_id) for job_id in ids]
+    for worker in workers:
+        worker.encerrar(wait=True)
+
+    assert sorted(execucoes) == sorted(f"m{i}" for i in range(8))
+    assert all(job["status"] == "done" for job in finais)
+
+
+def test_cancelamento_entre_processos(tmp_path):
+    """Cancelar pela API (outro processo) interrompe o job no worker que o executa."""
+    db = str(tmp_path / "jobs.sqlite3")
+    comecou = threading.Event()
+
+    def executar(params):
+        comecou.set()
+        while True:
+            verificar_cancelamento()
+            time.sleep(0.01)
+
+    worker = JobManager(executar, max_workers=1, fila=FilaSqlite(db))
+    api = JobManager(executar, fila=FilaSqlite(db), iniciar=False)
+    job = api.submeter({"music": "Fala"})
+    assert comecou.wait(5)
+
+    api.cancelar(job["id"])
+    final = _aguardar(api, job["id"])
+    worker.encerrar(wait=True)
+    assert final["status"] == "cancelled"
+    assert not worker.fila.cancelamento_pedido(job["id"])
@@ -0,0 +1,135 @@
+"""
+Testes do render durante o download (cabeçalho MP4, download em segundo plano e fallback).
+"""
+import os
+import struct
+import time
+import threading
+import pytest
+from scripts.edit import _cmd_single_pass
+from scripts.fluxo import DownloadEmSegundoPlano, mp4_transmissivel
+from scripts.pipeline import _renderizar_durante_download
+from scripts.processos import Cancelado, Cancelamento, cancelavel, verificar_cancelamento
+
+
+def _caixa(tipo, conteudo=b"", grande=False):
+    if grande:
+        return struct.pack(">I4sQ", 1, tipo, 16 + len(conteudo)) + conteudo
+    return struct.pack(">I4s", 8 + len(conteudo), tipo) + conteudo
+
+
+FTYP = _caixa(b"ftyp", b"isom\0\0\2\0isomavc1")
+MOOV = _caixa(b"moov", b"\0" * 500)
+MDAT = _caixa(b"mdat", b"\1" * 4000)
+
+
+def test_mp4_transmissivel(tmp_path):
+    """Só o 'moov' completo antes do 'mdat' permite ler o arquivo enquanto cresce."""
+    casos = {
+        "rapido.mp4": (FTYP + MOOV + MDAT, True),
+        "grande.mp4": (FTYP + _caixa(b"moov", b"\0" * 500, grande=True) + MDAT, True),
+        "moov_pela_metade.mp4": (FTYP + MOOV[:200], None),
+        "so_ftyp.mp4": (FTYP[:10], None),
+        "moov_no_fim.mp4": (FTYP + MDAT + MOOV, False),
+        "nao_mp4.webm": (b"\x1a\x45\xdf\xa3" + b"\0" * 100, False),
+    }
+    for nome, (dados, esperado) in casos.items():
+        (tmp_path / nome).write_bytes(dados)
+        assert mp4_transmissivel(str(tmp_path / nome)) is esperado, nome
+    assert mp4_transmissivel(str(tmp_path / "inexistente.mp4")) is None
+
+
+def test_cmd_le_arquivo_crescente():
+    """O vídeo parcial entra com '-follow 1' (o protocolo espera mais bytes em vez de encerrar)."""
+    cmd = _cmd_single_pass("v.mp4.part", "m.mp3", 1.0, 10.0, 6.0, "out.mp4", video_parcial=True)
+    entrada = cmd.index("-i")
+    assert cmd[entrada + 1] == "v.mp4.part"
+    assert cmd[cmd.index("-follow") + 1] == "1" and cmd.index("-follow") < entrada
+    assert "-follow" not in _cmd_single_pass("v.mp4", "m.mp3", 1.0, 10.0, 6.0, "out.mp4")
+
+
+def _download_falso(pasta, cabecalho, falhar=False):
+    """Grava o MP4 aos poucos em '.part' (como o yt-dlp) e renomeia no fim."""
+    final = os.path.join(pasta, "video.mp4")
+    parcial = final + ".part"
+
+    def baixar(ao_receber):
+        with open(parcial, "wb") as f:
+            f.write(cabecalho)
+            f.flush()
+            ao_receber({"status": "downloading", "tmpfilename": parcial})
+            for _ in range(5):
+                time.sleep(0.05)
+                f.write(b"\1" * 1000)
+                f.flush()
+        if falhar:
+            raise RuntimeError("Falha ao baixar o vídeo.")
+        os.replace(parcial, final)
+        return final, {"bytes": 5000 + len(cabecalho), "streamed": False}
+
+    return baixar
+
+
+def test_render_comeca_durante_o_download(tmp_path):
+    """Com o 'moov' no início, o render começa antes de o download terminar."""
+    renders = []
+    baixar = _download_falso(str(tmp_path), FTYP + MOOV)
+
+    def renderizar(caminho, parcial):
+        renders.append((caminho, parcial, os.path.exists(str(tmp_path / "video.mp4"))))
+        return {"video_mode": "copy"}
+
+    preparada = threading.Event()
+    caminho, download, render = _renderizar_durante_download(baixar, renderizar, preparada.set)
+
+    assert preparada.is_set()
+    assert caminho == str(tmp_path / "video.mp4")
+    assert renders == [(caminho + ".part", True, False)]
+    assert render == {"video_mode": "copy"} and download["streamed"] is True
+
+
+def test_moov_no_fim_espera_o_arquivo_completo(tmp_path):
+    """Sem índice no início, nada é renderizado durante o download (fica para o arquivo completo)."""
+    renders = []
+    baixar = _download_falso(str(tmp_path), FTYP + MDAT)
+
+    caminho, download, render = _renderizar_durante_download(
+        baixar, lambda caminho, parcial: renders.append(caminho), lambda: None
+    )
+
+    assert render is None and renders == []
+    assert os.path.exists(caminho) and download["streamed"] is False
+
+
+def test_falha_no_download_interrompe_o_render(tmp_path):
+    """O render parcial é cancelado e o erro do download é o que sobe."""
+    baixar = _download_falso(str(tmp_path), FTYP + MOOV, falhar=True)
+
+    def renderizar(caminho, parcial):
+        # Como o ffmpeg esperando bytes: só sai pelo cancelamento
+        while True:
+            verificar_cancelamento()
+            time.sleep(0.01)
+
+    with pytest.raises(RuntimeError, match="Falha ao baixar"):
+        _renderizar_durante_download(baixar, renderizar, lambda: None)
+
+
+def test_cancelamento_do_pedido(tmp_path):
+    """Pedido cancelado durante o render parcial: Cancelado sobe (sem fallback)."""
+    baixar = _download_falso(str(tmp_path), FTYP + MOOV)
+    pedido = Cancelamento()
+
+    def renderizar(caminho, parcial):
+        pedido.cancelar("cliente desconectou")
+        verificar_cancelamento()
+
+    with cancelavel(pedido), pytest.raises(Cancelado):
+        _renderizar_durante_download(baixar, renderizar, lambda: None)
+
+
+def test_download_em_segundo_plano_sem_arquivo_parcial():
+    """Download que termina sem arquivo parcial (ex.: cache) não espera cabeçalho."""
+    baixando = DownloadEmSegundoPlano(lambda ao_receber: ("videos/x.mp4", {})).iniciar()
+    assert baixando.esperar_cabecalho() is None
+    assert baixando.resultado() == ("videos/x.mp4", {})
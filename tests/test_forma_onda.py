@@ -0,0 +1,91 @@
+"""
+Testes dos picos de forma de onda (níveis de zoom, cache e endpoint).
+"""
+import os
+import numpy as np
+import pytest
+import api.app as app_mod
+from scripts.forma_onda import CacheFormaDeOnda, calcular_picos
+from scripts.pcm_cache import TAXA
+
+
+@pytest.fixture
+def pcm():
+    rng = np.random.default_rng(1)
+    # 10 s + uma sobra que não fecha um pico
+    return rng.integers(-32768, 32767, size=(10 * TAXA + 100, 2), dtype=np.int16)
+
+
+def test_picos_por_nivel(pcm):
+    """Cada pico é o mín/máx (em 8 bits) da sua janela; níveis grossos agrupam os finos."""
+    fino, grosso = calcular_picos(pcm, (256, 1024))
+
+    assert len(fino) == -(-len(pcm) // 256)
+    janela = pcm[256 * 7:256 * 8]
+    assert tuple(fino[7]) == (janela.min() >> 8, janela.max() >> 8)
+    ultima = pcm[256 * (len(fino) - 1):]
+    assert tuple(fino[-1]) == (ultima.min() >> 8, ultima.max() >> 8)
+
+    assert len(grosso) == -(-len(fino) // 4)
+    assert tuple(grosso[3]) == (fino[12:16, 0].min(), fino[12:16, 1].max())
+
+
+def test_cache_e_trecho(tmp_path, pcm):
+    """Gera uma vez; o trecho vem do nível mais grosso com ao menos 'largura' picos."""
+    musica = tmp_path / "Fala.mp3"
+    musica.write_bytes(b"mp3")
+    carregamentos = []
+
+    def carregar(caminho):
+        carregamentos.append(caminho)
+        return pcm
+
+    cache = CacheFormaDeOnda(carregar, cache_dir=str(tmp_path / "waveform"), niveis=(256, 1024, 4096))
+
+    trecho = cache.trecho(str(musica), 0, None, largura=100)
+    assert trecho["samples_per_peak"] == 4096
+    assert trecho["peaks"] == len(trecho["data"]) // 2 == -(-len(pcm) // 4096)
+
+    trecho = cache.trecho(str(musica), 2.0, 3.0, largura=100)
+    assert trecho["samples_per_peak"] == 256
+    assert trecho["start"] <= 2.0 and trecho["end"] >= 3.0
+    esperado = calcular_picos(pcm, (256,))[0][int(2.0 * TAXA // 256):]
+    assert trecho["data"] == esperado[:trecho["peaks"]].tobytes()
+    assert len(carregamentos) == 1
+
+    # Fonte alterada: gera de novo
+    os.utime(musica, ns=(0, 1))
+    assert cache.trecho(str(musica))["version"] != trecho["version"]
+    assert len(carregamentos) == 2
+
+
+def test_endpoint_forma_onda(client, tmp_path, monkeypatch, pcm):
+    """Binário com metadados nos cabeçalhos, ETag/304, JSON e validação do intervalo."""
+    cache = CacheFormaDeOnda(lambda _: pcm, cache_dir=str(tmp_path), niveis=(256, 1024, 4096))
+    monkeypatch.setattr(app_mod, "forma_onda", cache)
+    arquivo = os.path.join("music", "_teste_onda.mp3")
+    with open(arquivo, "wb") as f:
+        f.write(b"\0")
+    try:
+        r = client.get("/music/_teste_onda/waveform", params={"start": 1, "end": 5, "width": 200})
+        assert r.status_code == 200
+        assert r.headers["content-type"] == "application/octet-stream"
+        # 4 s a 1024 amostras/pico dariam menos de 200 picos
+        assert r.headers["x-waveform-samples-per-peak"] == "256"
+        assert len(r.content) == 2 * int(r.headers["x-waveform-peaks"])
+        assert "max-age" in r.headers["cache-control"]
+
+        r304 = client.get(
+            "/music/_teste_onda/waveform", params={"start": 1, "end": 5, "width": 200},
+            headers={"If-None-Match": r.headers["etag"]}
+        )
+        assert r304.status_code == 304
+
+        corpo = client.get("/music/_teste_onda/waveform", params={"format": "json", "width": 50}).json()
+        assert len(corpo["data"]) == 2 * corpo["peaks"]
+        assert corpo["samples_per_peak"] == 4096
+
+        assert client.get("/music/_teste_onda/waveform", params={"start": 3, "end": 2}).status_code == 400
+    finally:
+        os.remove(arquivo)
+    assert client.get("/music/_teste_onda/waveform").status_code == 404
@@ -0,0 +1,112 @@
+"""
+Testes dos perfis de download (formato pedido ao yt-dlp) e do relatório por pedido.
+"""
+import os
+import threading
+import pytest
+import yt_dlp
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import scripts.download as download_mod
+from scripts.download import OPCOES_YTDLP, DownloadCache, baixar_reel, opcoes_formato, relatar_download, sufixo_formato
+from scripts.sessoes_ytdlp import PoolYtdlp
+
+
+def _formato(format_id, altura, vcodec, acodec, tbr, ext):
+    largura = altura * 9 // 16 if altura else None
+    return {
+        "format_id": format_id, "url": f"http://127.0.0.1/{format_id}", "protocol": "https",
+        "width": largura, "height": altura, "vcodec": vcodec, "acodec": acodec, "tbr": tbr, "ext": ext
+    }
+
+
+FORMATOS = [
+    _formato("v2160-avc", 3840, "avc1.640033", "none", 15000, "mp4"),
+    _formato("v1080-avc", 1920, "avc1.640028", "none", 5000, "mp4"),
+    _formato("v1080-vp9", 1920, "vp09.00.40.08", "none", 4000, "webm"),
+    _formato("v720-avc", 1280, "avc1.4d401f", "none", 2000, "mp4"),
+    _formato("v720-vp9", 1280, "vp9", "none", 1500, "webm"),
+    _formato("audio", None, "none", "mp4a.40.2", 128, "m4a"),
+    _formato("combinado", 1920, "avc1.640028", "mp4a.40.2", 5200, "mp4"),
+]
+
+
+def _escolhido(opcoes):
+    """format_id que o seletor do yt-dlp escolhe entre FORMATOS com essas opções."""
+    info = {"id": "x", "title": "x", "formats": [dict(f) for f in FORMATOS],
+            "extractor": "teste", "extractor_key": "Teste", "webpage_url": "http://127.0.0.1/x"}
+    with yt_dlp.YoutubeDL({"quiet": True, **opcoes}) as ydl:
+        return ydl.process_ie_result(info, download=False)["format_id"]
+
+
+def test_formato_por_perfil():
+    """Só vídeo, dentro dos limites do perfil, H.264/MP4 antes de outros codecs."""
+    assert _escolhido(opcoes_formato("preview")) == "v720-avc"
+    assert _escolhido(opcoes_formato("standard")) == "v1080-avc"
+    assert _escolhido(opcoes_formato("archival")) == "v2160-avc"
+    # Antes: o melhor vídeo e o melhor áudio, com merge
+    assert _escolhido(OPCOES_YTDLP) == "v2160-avc+audio"
+
+
+def test_perfil_com_audio(monkeypatch):
+    """Perfis com 'audio' voltam a baixar o áudio (com merge); perfis desconhecidos usam o standard."""
+    monkeypatch.setitem(download_mod.PERFIS_DOWNLOAD, "com_audio", {"max_res": 720, "max_kbps": None, "audio": True})
+    assert _escolhido(opcoes_formato("com_audio")) == "v720-avc+audio"
+    assert sufixo_formato("com_audio") == "v720-a"
+    assert opcoes_formato("inexistente") == opcoes_formato("standard")
+    assert sufixo_formato("standard") == "v1080-8000k"
+
+
+class _Servidor(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        dados = b"\0" * 8192
+        self.send_response(200)
+        self.send_header("Content-Type", "video/mp4")
+        self.send_header("Content-Length", str(len(dados)))
+        self.end_headers()
+        self.wfile.write(dados)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def url():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _Servidor)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_port}/video.mp4"
+    httpd.shutdown()
+
+
+def test_relatorio_do_download(tmp_path, url):
+    """Bytes recebidos e formato vão para o relatório; a instância volta com as opções base."""
+    pool = PoolYtdlp(OPCOES_YTDLP, tamanho=1, sessoes_dir=None)
+
+    with relatar_download() as relatorio:
+        caminho = baixar_reel(url, destino=str(tmp_path), nome_arquivo="a", pool=pool, perfil="preview")
+
+    assert os.path.getsize(caminho) == 8192
+    assert relatorio["bytes"] == 8192
+    assert relatorio["merge_seconds"] == 0.0
+    assert relatorio["format"] and not relatorio["cached"]
+    with pool.candidatas()[0].instancia() as inst:
+        assert inst.ydl.params["format"] == OPCOES_YTDLP["format"]
+        assert "format_sort" not in inst.ydl.params
+    pool.fechar()
+
+
+def test_cache_separa_formatos(tmp_path, url):
+    """O cache de downloads guarda uma entrada por formato e marca os acertos no relatório."""
+    pool = PoolYtdlp(OPCOES_YTDLP, tamanho=1, sessoes_dir=None)
+    cache = DownloadCache(destino=str(tmp_path), baixar=lambda *a, **kw: baixar_reel(*a, pool=pool, **kw))
+
+    preview = cache.obter(url, perfil="preview")
+    standard = cache.obter(url, perfil="standard")
+    with relatar_download() as relatorio:
+        assert cache.obter(url, perfil="preview") == preview
+
+    assert preview != standard
+    assert os.path.basename(preview).startswith(f"{download_mod.chave_video(url)}__v720")
+    assert relatorio["cached"] and relatorio["bytes"] == 0
+    pool.fechar()
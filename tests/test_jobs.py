@@ -0,0 +1,177 @@
+"""
+Testes da fila de jobs de render.
+"""
+import json
+import time
+import threading
+import pytest
+from fastapi.testclient import TestClient
+from api import streaming
+from scripts.jobs import JobManager
+
+
+def _aguardar(manager, job_id, timeout=5.0):
+    """Espera o job sair de queued/running."""
+    limite = time.time() + timeout
+    while time.time() < limite:
+        job = manager.obter(job_id)
+        if job and job["status"] in ("done", "error"):
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"Job {job_id} não terminou a tempo")
+
+
+@pytest.fixture
+def manager(tmp_path):
+    """JobManager com pipeline falso e diretório isolado."""
+    def executar(params):
+        if params.get("falhar"):
+            raise RuntimeError("falha simulada")
+        return {"filename": f"{params['music']}.mp4"}
+
+    m = JobManager(executar, max_workers=2, jobs_dir=str(tmp_path))
+    yield m
+    m.encerrar(wait=True)
+
+
+def test_job_concluido(manager):
+    """Job bem-sucedido termina em 'done' com o resultado do pipeline."""
+    job = manager.submeter({"music": "Fala"})
+    assert job["status"] == "queued"
+
+    final = _aguardar(manager, job["id"])
+    assert final["status"] == "done"
+    assert final["result"] == {"filename": "Fala.mp4"}
+    assert final["error"] is None
+    assert final["finished_at"] >= final["started_at"]
+    assert manager.profundidade() == 0
+
+
+def test_job_com_erro(manager):
+    """Exceção no pipeline deixa o job em 'error' com a mensagem."""
+    job = manager.submeter({"music": "Fala", "falhar": True})
+
+    final = _aguardar(manager, job["id"])
+    assert final["status"] == "error"
+    assert "falha simulada" in final["error"]
+
+
+def test_job_inexistente(manager):
+    """IDs desconhecidos ou malformados retornam None."""
+    assert manager.obter("0" * 32) is None
+    assert manager.obter("../etc/passwd") is None
+
+
+def test_status_job_nao_encontrado(client):
+    """GET /jobs/{id} de job inexistente retorna 404."""
+    response = client.get("/jobs/" + "0" * 32)
+
+    assert response.status_code == 404
+    assert "não encontrado" in response.json()["detail"].lower()
+
+
+def test_job_com_progresso(tmp_path):
+    """Executor que aceita 'progresso' tem o último evento gravado no job."""
+    def executar(params, progresso=None):
+        for percent in (10.0, 50.0, 100.0):
+            progresso({"stage": "mux", "out_time": None, "speed": None, "percent": percent, "done": percent == 100.0})
+        return {"filename": "x.mp4"}
+
+    m = JobManager(executar, max_workers=1, jobs_dir=str(tmp_path), intervalo_progresso=60)
+    try:
+        final = _aguardar(m, m.submeter({})["id"])
+    finally:
+        m.encerrar(wait=True)
+    assert final["progress"]["percent"] == 100.0
+    assert final["progress"]["done"] and final["progress"]["updated_at"] > 0
+
+
+def _ler_eventos(texto):
+    """Converte o corpo SSE em lista de (evento, dados)."""
+    eventos = []
+    for bloco in texto.split("\n\n"):
+        campos = dict(l.split(": ", 1) for l in bloco.splitlines() if l.startswith(("event:", "data:")))
+        if "event" in campos:
+            eventos.append((campos["event"], json.loads(campos["data"])))
+    return eventos
+
+
+def test_eventos_sse(client, tmp_path, monkeypatch):
+    """GET /jobs/{id}/events transmite status, progresso e o resultado final."""
+    import api.app as app_mod
+
+    liberar = threading.Event()
+
+    def executar(params, progresso=None):
+        progresso({"stage": "mux", "out_time": 1.0, "speed": 2.0, "percent": 50.0, "done": False})
+        liberar.wait(5)
+        return {"filename": "x.mp4"}
+
+    m = JobManager(executar, max_workers=1, jobs_dir=str(tmp_path), intervalo_progresso=0)
+    monkeypatch.setattr(app_mod, "jobs", m)
+    monkeypatch.setattr(streaming, "SSE_POLL_INTERVAL", 0.01)
+    try:
+        job = m.submeter({})
+        threading.Timer(0.3, liberar.set).start()
+        response = client.get(f"/jobs/{job['id']}/events")
+    finally:
+        liberar.set()
+        m.encerrar(wait=True)
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    eventos = _ler_eventos(response.text)
+    nomes = [nome for nome, _ in eventos]
+    assert "progress" in nomes and nomes[-1] == "done"
+    assert dict(eventos)["progress"]["percent"] == 50.0
+    assert eventos[-1][1]["result"] == {"filename": "x.mp4"}
+    assert client.get("/jobs/" + "0" * 32 + "/events").status_code == 404
+
+
+def test_eventos_sse_job_parado(client, tmp_path, monkeypatch):
+    """Job em execução sem progresso além do limite gera o evento 'stalled'."""
+    import api.app as app_mod
+
+    liberar = threading.Event()
+
+    def executar(params, progresso=None):
+        liberar.wait(5)
+        return {}
+
+    m = JobManager(executar, max_workers=1, jobs_dir=str(tmp_path))
+    monkeypatch.setattr(app_mod, "jobs", m)
+    monkeypatch.setattr(streaming, "SSE_POLL_INTERVAL", 0.01)
+    monkeypatch.setattr(streaming, "JOB_STALL_SECONDS", 0.1)
+    try:
+        job = m.submeter({})
+        threading.Timer(0.5, liberar.set).start()
+        response = client.get(f"/jobs/{job['id']}/events")
+    finally:
+        liberar.set()
+        m.encerrar(wait=True)
+
+    nomes = [nome for nome, _ in _ler_eventos(response.text)]
+    assert nomes.count("stalled") == 1
+    assert nomes[-1] == "done"
+
+
+def test_lifespan_inicia_e_drena_os_jobs(tmp_path, monkeypatch):
+    """Os workers locais só sobem com o app; no shutdown, o job em execução termina antes de sair."""
+    import api.app as app_mod
+
+    comecou = threading.Event()
+
+    def executar(params):
+        comecou.set()
+        time.sleep(0.3)
+        return {"filename": "x.mp4"}
+
+    m = JobManager(executar, max_workers=1, jobs_dir=str(tmp_path), iniciar=False)
+    monkeypatch.setattr(app_mod, "jobs", m)
+    monkeypatch.setattr(app_mod, "JOB_LOCAL_WORKERS", True)
+    job = m.submeter({})
+    assert not comecou.wait(0.2)
+
+    with TestClient(app_mod.app):
+        assert comecou.wait(5)
+    assert m.obter(job["id"])["status"] == "done"
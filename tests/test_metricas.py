@@ -0,0 +1,107 @@
+"""
+Testes da instrumentação por etapa e do endpoint /metrics.
+"""
+import threading
+import pytest
+from scripts import edit, processos
+from scripts.metricas import (
+    Registro, etapa, coletar_tempos, ETAPA_SEGUNDOS, ETAPA_TOTAL,
+    SUBPROCESSO_BYTES_ENTRADA, SUBPROCESSO_BYTES_SAIDA, SUBPROCESSO_TOTAL
+)
+from scripts.processos import Cancelado, Cancelamento, TempoEsgotado
+
+
+def test_exportacao_formato_prometheus():
+    """Contador, medidor e histograma no formato texto de exposição."""
+    registro = Registro()
+    contador = registro.contador("x_total", "Total", ("tipo",))
+    registro.medidor("y", "Calculado", funcao=lambda: 3)
+    hist = registro.histograma("z_seconds", "Duração", buckets=(0.1, 1.0))
+
+    contador.inc(tipo='a"b')
+    contador.inc(2, tipo='a"b')
+    hist.observe(0.05)
+    hist.observe(0.5)
+
+    texto = registro.exportar()
+    assert "# TYPE x_total counter" in texto
+    assert 'x_total{tipo="a\\"b"} 3' in texto
+    assert "y 3" in texto
+    assert 'z_seconds_bucket{le="0.1"} 1' in texto
+    assert 'z_seconds_bucket{le="1"} 2' in texto
+    assert 'z_seconds_bucket{le="+Inf"} 2' in texto
+    assert "z_seconds_count 2" in texto
+
+
+def test_labels_obrigatorios():
+    registro = Registro()
+    contador = registro.contador("w_total", "Total", ("stage",))
+    with pytest.raises(ValueError):
+        contador.inc(outro="x")
+
+
+def test_etapa_registra_duracao_status_e_tempos():
+    """A etapa entra no histograma, no contador por status e nos tempos do pedido."""
+    antes_ok = ETAPA_TOTAL.valor(stage="teste", status="ok")
+    antes_erro = ETAPA_TOTAL.valor(stage="teste", status="error")
+
+    with coletar_tempos() as tempos:
+        with etapa("teste") as medida:
+            medida["bytes_saida"] = 10
+        with pytest.raises(RuntimeError):
+            with etapa("teste"):
+                raise RuntimeError("falhou")
+
+    assert ETAPA_TOTAL.valor(stage="teste", status="ok") == antes_ok + 1
+    assert ETAPA_TOTAL.valor(stage="teste", status="error") == antes_erro + 1
+    assert ETAPA_SEGUNDOS.contagem(stage="teste") >= 2
+    assert "teste" in tempos
+
+
+def test_run_registra_subprocesso():
+    """Cada subprocesso de _run conta por programa e código de saída."""
+    antes = SUBPROCESSO_TOTAL.valor(program="true", exit_code=0)
+    edit._run(["true"], quiet=True)
+    assert SUBPROCESSO_TOTAL.valor(program="true", exit_code=0) == antes + 1
+
+    with pytest.raises(RuntimeError):
+        edit._run(["false"], quiet=True)
+    assert SUBPROCESSO_TOTAL.valor(program="false", exit_code=1) >= 1
+
+
+def test_subprocessos_interrompidos_tambem_contam():
+    """Timeout, cancelamento e falha ao iniciar entram nas métricas com o desfecho no lugar do código."""
+    def contagem(programa, desfecho):
+        return SUBPROCESSO_TOTAL.valor(program=programa, exit_code=desfecho)
+
+    antes = {d: contagem("sleep", d) for d in ("timeout", "cancelled")}
+    with pytest.raises(TempoEsgotado):
+        processos.executar(["sleep", "5"], timeout=0.1)
+    assert contagem("sleep", "timeout") == antes["timeout"] + 1
+
+    cancelamento = Cancelamento()
+    threading.Timer(0.1, cancelamento.cancelar).start()
+    with pytest.raises(Cancelado):
+        processos.executar(["sleep", "5"], cancelamento=cancelamento)
+    assert contagem("sleep", "cancelled") == antes["cancelled"] + 1
+
+    antes_spawn = contagem("nao-existe", "spawn_error")
+    with pytest.raises(FileNotFoundError):
+        processos.executar(["/caminho/nao-existe"])
+    assert contagem("nao-existe", "spawn_error") == antes_spawn + 1
+
+
+def test_stdin_e_stdout_contados_no_executor():
+    antes_in = SUBPROCESSO_BYTES_ENTRADA.valor(program="cat")
+    antes_out = SUBPROCESSO_BYTES_SAIDA.valor(program="cat")
+    processos.executar(["cat"], entrada=iter([b"a" * 1000, b"b" * 24]))
+    assert SUBPROCESSO_BYTES_ENTRADA.valor(program="cat") == antes_in + 1024
+    assert SUBPROCESSO_BYTES_SAIDA.valor(program="cat") == antes_out + 1024
+
+
+def test_endpoint_metrics(client):
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert "# TYPE clip_stage_duration_seconds histogram" in response.text
+    assert "clip_jobs_in_flight 0" in response.text
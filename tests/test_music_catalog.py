@@ -0,0 +1,95 @@
+"""
+Testes do catálogo persistente de músicas.
+"""
+import os
+import pytest
+from scripts.catalog import MusicCatalog, hash_arquivo
+
+
+@pytest.fixture
+def probes():
+    """Registra os arquivos passados ao probe falso."""
+    return []
+
+
+@pytest.fixture
+def catalogo(tmp_path, probes):
+    """Catálogo em diretório isolado com probe falso (duração = tamanho / 10)."""
+    def probe(caminho):
+        probes.append(os.path.basename(caminho))
+        return {"duration": os.path.getsize(caminho) / 10, "codec": "mp3", "format": "mp3"}
+
+    return MusicCatalog(str(tmp_path), probe=probe)
+
+
+def _criar(catalogo, nome, conteudo):
+    caminho = os.path.join(catalogo.music_dir, nome)
+    with open(caminho, "wb") as f:
+        f.write(conteudo)
+    return caminho
+
+
+def test_sincronizar_so_faz_probe_do_que_mudou(catalogo, probes):
+    """Arquivos já indexados e inalterados não passam de novo pelo probe."""
+    _criar(catalogo, "a.mp3", b"a" * 100)
+    _criar(catalogo, "b.mp3", b"b" * 200)
+    _criar(catalogo, "notas.txt", b"ignorado")
+
+    catalogo.sincronizar()
+    assert sorted(probes) == ["a.mp3", "b.mp3"]
+
+    probes.clear()
+    catalogo.sincronizar()
+    assert probes == []
+
+    # Alteração de conteúdo/tamanho invalida só a entrada afetada
+    caminho = _criar(catalogo, "a.mp3", b"a" * 300)
+    catalogo.sincronizar()
+    assert probes == ["a.mp3"]
+    entrada = catalogo.obter("a.mp3")
+    assert entrada["duration"] == 30.0
+    assert entrada["sha256"] == hash_arquivo(caminho)
+
+
+def test_sincronizar_remove_arquivos_apagados(catalogo):
+    """Arquivos apagados por fora da API saem do índice."""
+    caminho = _criar(catalogo, "a.mp3", b"a" * 100)
+    catalogo.sincronizar()
+    os.remove(caminho)
+
+    catalogo.sincronizar()
+    assert catalogo.obter("a.mp3") is None
+
+
+def test_registrar_reaproveita_info(catalogo, probes):
+    """Com 'info' informado (validação do upload), o probe não é repetido."""
+    caminho = _criar(catalogo, "a.mp3", b"a" * 100)
+    catalogo.registrar(caminho, info={"duration": 1.5, "codec": "mp3", "format": "mp3"})
+
+    assert probes == []
+    assert catalogo.obter("a.mp3")["duration"] == 1.5
+
+
+def test_listar_paginacao_ordenacao_prefixo(catalogo):
+    """Listagem pagina, ordena e filtra por prefixo do nome."""
+    for nome, tamanho in [("Fala.mp3", 300), ("falando.mp3", 100), ("Outra.mp3", 200)]:
+        _criar(catalogo, nome, b"x" * tamanho)
+    catalogo.sincronizar()
+
+    itens, total = catalogo.listar(sort="size_bytes", order="desc")
+    assert total == 3
+    assert [i["name"] for i in itens] == ["Fala", "Outra", "falando"]
+
+    itens, total = catalogo.listar(sort="size_bytes", offset=1, limit=1)
+    assert total == 3
+    assert [i["name"] for i in itens] == ["Outra"]
+
+    itens, total = catalogo.listar(prefix="fal")
+    assert total == 2
+    assert {i["name"] for i in itens} == {"Fala", "falando"}
+
+
+def test_listar_ordenacao_invalida(catalogo):
+    """Ordenação fora da lista permitida é rejeitada."""
+    with pytest.raises(ValueError):
+        catalogo.listar(sort="name; DROP TABLE musics")
@@ -0,0 +1,86 @@
+"""
+Testes do cache de PCM decodificado.
+"""
+import os
+import time
+import subprocess
+import numpy as np
+import scripts.pcm_cache as pcm_mod
+from scripts.pcm_cache import PcmCache, TAXA, BYTES_POR_FRAME, fatiar, blocos
+
+
+def test_fatiar_por_offset():
+    """O trecho começa no frame inicio * TAXA e tem duracao * TAXA frames."""
+    pcm = np.arange(TAXA * 10 * 2, dtype=np.int16).reshape(-1, 2)
+    trecho = fatiar(pcm, 2.5, 3.0)
+
+    assert len(trecho) == 3 * TAXA
+    assert trecho[0, 0] == pcm[int(2.5 * TAXA), 0]
+    # Sem ultrapassar o fim da música
+    assert len(fatiar(pcm, 9.0, 5.0)) == TAXA
+
+
+def test_blocos_reconstroem_trecho():
+    """Os blocos enviados ao stdin, concatenados, são exatamente o trecho."""
+    pcm = np.arange(TAXA * 3 * 2, dtype=np.int16).reshape(-1, 2)
+    trecho = fatiar(pcm, 0.5, 2.0)
+
+    assert b"".join(blocos(trecho, frames_por_bloco=1000)) == trecho.tobytes()
+
+
+def _entrada_falsa(cache, nome, segundos, idade):
+    """Grava um PCM 'decodificado' diretamente no cache, com mtime no passado."""
+    caminho = os.path.join(cache.cache_dir, f"{nome}.s16le")
+    with open(caminho, "wb") as f:
+        f.write(b"\0" * int(segundos * TAXA) * BYTES_POR_FRAME)
+    instante = time.time() - idade
+    os.utime(caminho, (instante, instante))
+    return caminho
+
+
+def test_despejo_lru(tmp_path):
+    """Ao passar do limite, sai a faixa usada há mais tempo."""
+    cache = PcmCache(str(tmp_path), max_bytes=2 * TAXA * BYTES_POR_FRAME)
+    antiga = _entrada_falsa(cache, "antiga", 1, idade=300)
+    recente = _entrada_falsa(cache, "recente", 1, idade=100)
+    nova = _entrada_falsa(cache, "nova", 1, idade=0)
+
+    cache._despejar(manter=nova)
+
+    assert not os.path.exists(antiga)
+    assert os.path.exists(recente)
+    assert os.path.exists(nova)
+
+
+def test_invalidar(tmp_path):
+    """Invalidar remove o PCM e o sidecar da faixa."""
+    cache = PcmCache(str(tmp_path))
+    pcm = _entrada_falsa(cache, "Fala", 1, idade=0)
+    meta = os.path.join(str(tmp_path), "Fala.json")
+    open(meta, "w").close()
+
+    cache.invalidar("Fala")
+
+    assert not os.path.exists(pcm)
+    assert not os.path.exists(meta)
+
+
+def test_cache_desativado_nao_grava(tmp_path, monkeypatch):
+    """Com max_bytes=0, carregar() decodifica para um array transitório, sem tocar no cache_dir."""
+    musica = tmp_path / "faixa.mp3"
+    musica.write_bytes(b"\0")
+    comandos = []
+
+    def executar(cmd, timeout=None, ao_ler_bloco=None):
+        comandos.append(cmd)
+        # 3 frames + meio frame sobrando (descartado)
+        ao_ler_bloco(np.arange(6, dtype=np.int16).tobytes() + b"\1\0")
+        return subprocess.CompletedProcess(cmd, 0, "", "")
+
+    monkeypatch.setattr(pcm_mod, "executar", executar)
+    cache = PcmCache(cache_dir=str(tmp_path / "pcm"), max_bytes=0)
+    pcm = cache.carregar(str(musica))
+
+    assert comandos[0][-1] == "pipe:1"
+    assert pcm.shape == (3, 2) and pcm[2, 1] == 5
+    assert os.listdir(cache.cache_dir) == []
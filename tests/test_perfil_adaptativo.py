@@ -0,0 +1,68 @@
+"""
+Testes da escolha do perfil de encode (pedido explícito e modo adaptativo).
+"""
+import pytest
+from scripts.perfil_adaptativo import SeletorPerfil
+
+
+class Carga:
+    """Fila e CPU controladas pelo teste."""
+
+    def __init__(self):
+        self.fila = 0
+        self.cpu = 0.0
+
+
+@pytest.fixture
+def carga():
+    return Carga()
+
+
+@pytest.fixture
+def seletor(carga):
+    return SeletorPerfil(
+        profundidade=lambda: carga.fila,
+        carga=lambda: carga.cpu,
+        adaptativo=True,
+        padrao="standard",
+        sob_carga="preview",
+        fila_alta=4, fila_baixa=1,
+        carga_alta=0.9, carga_baixa=0.6
+    )
+
+
+def test_pedido_explicito_respeitado(seletor, carga):
+    """Perfil pedido vale mesmo sob carga."""
+    carga.fila = 10
+    assert seletor.escolher("archival") == {"encoder_profile": "archival", "degraded": False}
+
+
+def test_perfil_invalido(seletor):
+    with pytest.raises(ValueError):
+        seletor.escolher("ultra")
+
+
+def test_degrada_e_volta_com_histerese(seletor, carga):
+    """Entra no perfil rápido acima dos limites e só volta abaixo dos limites inferiores."""
+    assert seletor.escolher()["encoder_profile"] == "standard"
+
+    carga.fila = 4
+    assert seletor.escolher("auto") == {"encoder_profile": "preview", "degraded": True}
+
+    # Entre os limites: continua degradado
+    carga.fila = 2
+    assert seletor.escolher()["encoder_profile"] == "preview"
+
+    carga.fila = 1
+    carga.cpu = 0.95
+    assert seletor.escolher()["encoder_profile"] == "preview"
+
+    carga.cpu = 0.5
+    assert seletor.escolher() == {"encoder_profile": "standard", "degraded": False}
+
+
+def test_sem_modo_adaptativo(carga):
+    """Com o modo adaptativo desligado, a carga não muda o perfil."""
+    seletor = SeletorPerfil(profundidade=lambda: carga.fila, carga=lambda: carga.cpu, adaptativo=False)
+    carga.fila = 100
+    assert seletor.escolher()["degraded"] is False
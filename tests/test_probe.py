@@ -0,0 +1,138 @@
+"""
+Testes da camada de probe (ffprobe único, com cache).
+"""
+import os
+import subprocess
+import pytest
+from scripts import probe
+from tests.conftest import requer_ffmpeg
+
+
+SAIDA_FFPROBE = {
+    "format": {"duration": "4.000000", "format_name": "mov,mp4,m4a,3gp,3g2,mj2", "bit_rate": "512000"},
+    "streams": [
+        {"index": 0, "codec_type": "video", "codec_name": "h264", "profile": "High", "pix_fmt": "yuv420p",
+         "width": 720, "height": 1280, "avg_frame_rate": "30000/1001", "r_frame_rate": "30000/1001"},
+        {"index": 1, "codec_type": "audio", "codec_name": "aac", "sample_rate": "44100", "channels": 2},
+    ],
+    "packets": [
+        {"stream_index": 0, "pts_time": "0.000000", "flags": "K__"},
+        {"stream_index": 1, "pts_time": "0.000000", "flags": "K__"},
+        {"stream_index": 0, "pts_time": "0.033367", "flags": "___"},
+        {"stream_index": 0, "pts_time": "2.002000", "flags": "K__"},
+        {"stream_index": 0, "pts_time": "4.004000", "flags": "K__"},
+    ],
+}
+
+
+@pytest.fixture
+def cache_isolado(monkeypatch):
+    """Cache de probe vazio e só em memória para cada teste."""
+    cache = probe.ProbeCache(max_entradas=2, caminho_db="")
+    monkeypatch.setattr(probe, "_cache", cache)
+    return cache
+
+
+@pytest.fixture
+def ffprobe_falso(monkeypatch):
+    """Substitui a chamada ao ffprobe e conta as execuções."""
+    chamadas = []
+
+    def executar(path, timeout):
+        chamadas.append(path)
+        return SAIDA_FFPROBE
+
+    monkeypatch.setattr(probe, "_executar_ffprobe", executar)
+    return chamadas
+
+
+def test_normalizar():
+    """Formato, vídeo (fps, keyframes) e áudio saem de uma única resposta."""
+    info = probe._normalizar(SAIDA_FFPROBE)
+    assert info["duration"] == 4.0
+    assert info["bit_rate"] == 512000
+    assert info["video"]["codec_name"] == "h264"
+    assert info["video"]["width"] == 720 and info["video"]["height"] == 1280
+    assert info["video"]["fps"] == pytest.approx(29.97, abs=0.01)
+    assert info["video"]["keyframe_interval"] == pytest.approx(2.002)
+    assert info["audio"] == {"codec_name": "aac", "sample_rate": 44100, "channels": 2}
+
+
+def test_normalizar_somente_audio():
+    """Arquivo sem vídeo tem 'video' None."""
+    info = probe._normalizar({"format": {"duration": "3.5"}, "streams": [{"index": 0, "codec_type": "audio"}]})
+    assert info["video"] is None
+    assert info["duration"] == 3.5
+
+
+def test_probe_repetido_sai_do_cache(tmp_path, cache_isolado, ffprobe_falso):
+    """O mesmo arquivo inalterado é analisado uma única vez."""
+    arquivo = tmp_path / "a.mp4"
+    arquivo.write_bytes(b"x")
+
+    primeiro = probe.sondar(str(arquivo))
+    primeiro["duration"] = 0  # cópia: alterar o retorno não afeta o cache
+    segundo = probe.sondar(str(arquivo))
+
+    assert len(ffprobe_falso) == 1
+    assert segundo["duration"] == 4.0
+    assert cache_isolado.hits == 1
+
+
+def test_arquivo_alterado_invalida(tmp_path, cache_isolado, ffprobe_falso):
+    """Mudança de tamanho/mtime gera nova chave e novo probe."""
+    arquivo = tmp_path / "a.mp4"
+    arquivo.write_bytes(b"x")
+    probe.sondar(str(arquivo))
+    arquivo.write_bytes(b"xy")
+    probe.sondar(str(arquivo))
+    assert len(ffprobe_falso) == 2
+
+
+def test_cache_limitado(tmp_path, cache_isolado, ffprobe_falso):
+    """Acima do limite, sai a entrada usada há mais tempo."""
+    arquivos = []
+    for nome in ("a", "b", "c"):
+        arquivo = tmp_path / f"{nome}.mp4"
+        arquivo.write_bytes(nome.encode())
+        arquivos.append(str(arquivo))
+        probe.sondar(str(arquivo))
+
+    assert len(cache_isolado._memoria) == 2
+    probe.sondar(arquivos[0])
+    assert len(ffprobe_falso) == 4
+
+
+def test_cache_persistido(tmp_path, monkeypatch, ffprobe_falso):
+    """Com SQLite, outro processo (nova instância) reaproveita o resultado."""
+    arquivo = tmp_path / "a.mp4"
+    arquivo.write_bytes(b"x")
+    db = str(tmp_path / "probe.sqlite3")
+
+    monkeypatch.setattr(probe, "_cache", probe.ProbeCache(caminho_db=db))
+    probe.sondar(str(arquivo))
+    monkeypatch.setattr(probe, "_cache", probe.ProbeCache(caminho_db=db))
+    info = probe.sondar(str(arquivo))
+
+    assert len(ffprobe_falso) == 1
+    assert info["video"]["codec_name"] == "h264"
+
+
+@requer_ffmpeg
+def test_sondar_arquivo_real(tmp_path, cache_isolado):
+    """Vídeo sintético: resolução, fps e intervalo de keyframes (GOP de 15 quadros)."""
+    video = str(tmp_path / "v.mp4")
+    subprocess.run(
+        ["ffmpeg", "-v", "error", "-y", "-f", "lavfi", "-i", "testsrc2=size=320x240:rate=30:duration=3",
+         "-f", "lavfi", "-i", "sine=frequency=440:duration=3",
+         "-c:v", "libx264", "-g", "15", "-keyint_min", "15", "-sc_threshold", "0",
+         "-c:a", "aac", "-ar", "48000", "-shortest", video],
+        check=True
+    )
+    info = probe.sondar(video)
+    assert info["duration"] == pytest.approx(3.0, abs=0.1)
+    assert (info["video"]["width"], info["video"]["height"]) == (320, 240)
+    assert info["video"]["fps"] == pytest.approx(30.0)
+    assert info["video"]["keyframe_interval"] == pytest.approx(0.5, abs=0.01)
+    assert info["audio"]["sample_rate"] == 48000
+    assert os.path.exists(video)
@@ -0,0 +1,107 @@
+"""
+Testes do executor de subprocessos (timeout, cancelamento e grupo de processos).
+"""
+import time
+import asyncio
+import threading
+import pytest
+from api.app import _executar_ate_desconectar
+from scripts import processos
+from scripts.jobs import JobManager
+from scripts.processos import Cancelado, Cancelamento, TempoEsgotado, cancelavel
+
+
+def _vivo(pid: int) -> bool:
+    """Processo existe e não é zumbi."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return f.read().rsplit(")", 1)[1].split()[0] not in ("Z", "X")
+    except FileNotFoundError:
+        return False
+
+
+def _shell_com_filho(pids: list):
+    """Shell que inicia um 'sleep' filho e informa o PID dele."""
+    return dict(
+        cmd=["sh", "-c", "sleep 30 & echo $!; wait"],
+        ao_ler_linha=lambda linha: pids.append(int(linha))
+    )
+
+
+def test_saida_e_entrada():
+    """stdin recebe os blocos e o stdout volta inteiro."""
+    proc = processos.executar(["cat"], entrada=iter([b"abc", b"def"]))
+    assert proc.returncode == 0
+    assert proc.stdout == "abcdef"
+
+
+def test_timeout_encerra_o_grupo():
+    """No timeout, o processo e seus filhos são encerrados."""
+    pids = []
+    inicio = time.monotonic()
+    with pytest.raises(TempoEsgotado):
+        processos.executar(timeout=0.5, **_shell_com_filho(pids))
+    assert time.monotonic() - inicio < 5
+    assert pids and not _vivo(pids[0])
+
+
+def test_cancelamento_do_contexto():
+    """Cancelamento acionado por outra thread encerra o subprocesso do pedido."""
+    cancelamento = Cancelamento()
+    threading.Timer(0.3, cancelamento.cancelar, args=("teste",)).start()
+    pids = []
+    with cancelavel(cancelamento):
+        with pytest.raises(Cancelado, match="teste"):
+            processos.executar(**_shell_com_filho(pids))
+        # Já cancelado: nem inicia o próximo
+        with pytest.raises(Cancelado):
+            processos.executar(["true"])
+    assert not _vivo(pids[0])
+
+
+def test_desconexao_do_cliente_cancela():
+    """Cliente desconectado cancela o pipeline que roda no threadpool."""
+    class RequestDesconectado:
+        async def is_disconnected(self):
+            return True
+
+    def pipeline():
+        return processos.executar(["sleep", "30"])
+
+    inicio = time.monotonic()
+    with pytest.raises(Cancelado, match="cliente desconectou"):
+        asyncio.run(_executar_ate_desconectar(RequestDesconectado(), pipeline))
+    assert time.monotonic() - inicio < 5
+
+
+def test_cancelar_job(tmp_path):
+    """DELETE de um job em execução encerra o render e o deixa em 'cancelled'."""
+    iniciou = threading.Event()
+
+    def executar(params):
+        iniciou.set()
+        processos.executar(["sleep", "30"])
+        return {}
+
+    m = JobManager(executar, max_workers=1, jobs_dir=str(tmp_path))
+    try:
+        rodando = m.submeter({})
+        na_fila = m.submeter({})
+        assert iniciou.wait(5)
+        m.cancelar(rodando["id"])
+        assert m.cancelar(na_fila["id"])["status"] == "cancelled"
+
+        # O worker pega o da fila, vê o marcador e o descarta sem executar
+        limite = time.time() + 5
+        while list(tmp_path.glob("*.cancel")) and time.time() < limite:
+            time.sleep(0.05)
+    finally:
+        m.encerrar(wait=True)
+    assert m.obter(rodando["id"])["status"] == "cancelled"
+    assert m.obter(na_fila["id"])["status"] == "cancelled"
+    assert list(tmp_path.glob("*.cancel")) == []
+
+
+def test_cancelar_job_inexistente(client):
+    response = client.delete("/jobs/" + "0" * 32)
+    assert response.status_code == 404
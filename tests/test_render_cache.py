@@ -0,0 +1,130 @@
+"""
+Testes do cache de renders (saídas endereçadas pelo hash das entradas).
+"""
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from scripts.render_cache import RenderCache, chave_render
+
+
+class RenderFalso:
+    """Substitui o ffmpeg: grava a saída e conta as chamadas."""
+
+    def __init__(self, atraso=0.0, tamanho=100):
+        self.chamadas = 0
+        self.atraso = atraso
+        self.tamanho = tamanho
+        self._lock = threading.Lock()
+
+    def __call__(self, output_path):
+        with self._lock:
+            self.chamadas += 1
+        time.sleep(self.atraso)
+        with open(output_path, "wb") as f:
+            f.write(b"r" * self.tamanho)
+        return {"video_mode": "copy"}
+
+
+def _chave(**alteracoes):
+    entradas = {
+        "video": "Instagram-DKciWlhRFRE",
+        "music_sha256": "abc",
+        "impact_music": 51.0,
+        "impact_video": 10.0,
+        "gain_db": 6.0,
+        "encoder": {"video_mode": "auto"},
+    }
+    entradas.update(alteracoes)
+    return chave_render(**entradas)
+
+
+def test_chave_depende_de_todas_as_entradas():
+    """A chave é estável e muda com qualquer entrada do render."""
+    assert _chave() == _chave()
+    assert _chave(impact_music=52.0) != _chave()
+    assert _chave(music_sha256="def") != _chave()
+    assert _chave(encoder={"video_mode": "transcode"}) != _chave()
+
+
+def test_pedido_repetido_reaproveita_saida(tmp_path):
+    """O segundo pedido idêntico devolve o mesmo arquivo sem renderizar."""
+    cache = RenderCache(str(tmp_path))
+    render = RenderFalso()
+    chave = _chave()
+    nome = cache.nome_arquivo(chave, "video_Fala")
+
+    caminho, meta, hit = cache.obter_ou_renderizar(chave, nome, render)
+    assert not hit and meta == {"video_mode": "copy"}
+    assert os.path.basename(caminho) == nome
+
+    caminho2, meta2, hit2 = cache.obter_ou_renderizar(chave, nome, render)
+    assert hit2 and caminho2 == caminho and meta2 == meta
+    assert render.chamadas == 1
+    assert cache.estatisticas()["hits"] == 1
+    assert cache.estatisticas()["misses"] == 1
+
+
+def test_impactos_diferentes_nao_se_sobrescrevem(tmp_path):
+    """Mesmo vídeo e música com outro impacto geram outro arquivo."""
+    cache = RenderCache(str(tmp_path))
+    render = RenderFalso()
+    a, b = _chave(), _chave(impact_video=12.0)
+
+    caminho_a, _, _ = cache.obter_ou_renderizar(a, cache.nome_arquivo(a, "video_Fala"), render)
+    caminho_b, _, _ = cache.obter_ou_renderizar(b, cache.nome_arquivo(b, "video_Fala"), render)
+
+    assert caminho_a != caminho_b
+    assert os.path.exists(caminho_a) and os.path.exists(caminho_b)
+
+
+def test_pedidos_simultaneos_renderizam_uma_vez(tmp_path):
+    """Pedidos simultâneos da mesma chave compartilham um único render."""
+    cache = RenderCache(str(tmp_path))
+    render = RenderFalso(atraso=0.2)
+    chave = _chave()
+    nome = cache.nome_arquivo(chave, "video_Fala")
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        resultados = list(pool.map(lambda _: cache.obter_ou_renderizar(chave, nome, render), range(4)))
+
+    assert render.chamadas == 1
+    assert len({caminho for caminho, _, _ in resultados}) == 1
+    assert sum(hit for _, _, hit in resultados) == 3
+
+
+def test_falha_no_render_nao_publica(tmp_path):
+    """Render que falha não deixa arquivo final nem temporário."""
+    cache = RenderCache(str(tmp_path))
+    chave = _chave()
+
+    def render_falha(output_path):
+        with open(output_path, "wb") as f:
+            f.write(b"parcial")
+        raise RuntimeError("ffmpeg falhou")
+
+    try:
+        cache.obter_ou_renderizar(chave, cache.nome_arquivo(chave, "video_Fala"), render_falha)
+    except RuntimeError:
+        pass
+    assert cache.procurar(chave) is None
+    assert not [a for a in os.listdir(tmp_path) if a.endswith(".mp4")]
+
+
+def test_despejo_lru(tmp_path):
+    """Acima do orçamento, sai a saída menos usada recentemente."""
+    cache = RenderCache(str(tmp_path), max_bytes=250)
+    render = RenderFalso(tamanho=100)
+    chaves = [_chave(impact_music=float(i)) for i in range(3)]
+
+    for i, chave in enumerate(chaves[:2]):
+        caminho, _, _ = cache.obter_ou_renderizar(chave, cache.nome_arquivo(chave, f"v{i}"), render)
+        os.utime(caminho, (time.time() - 100 + i, time.time() - 100 + i))
+
+    cache.procurar(chaves[0])  # uso recente da primeira
+    cache.obter_ou_renderizar(chaves[2], cache.nome_arquivo(chaves[2], "v2"), render)
+
+    assert cache.procurar(chaves[0]) is not None
+    assert cache.procurar(chaves[1]) is None
+    assert cache.procurar(chaves[2]) is not None
+    assert cache.estatisticas()["size_bytes"] <= 250
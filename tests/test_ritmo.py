@@ -0,0 +1,106 @@
+"""
+Testes do índice de ritmo (batidas, andamento e impacto automático).
+"""
+import os
+import numpy as np
+import pytest
+import api.app as app_mod
+from scripts.pcm_cache import TAXA
+from scripts.ritmo import IndiceRitmo, SemBatidas, analisar_pcm, interpretar_impacto, resolver_impacto
+
+
+def _faixa(bpm=120.0, duracao=30.0, drop=10.25, primeira=0.25):
+    """PCM estéreo com cliques a cada batida e um 'drop' (mais volume) a partir de 'drop'."""
+    rng = np.random.default_rng(0)
+    n = int(duracao * TAXA)
+    sinal = rng.normal(0, 0.01, n)
+    t = np.arange(int(0.03 * TAXA)) / TAXA
+    clique = np.sin(2 * np.pi * 1000 * t) * np.exp(-t * 120)
+    for batida in np.arange(primeira, duracao - 0.05, 60 / bpm):
+        i = int(round(batida * TAXA))
+        sinal[i:i + len(clique)] += (0.8 if batida >= drop else 0.1) * clique
+    sinal[int(drop * TAXA):] += rng.normal(0, 0.1, n - int(drop * TAXA))
+    mono = (np.clip(sinal, -1, 1) * 32767).astype(np.int16)
+    return np.stack([mono, mono], axis=1)
+
+
+@pytest.fixture(scope="module")
+def faixa():
+    return _faixa()
+
+
+def test_andamento_batidas_e_impacto(faixa):
+    """120 BPM: batidas na grade dos cliques e o impacto no drop."""
+    analise = analisar_pcm(faixa)
+
+    assert analise["tempo"] == pytest.approx(120, abs=1)
+    desvios = np.abs(analise["beats"] - (0.25 + 0.5 * np.arange(len(analise["beats"]))))
+    assert np.median(desvios) < 0.01 and desvios.max() < 0.05
+    assert analise["impacts"][0] == pytest.approx(10.25, abs=0.03)
+
+
+def test_silencio_sem_batidas():
+    analise = analisar_pcm(np.zeros((TAXA * 5, 2), dtype=np.int16))
+    assert analise["tempo"] is None
+    assert len(analise["beats"]) == 0 and len(analise["impacts"]) == 0
+
+
+def test_interpretar_impacto():
+    assert interpretar_impacto(51) == ("fixo", 51.0)
+    assert interpretar_impacto("12.5") == ("fixo", 12.5)
+    assert interpretar_impacto("AUTO") == ("auto", None)
+    assert interpretar_impacto("beat:3.1") == ("beat", 3.1)
+    with pytest.raises(ValueError):
+        interpretar_impacto("drop")
+    with pytest.raises(SemBatidas):
+        resolver_impacto(None, "music/x.mp3", "auto")
+
+
+def test_indice_persistente(tmp_path, faixa):
+    """Analisa uma vez por conteúdo; outra instância lê do SQLite sem decodificar."""
+    carregamentos = []
+    hashes = {"valor": "a"}
+
+    def carregar(caminho):
+        carregamentos.append(caminho)
+        return faixa
+
+    def novo_indice():
+        return IndiceRitmo(str(tmp_path / "catalog.sqlite3"), carregar_pcm=carregar, hash_musica=lambda _: hashes["valor"])
+
+    indice = novo_indice()
+    assert indice.resolver("music/Fala.mp3", "auto") == pytest.approx(10.25, abs=0.03)
+    assert indice.resolver("music/Fala.mp3", "beat:3.1") == pytest.approx(3.25, abs=0.02)
+    assert indice.resolver("music/Fala.mp3", 42) == 42.0
+    assert len(carregamentos) == 1
+
+    outro = novo_indice()
+    assert outro.resolver("music/Fala.mp3", "beat:0") == pytest.approx(0.25, abs=0.02)
+    assert len(carregamentos) == 1
+
+    # Conteúdo mudou (outro hash): reanalisa
+    hashes["valor"] = "b"
+    outro.obter("music/Fala.mp3")
+    assert len(carregamentos) == 2
+
+    outro.remover("Fala.mp3")
+    novo_indice().obter("music/Fala.mp3")
+    assert len(carregamentos) == 3
+
+
+def test_endpoint_ritmo(client, tmp_path, monkeypatch, faixa):
+    """GET /music/{nome}/rhythm devolve andamento, impactos e batidas."""
+    indice = IndiceRitmo(str(tmp_path / "catalog.sqlite3"), carregar_pcm=lambda _: faixa, hash_musica=lambda _: "a")
+    monkeypatch.setattr(app_mod, "indice_ritmo", indice)
+    arquivo = os.path.join("music", "_teste_ritmo.mp3")
+    with open(arquivo, "wb") as f:
+        f.write(b"\0")
+    try:
+        corpo = client.get("/music/_teste_ritmo/rhythm").json()
+    finally:
+        os.remove(arquivo)
+
+    assert corpo["tempo"] == pytest.approx(120, abs=1)
+    assert corpo["impacts"][0] == pytest.approx(10.25, abs=0.03)
+    assert corpo["beat_count"] == len(corpo["beats"])
+    assert client.get("/music/_nao_existe/rhythm").status_code == 404
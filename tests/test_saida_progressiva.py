@@ -0,0 +1,165 @@
+"""
+Testes da saída em MP4 fragmentado (return_format "stream") e do +faststart nas saídas gravadas.
+"""
+import sys
+import time
+import pytest
+import api.app as app_mod
+from scripts import edit, fluxo, processos
+
+
+def test_saidas_gravadas_com_faststart():
+    """Saídas em disco levam o 'moov' para o início; o fragmentado sai pelo stdout."""
+    single = edit._cmd_single_pass("v.mp4", "m.mp3", 0.0, 5.0, 6.0, "o.mp4")
+    mux = edit._cmd_mux("v.mp4", "a.wav", "o.mp4")
+    for cmd in (single, mux):
+        assert cmd[-1] == "o.mp4"
+        assert cmd[cmd.index("-movflags") + 1] == "+faststart"
+
+    fragmentado = edit._cmd_single_pass("v.mp4", "m.mp3", 0.0, 5.0, 6.0, "o.mp4", fragmentado=True)
+    assert fragmentado[-1] == "pipe:1" and "o.mp4" not in fragmentado
+    assert set(fragmentado[fragmentado.index("-movflags") + 1].split("+")) >= {"frag_keyframe", "empty_moov"}
+    assert fragmentado[fragmentado.index("-f") + 1] == "mp4"
+    assert "-frag_duration" in fragmentado
+
+
+def test_stdout_binario_em_blocos():
+    """Com ao_ler_bloco, o stdout chega em blocos, conforme é escrito."""
+    blocos = []
+    script = "import sys, time\nfor i in range(3):\n    sys.stdout.buffer.write(bytes([i]) * 100000); sys.stdout.flush(); time.sleep(0.05)"
+    proc = processos.executar([sys.executable, "-c", script], ao_ler_bloco=blocos.append)
+    assert proc.returncode == 0 and proc.stdout == ""
+    assert b"".join(blocos) == b"\0" * 100000 + b"\1" * 100000 + b"\2" * 100000
+    assert len(blocos) >= 3
+
+
+FRAGMENTOS = [bytes([i]) * 50000 for i in range(6)]
+
+
+def _pipeline(tmp_path, falhar_apos=None, cache_hit=False):
+    """Pipeline falso: escreve os fragmentos na saída aos poucos, como o ffmpeg."""
+    final = str(tmp_path / "final.mp4")
+    estado = {"saida": None}
+
+    def executar_pipeline(saida=None, encoder_profile=None, **kwargs):
+        estado["saida"] = saida
+        if not cache_hit:
+            saida.abrir(final)
+            try:
+                for i, fragmento in enumerate(FRAGMENTOS):
+                    if i == falhar_apos:
+                        raise RuntimeError("ffmpeg falhou")
+                    saida.escrever(fragmento)
+                    time.sleep(0.02)
+            finally:
+                saida.fechar()
+        else:
+            with open(final, "wb") as f:
+                f.write(b"".join(FRAGMENTOS))
+        return {
+            "filename": "final.mp4", "video_path": final, "video_mode": "copy",
+            "encoder_profile": encoder_profile, "cache": "hit" if cache_hit else "miss",
+            "impact_music": 1.0, "download": None
+        }
+
+    return executar_pipeline, estado
+
+
+def _pedido(**extra):
+    return {"url": "https://x/reel/1", "music": "Fala", "impact_music": 1.0, "impact_video": 0.5,
+            "return_format": "stream", **extra}
+
+
+def test_stream_entrega_durante_o_render(client, sessao_cookies, tmp_path, monkeypatch):
+    """O vídeo sai em chunked transfer (sem Content-Length) e é o mesmo arquivo gravado."""
+    executar_pipeline, estado = _pipeline(tmp_path)
+    monkeypatch.setattr(app_mod, "executar_pipeline", executar_pipeline)
+
+    response = client.post("/processar", json=_pedido())
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "video/mp4"
+    assert "content-length" not in response.headers
+    assert response.headers["x-render-cache"] == "miss"
+    assert response.content == b"".join(FRAGMENTOS)
+    with open(tmp_path / "final.mp4", "rb") as f:
+        assert f.read() == response.content
+    assert estado["saida"].concluida and estado["saida"].erro is None
+
+
+def test_stream_acerto_no_cache(client, sessao_cookies, tmp_path, monkeypatch):
+    """Sem render (acerto no cache), o arquivo pronto vai como em 'file', com tamanho e ETag."""
+    executar_pipeline, _ = _pipeline(tmp_path, cache_hit=True)
+    monkeypatch.setattr(app_mod, "executar_pipeline", executar_pipeline)
+
+    response = client.post("/processar", json=_pedido())
+
+    assert response.status_code == 200
+    assert int(response.headers["content-length"]) == len(response.content)
+    assert response.headers["x-render-cache"] == "hit" and "etag" in response.headers
+    assert response.content == b"".join(FRAGMENTOS)
+
+
+def test_stream_erro_antes_do_primeiro_byte(client, sessao_cookies, tmp_path, monkeypatch):
+    """Falha antes de qualquer fragmento ainda vira o status HTTP de sempre."""
+    def executar_pipeline(**kwargs):
+        raise FileNotFoundError("Música não encontrada: music/Fala.mp3")
+
+    monkeypatch.setattr(app_mod, "executar_pipeline", executar_pipeline)
+    response = client.post("/processar", json=_pedido())
+    assert response.status_code == 404
+
+
+def test_stream_erro_depois_do_primeiro_byte(client, sessao_cookies, tmp_path, monkeypatch):
+    """Falha no meio do render interrompe a resposta (o cliente não recebe um MP4 'completo')."""
+    executar_pipeline, estado = _pipeline(tmp_path, falhar_apos=3)
+    monkeypatch.setattr(app_mod, "executar_pipeline", executar_pipeline)
+
+    # A exceção sobe da resposta já iniciada (conforme a versão do Starlette, dentro de um ExceptionGroup)
+    with pytest.raises(Exception):
+        client.post("/processar", json=_pedido())
+    assert str(estado["saida"].erro) == "ffmpeg falhou"
+    assert estado["saida"].escritos == 3 * len(FRAGMENTOS[0])
+
+
+def test_stream_e_file_nao_dividem_a_chave_do_cache(tmp_path, monkeypatch):
+    """Um render "stream" (fragmentado) não é servido depois a um pedido "file": este recebe o MP4 com faststart."""
+    from scripts import pipeline
+    from scripts.render_cache import RenderCache
+
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "music").mkdir()
+    (tmp_path / "music" / "Fala.mp3").write_bytes(b"mp3")
+    renders = []
+
+    def renderizar_musica(output_path=None, saida=None, perfil=None, **kwargs):
+        renders.append("fragmentado" if saida is not None else "faststart")
+        if saida is not None:
+            saida.abrir(output_path)
+            saida.escrever(b"fragmentado")
+            saida.fechar()
+        else:
+            with open(output_path, "wb") as f:
+                f.write(b"faststart")
+        return {"video_mode": "copy", "encoder_profile": perfil}
+
+    monkeypatch.setattr(pipeline, "STREAM_RENDER", False)
+    monkeypatch.setattr(pipeline, "renderizar_musica", renderizar_musica)
+    monkeypatch.setattr(pipeline, "_baixar_video", lambda *a, **k: (str(tmp_path / "video.mp4"), None))
+    monkeypatch.setattr(pipeline, "_descartar_video", lambda *a: None)
+    cache = RenderCache(str(tmp_path / "processed"))
+
+    def pedir(saida=None):
+        return pipeline.executar_pipeline(
+            "https://x/reel/1", "Fala", 1.0, 0.5, render_cache=cache, saida=saida
+        )
+
+    stream = pedir(saida=fluxo.SaidaProgressiva())
+    arquivo = pedir()
+    repetido = pedir()
+
+    assert (stream["cache"], arquivo["cache"], repetido["cache"]) == ("miss", "miss", "hit")
+    assert renders == ["fragmentado", "faststart"]
+    assert arquivo["video_path"] != stream["video_path"] and repetido["video_path"] == arquivo["video_path"]
+    with open(repetido["video_path"], "rb") as f:
+        assert f.read() == b"faststart"
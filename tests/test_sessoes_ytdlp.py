@@ -0,0 +1,126 @@
+"""
+Testes do pool de sessões do yt-dlp contra um servidor HTTP local (sem rede).
+"""
+import os
+import threading
+import pytest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from scripts.download import OPCOES_YTDLP, baixar_reel
+from scripts.sessoes_ytdlp import PoolYtdlp
+
+
+class _Servidor(BaseHTTPRequestHandler):
+    """Serve um 'vídeo' direto; sessões com cookie 'limitada' levam 429."""
+    protocol_version = "HTTP/1.1"
+    pedidos = []
+
+    def do_GET(self):
+        cookie = self.headers.get("Cookie") or ""
+        self.pedidos.append({"cookie": cookie, "porta": self.client_address[1]})
+        if "limitada" in cookie:
+            self.send_response(429)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        dados = b"\0" * 4096
+        self.send_response(200)
+        self.send_header("Content-Type", "video/mp4")
+        self.send_header("Content-Length", str(len(dados)))
+        self.end_headers()
+        self.wfile.write(dados)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def servidor():
+    _Servidor.pedidos = []
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _Servidor)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_port}/video.mp4", _Servidor.pedidos
+    httpd.shutdown()
+
+
+def _cookies(caminho, valor, mtime_ns=None):
+    with open(caminho, "w") as f:
+        f.write(f"# Netscape HTTP Cookie File\n127.0.0.1\tFALSE\t/\tFALSE\t0\tsessionid\t{valor}\n")
+    if mtime_ns is not None:
+        os.utime(caminho, ns=(mtime_ns, mtime_ns))
+    return str(caminho)
+
+
+def test_instancia_reaproveitada(tmp_path, servidor):
+    """Downloads seguidos usam o mesmo YoutubeDL, com os cookies e a conexão reaproveitados."""
+    url, pedidos = servidor
+    cookies = _cookies(tmp_path / "session.netscape", "um")
+    pool = PoolYtdlp(OPCOES_YTDLP, tamanho=2, sessoes_dir=None)
+
+    primeiro = baixar_reel(url, cookie_file_path=cookies, destino=str(tmp_path), nome_arquivo="a", pool=pool)
+    segundo = baixar_reel(url, cookie_file_path=cookies, destino=str(tmp_path), nome_arquivo="b", pool=pool)
+
+    assert os.path.basename(primeiro) == "a.mp4" and os.path.basename(segundo) == "b.mp4"
+    assert pool.estatisticas() == [{
+        "cookie_file": cookies, "instances": 1, "downloads": 2, "cookie_reloads": 0, "cooling_down_for": 0.0
+    }]
+    assert all(p["cookie"] == "sessionid=um" for p in pedidos)
+    assert len({p["porta"] for p in pedidos}) < len(pedidos)
+    pool.fechar()
+
+
+def test_cookies_recarregados_quando_o_arquivo_muda(tmp_path, servidor):
+    """Só um arquivo novo (como o gravado por /update-session) faz o jar ser relido."""
+    url, pedidos = servidor
+    cookies = _cookies(tmp_path / "session.netscape", "um", mtime_ns=10 ** 18)
+    pool = PoolYtdlp(OPCOES_YTDLP, tamanho=1, sessoes_dir=None)
+
+    baixar_reel(url, cookie_file_path=cookies, destino=str(tmp_path), nome_arquivo="a", pool=pool)
+    _cookies(tmp_path / "session.netscape", "dois", mtime_ns=2 * 10 ** 18)
+    baixar_reel(url, cookie_file_path=cookies, destino=str(tmp_path), nome_arquivo="b", pool=pool)
+    baixar_reel(url, cookie_file_path=cookies, destino=str(tmp_path), nome_arquivo="c", pool=pool)
+
+    assert pedidos[0]["cookie"] == "sessionid=um"
+    assert pedidos[-1]["cookie"] == "sessionid=dois"
+    assert pool.estatisticas()[0]["cookie_reloads"] == 1
+    pool.fechar()
+    # Fechar o pool não regrava o arquivo de cookies
+    assert "dois" in open(cookies).read()
+
+
+def test_rodizio_de_sessoes(tmp_path, servidor):
+    """Sessão limitada (429) vai para o fim da fila e o download segue com outra."""
+    url, pedidos = servidor
+    sessoes = tmp_path / "sessions"
+    sessoes.mkdir()
+    limitada = _cookies(sessoes / "a.netscape", "limitada")
+    livre = _cookies(sessoes / "b.netscape", "livre")
+    pool = PoolYtdlp(OPCOES_YTDLP, tamanho=1, sessoes_dir=str(sessoes), cooldown=60)
+
+    caminho = baixar_reel(url, destino=str(tmp_path), nome_arquivo="a", pool=pool)
+
+    assert caminho and os.path.exists(caminho)
+    assert any("limitada" in p["cookie"] for p in pedidos)
+    assert pedidos[-1]["cookie"] == "sessionid=livre"
+    estado = {s["cookie_file"]: s for s in pool.estatisticas()}
+    assert estado[limitada]["cooling_down_for"] > 0
+    assert estado[livre]["downloads"] == 1
+    # Enquanto isso, a limitada é sempre a última candidata
+    assert [s.cookie_file for s in pool.candidatas()] == [livre, limitada]
+    pool.fechar()
+
+
+def test_download_com_falha_restaura_a_instancia(tmp_path, servidor):
+    """Um download que falha devolve a instância ao pool com o destino e o formato originais."""
+    url, _ = servidor
+    pool = PoolYtdlp(OPCOES_YTDLP, tamanho=1, sessoes_dir=None)
+    with pool.candidatas()[0].instancia() as inst:
+        base = (inst.ydl.params["outtmpl"].get("default"), inst.ydl.params.get("format"))
+
+    def falhar(status):
+        raise RuntimeError("falha no meio do download")
+
+    with pytest.raises(Exception):
+        pool.baixar(url, str(tmp_path / "a.%(ext)s"), hook=falhar, opcoes={"format": "worst"})
+    with pool.candidatas()[0].instancia() as inst:
+        assert (inst.ydl.params["outtmpl"].get("default"), inst.ydl.params.get("format")) == base
+    pool.fechar()
@@ -0,0 +1,85 @@
+"""
+Testes das respostas em streaming (base64 e arquivo com Range/ETag).
+"""
+import os
+import json
+import base64
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from api.streaming import resposta_base64, CHUNK_SIZE
+
+
+CONTEUDO = bytes(range(256)) * 5000  # ~1.2MB, vários blocos
+
+
+@pytest.fixture
+def video(tmp_path, monkeypatch):
+    """Vídeo 'processado' em um diretório de trabalho isolado."""
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("processed")
+    with open(os.path.join("processed", "saida.mp4"), "wb") as f:
+        f.write(CONTEUDO)
+    return os.path.join("processed", "saida.mp4")
+
+
+def test_base64_em_streaming(video):
+    """O envelope gerado em blocos é um JSON válido com o arquivo inteiro."""
+    mini = FastAPI()
+
+    @mini.get("/b64")
+    def b64():
+        return resposta_base64(video, {"ok": True, "filename": "saida.mp4"})
+
+    response = TestClient(mini).get("/b64")
+    assert len(CONTEUDO) > CHUNK_SIZE
+    assert int(response.headers["content-length"]) == len(response.content)
+    data = json.loads(response.content)
+    assert data["ok"] is True
+    assert data["filename"] == "saida.mp4"
+    assert base64.b64decode(data["video_base64"]) == CONTEUDO
+
+
+def test_arquivo_completo_com_etag(client, video):
+    """Download completo traz ETag; revalidação com If-None-Match retorna 304."""
+    response = client.get("/videos/saida.mp4")
+    assert response.status_code == 200
+    assert response.content == CONTEUDO
+    assert response.headers["accept-ranges"] == "bytes"
+
+    etag = response.headers["etag"]
+    response = client.get("/videos/saida.mp4", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+
+
+@pytest.mark.parametrize("cabecalho,inicio,fim", [
+    ("bytes=0-99", 0, 99),
+    ("bytes=1000-", 1000, len(CONTEUDO) - 1),
+    ("bytes=-500", len(CONTEUDO) - 500, len(CONTEUDO) - 1),
+])
+def test_arquivo_range(client, video, cabecalho, inicio, fim):
+    """Range de intervalo único retorna 206 com o trecho pedido."""
+    response = client.get("/videos/saida.mp4", headers={"Range": cabecalho})
+    assert response.status_code == 206
+    assert response.content == CONTEUDO[inicio:fim + 1]
+    assert response.headers["content-range"] == f"bytes {inicio}-{fim}/{len(CONTEUDO)}"
+
+
+def test_arquivo_range_invalido(client, video):
+    """Intervalo fora do arquivo retorna 416."""
+    response = client.get("/videos/saida.mp4", headers={"Range": f"bytes={len(CONTEUDO) + 10}-"})
+    assert response.status_code == 416
+    assert response.headers["content-range"] == f"bytes */{len(CONTEUDO)}"
+
+
+def test_arquivo_if_range_desatualizado(client, video):
+    """If-Range com ETag antigo ignora o Range e devolve o arquivo todo."""
+    response = client.get("/videos/saida.mp4", headers={"Range": "bytes=0-9", "If-Range": '"antigo"'})
+    assert response.status_code == 200
+    assert response.content == CONTEUDO
+
+
+def test_arquivo_inexistente(client, video):
+    """Arquivos fora de processed/ ou inexistentes retornam 404."""
+    assert client.get("/videos/nao_existe.mp4").status_code == 404
+    assert client.get("/videos/..%2Fsaida.mp4").status_code == 404
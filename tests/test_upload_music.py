@@ -7,19 +7,12 @@ import tempfile
 import shutil
 from pathlib import Path
 from fastapi.testclient import TestClient
-from api.app import app
 
 # Configuração de testes
 TEST_MUSIC_DIR = "test_music"
 TEST_PROCESSED_DIR = "test_processed"
 
 
-@pytest.fixture(scope="function")
-def client():
-    """Cria um cliente de teste."""
-    return TestClient(app)
-
-
 @pytest.fixture(scope="function")
 def setup_test_dirs():
     """Cria diretórios de teste e limpa após."""
@@ -173,6 +166,19 @@ def test_upload_music_empty_file(client):
     assert "vazio" in response.json()["detail"].lower()
 
 
+def test_upload_music_acima_do_limite(client, monkeypatch):
+    """O limite checado a cada bloco responde 413, como o do middleware."""
+    import api.app as app_mod
+    monkeypatch.setattr(app_mod, "MAX_UPLOAD_BYTES", 1000)
+
+    files = {"file": ("grande.mp3", b"x" * 5000, "audio/mpeg")}
+    response = client.post("/upload-music", files=files, params={"music_name": "_teste_limite"})
+
+    assert response.status_code == 413
+    assert "muito grande" in response.json()["detail"].lower()
+    assert not os.path.exists(os.path.join("music", "_teste_limite.mp3"))
+
+
 def test_upload_music_invalid_audio(client):
     """Testa upload de arquivo que não é áudio válido."""
     # Cria um arquivo de texto como se fosse áudio
@@ -263,3 +269,41 @@ def test_upload_music_sanitize_name(client, setup_test_dirs):
     if os.path.exists(saved_path):
         os.remove(saved_path)
 
+
+
+def _app_com_limite(max_bytes):
+    """App mínima com o limitador de upload, para não precisar de 100MB no teste."""
+    from fastapi import FastAPI, Request
+    from api.app import LimiteUploadMiddleware
+
+    mini = FastAPI()
+    mini.add_middleware(LimiteUploadMiddleware, caminho="/upload", max_bytes=max_bytes)
+
+    @mini.post("/upload")
+    async def upload(request: Request):
+        corpo = await request.body()
+        return {"recebido": len(corpo)}
+
+    return TestClient(mini)
+
+
+def test_upload_limite_content_length():
+    """Corpo acima do limite é rejeitado pelo Content-Length, antes de ser lido."""
+    client = _app_com_limite(1000)
+
+    assert client.post("/upload", content=b"x" * 500).json() == {"recebido": 500}
+    response = client.post("/upload", content=b"x" * 5000)
+    assert response.status_code == 413
+    assert "muito grande" in response.json()["detail"].lower()
+
+
+def test_upload_limite_chunked():
+    """Sem Content-Length, o envio é abortado assim que passa do limite."""
+    client = _app_com_limite(1000)
+
+    def corpo():
+        for _ in range(50):
+            yield b"x" * 100
+
+    response = client.post("/upload", content=corpo())
+    assert response.status_code == 413